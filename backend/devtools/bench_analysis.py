@@ -0,0 +1,91 @@
+"""
+compare per-section and combined conversation analysis on a real transcript.
+
+    python -m devtools.bench_analysis <conversation_id>
+
+nothing is written to the database and the result cache is bypassed.
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from oto.infra.database import create_db_session
+from oto.infra.vertexai import get_vertexai
+from oto.domain.transcript import Transcript
+from oto.services.conversation.summary import get_conversation_summary_service
+from oto.services.conversation.highlight import get_conversation_highlight_service
+from oto.services.conversation.insight import get_conversation_insight_service
+from oto.services.conversation.breakdown import get_conversation_breakdown_service
+from oto.services.conversation.combined import get_conversation_combined_service
+
+
+class Usage:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, response):
+        usage = response.usage_metadata
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_token_count
+        self.output_tokens += usage.candidates_token_count + (
+            usage.thoughts_token_count or 0
+        )
+
+
+def measure(name: str, run) -> Usage:
+    vertexai = get_vertexai()
+    usage = Usage()
+    notify_response = vertexai.notify_response
+
+    def record(response, model):
+        usage.add(response)
+        notify_response(response, model)
+
+    vertexai.notify_response = record
+    try:
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+    finally:
+        vertexai.notify_response = notify_response
+
+    print(
+        f"{name:>12}: {elapsed:7.2f}s  calls={usage.calls}  "
+        f"prompt={usage.prompt_tokens}  output={usage.output_tokens}"
+    )
+    return usage
+
+
+def main(conversation_id: str):
+    with create_db_session() as session:
+        transcript = session.get(Transcript, conversation_id)
+        if not transcript:
+            raise ValueError(f"Transcript {conversation_id} not found")
+    captions = transcript.get_captions()
+
+    def per_section():
+        calls = [
+            get_conversation_summary_service().get_summary,
+            get_conversation_highlight_service().get_highlights,
+            get_conversation_insight_service().get_insights,
+            get_conversation_breakdown_service().get_breakdown,
+        ]
+        with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+            list(executor.map(lambda call: call(captions), calls))
+
+    def combined():
+        get_conversation_combined_service().get_analysis(captions)
+
+    separate = measure("per-section", per_section)
+    single = measure("combined", combined)
+    if separate.prompt_tokens:
+        print(
+            f"prompt tokens saved: "
+            f"{1 - single.prompt_tokens / separate.prompt_tokens:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,103 @@
+"""
+micro-benchmark of clip assembly: AudioSegment `+=` loop vs SampleBuffer.
+
+    python -m devtools.bench_clip_assembly [segments] [source_minutes]
+
+uses synthetic audio, checks that timecodes and samples (without join
+fades) match the old implementation, then prints the timings.
+"""
+
+import sys
+import time
+import numpy as np
+from io import BytesIO
+from pydub import AudioSegment
+from oto.domain.clip import ClipCaption, ClipCaptions
+from oto.services.content.clip_construct import ClipConstructService
+from oto.services.content.sample_buffer import SampleBuffer
+
+
+def synthetic_source(minutes: float, frame_rate: int = 44100) -> AudioSegment:
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-8000, 8000, size=(int(minutes * 60 * frame_rate), 2))
+    return AudioSegment(
+        data=samples.astype(np.int16).tobytes(),
+        sample_width=2,
+        frame_rate=frame_rate,
+        channels=2,
+    )
+
+
+def synthetic_captions(count: int, minutes: float) -> ClipCaptions:
+    rng = np.random.default_rng(1)
+    service = ClipConstructService.__new__(ClipConstructService)
+    captions = []
+    for _ in range(count):
+        start = rng.uniform(0, minutes * 60 - 5)
+        end = start + rng.uniform(0.2, 4)
+        captions.append(
+            ClipCaption(
+                timecode_start=service.seconds_to_timecode(start),
+                timecode_end=service.seconds_to_timecode(end),
+                speaker="A",
+                caption="...",
+            )
+        )
+    return ClipCaptions(captions)
+
+
+def legacy(service: ClipConstructService, source: AudioSegment, captions):
+    """the AudioSegment loop construct_with_captions used before"""
+    captions = captions.model_copy(deep=True)
+    clip = AudioSegment.empty()
+    for caption in captions.root:
+        new_start_seconds = clip.duration_seconds
+        start_time = service.timecode_to_seconds(caption.timecode_start)
+        end_time = service.timecode_to_seconds(caption.timecode_end)
+        clip += source[start_time * 1000 : end_time * 1000]
+        new_end_seconds = clip.duration_seconds
+        caption.timecode_start = service.seconds_to_timecode(new_start_seconds)
+        caption.timecode_end = service.seconds_to_timecode(new_end_seconds)
+    bytes_io = BytesIO()
+    clip.export(bytes_io, format="wav")
+    return bytes_io.getvalue(), captions
+
+
+def timed(name: str, run, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:>28}: {best * 1000:9.1f} ms")
+    return result, best
+
+
+def main(segments: int = 500, minutes: float = 30):
+    source = synthetic_source(minutes)
+    buffer = SampleBuffer.from_segment(source)
+    captions = synthetic_captions(segments, minutes)
+
+    service = ClipConstructService.__new__(ClipConstructService)
+    print(f"{segments} segments from {minutes:g} min of 44.1kHz stereo")
+
+    (old_audio, old_captions), old_time = timed(
+        "AudioSegment +=", lambda: legacy(service, source, captions)
+    )
+
+    def assemble():
+        clip, new_captions = service.assemble(buffer, captions)
+        return clip.export("wav"), new_captions
+
+    service.JOIN_FADE_MS = 0
+    (new_audio, new_captions), new_time = timed("SampleBuffer", assemble)
+    service.JOIN_FADE_MS = ClipConstructService.JOIN_FADE_MS
+    timed(f"SampleBuffer ({service.JOIN_FADE_MS}ms fades)", assemble)
+
+    assert old_captions == new_captions, "timecodes differ"
+    assert old_audio == new_audio, "audio differs"
+    print(f"identical output, {old_time / new_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if i else int(arg) for i, arg in enumerate(sys.argv[1:])))
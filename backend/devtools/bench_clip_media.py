@@ -0,0 +1,144 @@
+"""
+cpu time per clip of the local media steps of create_clip_task, before and
+after keeping the pcm in memory between stages.
+
+    python -m devtools.bench_clip_media [source_minutes] [enhanced_format]
+
+the external services are simulated: sieve's output is the clip encoded as
+`enhanced_format` (opus by default), tts answers with mp3 (the api default the
+old code asked for) or opus (what it asks for now). encoding those outputs is
+work done by the services and is not timed. cpu time includes the ffmpeg
+subprocesses.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+from pydub import AudioSegment
+from oto.domain.clip import ClipCaptions, ClipDatas
+from oto.services.content import media
+from oto.services.content.clip_construct import ClipConstructService
+
+REPEAT = 3
+
+
+def cpu_seconds() -> float:
+    usage = [
+        resource.getrusage(resource.RUSAGE_SELF),
+        resource.getrusage(resource.RUSAGE_CHILDREN),
+    ]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def encode(seg: AudioSegment, format: str) -> bytes:
+    bytes_io = BytesIO()
+    seg.export(bytes_io, format=format)
+    return bytes_io.getvalue()
+
+
+def synthetic_source(path: str, minutes: float):
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"anoisesrc=d={minutes * 60}:a=0.05,aformat=channel_layouts=stereo",
+            "-ar",
+            "44100",
+            path,
+        ],
+        check=True,
+    )
+
+
+def clips() -> ClipDatas:
+    def timecode(seconds: int) -> str:
+        return f"00:{seconds // 60:02d}:{seconds % 60:02d}"
+
+    def captions(start: int):
+        return [
+            {
+                "timecode_start": timecode(start + 4 * i),
+                "timecode_end": timecode(start + 4 * i + 3),
+                "speaker": "A",
+                "caption": "...",
+            }
+            for i in range(12)
+        ]
+
+    return ClipDatas.model_validate(
+        [
+            {"title": "", "description": "", "comment": "", "captions": captions(s)}
+            for s in (10, 130, 300)
+        ]
+    )
+
+
+def pretty_captions(seconds: float) -> ClipCaptions:
+    """what pretty answers, clip relative and with the pauses cut out"""
+    return ClipCaptions.model_validate(
+        [
+            {
+                "timecode_start": f"00:00:{start:06.3f}",
+                "timecode_end": f"00:00:{start + 1.5:06.3f}",
+                "speaker": "A",
+                "caption": "...",
+            }
+            for start in range(0, min(int(seconds) - 2, 58), 2)
+        ]
+    )
+
+
+def legacy(service: ClipConstructService, clip_data, enhanced, tts) -> float:
+    """wav -> decode -> cut -> wav, then decode + encode both outputs"""
+    started = cpu_seconds()
+    service.construct_with_captions(BytesIO(clip_data.audio), clip_data.captions)
+    encode(AudioSegment.from_file(BytesIO(enhanced)), "opus")
+    encode(AudioSegment.from_file(BytesIO(tts)), "opus")
+    return cpu_seconds() - started
+
+
+def current(service: ClipConstructService, clip_data, enhanced, tts) -> float:
+    started = cpu_seconds()
+    clip, _ = service.assemble(clip_data.pcm, clip_data.captions)
+    clip.export("flac")
+    media.convert(enhanced, "opus")
+    media.convert(tts, "opus")
+    return cpu_seconds() - started
+
+
+def main(minutes: float = 10, enhanced_format: str = "opus"):
+    service = ClipConstructService.__new__(ClipConstructService)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp3")
+        synthetic_source(source, minutes)
+        clip_datas = service.construct(source, clips())
+
+    comment = AudioSegment.silent(8000, frame_rate=24000)
+    tts_mp3, tts_opus = encode(comment, "mp3"), encode(comment, "opus")
+    print(f"sieve output {enhanced_format}, tts mp3 -> opus")
+    for i, clip_data in enumerate(clip_datas.root):
+        clip_data.captions = pretty_captions(clip_data.pcm.duration_seconds)
+        clip, _ = service.assemble(clip_data.pcm, clip_data.captions)
+        enhanced = clip.export(enhanced_format)
+        before = min(
+            legacy(service, clip_data, enhanced, tts_mp3) for _ in range(REPEAT)
+        )
+        after = min(
+            current(service, clip_data, enhanced, tts_opus) for _ in range(REPEAT)
+        )
+        print(
+            f"clip {i} ({clip.duration_seconds:.0f}s): "
+            f"{before * 1000:7.1f} ms -> {after * 1000:7.1f} ms cpu"
+        )
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if i == 0 else arg for i, arg in enumerate(sys.argv[1:])))
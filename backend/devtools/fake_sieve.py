@@ -0,0 +1,153 @@
+"""
+local stand-in for the sieve job api (push, job status, job.complete
+webhooks), jobs queue for a free worker and then "process" for a while.
+
+    python -m devtools.fake_sieve serve [--port 8010]
+        then run the worker with SIEVE_API_URL=http://localhost:8010
+    python -m devtools.fake_sieve check [--jobs 20] [--webhook]
+        pushes jobs through SieveJobManager against an in-process fake and
+        prints queue / processing times and the poll count
+
+the enhanced output of a job is simply its input url.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+import httpx
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException
+
+BASE_URL = "http://fake-sieve"
+
+
+def create_app(
+    workers: int = 4,
+    processing_seconds: tuple[float, float] = (2, 6),
+    fail_ratio: float = 0.0,
+) -> FastAPI:
+    app = FastAPI()
+    app.state.jobs = {}
+    app.state.polls = 0
+    app.state.webhook_transport = None  # to deliver webhooks in-process
+    state: dict = {}
+
+    def now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    async def run(job: dict, webhooks: list[dict]):
+        if "slots" not in state:
+            state["slots"] = asyncio.Semaphore(workers)
+        async with state["slots"]:
+            job["status"] = "started"
+            job["started_at"] = now()
+            await asyncio.sleep(0.2)
+            job["status"] = "processing"
+            await asyncio.sleep(random.uniform(*processing_seconds))
+        if random.random() < fail_ratio:
+            job["status"] = "error"
+            job["error"] = "fake failure"
+        else:
+            job["status"] = "finished"
+            job["outputs"] = [{"data": {"url": job["inputs"]["audio"]["url"]}}]
+        job["completed_at"] = now()
+        for webhook in webhooks:
+            async with httpx.AsyncClient(
+                transport=app.state.webhook_transport
+            ) as client:
+                await client.post(
+                    webhook["url"], json={"type": webhook["type"], "body": job}
+                )
+
+    @app.post("/v2/push")
+    async def push(body: dict):
+        job = {
+            "id": str(uuid.uuid4()),
+            "function": body["function"],
+            "inputs": body["inputs"],
+            "status": "queued",
+            "created_at": now(),
+        }
+        app.state.jobs[job["id"]] = job
+        asyncio.get_running_loop().create_task(run(job, body.get("webhooks", [])))
+        return {"id": job["id"], "status": "queued"}
+
+    @app.get("/v2/jobs/{job_id}")
+    async def get_job(job_id: str):
+        app.state.polls += 1
+        if job_id not in app.state.jobs:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return app.state.jobs[job_id]
+
+    return app
+
+
+def check(jobs: int, webhook: bool):
+    # before the settings are loaded
+    secret = os.environ.setdefault("SIEVE_WEBHOOK_SECRET", uuid.uuid4().hex)
+    from oto.infra.database import create_db_and_tables
+    from oto.infra.http import HttpClient
+    from oto.infra.sieve import SieveJobManager
+    from oto.routers.webhook import router as webhook_router
+
+    create_db_and_tables()
+
+    # the fake also serves the webhook route, all over one in-process transport
+    app = create_app()
+    app.include_router(webhook_router)
+    transport = httpx.ASGITransport(app=app)
+    app.state.webhook_transport = transport
+
+    manager = SieveJobManager(
+        "fake",
+        HttpClient(async_transport=transport),
+        BASE_URL,
+        webhook_url=f"{BASE_URL}/webhooks/sieve" if webhook else None,
+        webhook_secret=secret,
+    )
+    started = time.perf_counter()
+    futures = [
+        manager.submit(
+            "sieve/audio_enhancement", {"audio": {"url": f"{BASE_URL}/audio/{i}"}}
+        )
+        for i in range(jobs)
+    ]
+    results = [future.result() for future in futures]
+    wall = time.perf_counter() - started
+
+    for result in results:
+        print(
+            f"{result.id}: queued {result.queue_seconds:5.1f}s, "
+            f"processing {result.processing_seconds:5.1f}s"
+        )
+    print(f"{jobs} jobs in {wall:.1f}s, {app.state.polls} status polls")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve")
+    serve.add_argument("--port", type=int, default=8010)
+    serve.add_argument("--workers", type=int, default=4)
+    serve.add_argument("--fail-ratio", type=float, default=0.0)
+    run = commands.add_parser("check")
+    run.add_argument("--jobs", type=int, default=20)
+    run.add_argument("--webhook", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import uvicorn
+
+        uvicorn.run(
+            create_app(workers=args.workers, fail_ratio=args.fail_ratio),
+            port=args.port,
+        )
+    else:
+        check(args.jobs, args.webhook)
+
+
+if __name__ == "__main__":
+    main()
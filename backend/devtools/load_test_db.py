@@ -0,0 +1,155 @@
+"""
+requests per second of the conversation routes under concurrent clients,
+with the blocking session they used to open and the async request session.
+
+    python -m devtools.load_test_db [clients] [requests_per_client]
+
+requests go through the app in this process (no network), authentication is
+skipped. conversations are created for a load test user and deleted at the
+end. run with DATABASE_ECHO=false, and against postgres for numbers that
+mean something: sqlite answers too fast for the event loop to be the
+bottleneck.
+
+with more clients than the connection pool holds (15 by default), the
+blocking sessions stall: the requests holding connections cannot finish
+while the event loop waits for one, until the pool times out after 30s.
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime
+from typing import Generator
+import httpx
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Path, Query
+from sqlmodel import Session, delete, select
+from oto.domain.conversation import Conversation
+from oto.infra.database import create_db_and_tables, create_db_session, engine
+from oto.routers.conversation import router
+from oto.routers.deps.auth import require_user_id
+
+USER_ID = "load-test-user"
+CONVERSATIONS = 30
+
+legacy_router = APIRouter(prefix="/conversation")
+
+
+def get_db_session() -> Generator[Session, None, None]:
+    with Session(engine) as session:
+        yield session
+
+
+async def require_conversation(
+    conversation_id: str = Path(..., alias="conversation_id"),
+    user_id: str = Depends(require_user_id),
+) -> Conversation:
+    """the ownership check in a session of its own, on the event loop"""
+    with create_db_session() as session:
+        conversation = session.get(Conversation, conversation_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        if conversation.user_id != user_id:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return conversation
+
+
+@legacy_router.get("/list")
+async def list_conversations(
+    user_id: str = Depends(require_user_id),
+    session: Session = Depends(get_db_session),
+    start: datetime = Query(default=None),
+    end: datetime = Query(default=None),
+):
+    query = select(Conversation).where(Conversation.user_id == user_id)
+    if start:
+        query = query.where(Conversation.created_at >= start)
+    if end:
+        query = query.where(Conversation.created_at <= end)
+    return session.exec(query.order_by(Conversation.created_at.desc()).limit(30)).all()
+
+
+@legacy_router.get("/{conversation_id}")
+async def get_conversation(
+    conversation: Conversation = Depends(require_conversation),
+):
+    return conversation
+
+
+def app_with(router: APIRouter) -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[require_user_id] = lambda: USER_ID
+    return app
+
+
+def seed() -> list[str]:
+    with create_db_session() as session:
+        conversations = [
+            Conversation(
+                user_id=USER_ID,
+                file_name=f"load-test-{i}.mp3",
+                file_path=f"load-test/{i}.mp3",
+                mime_type="audio/mpeg",
+            )
+            for i in range(CONVERSATIONS)
+        ]
+        session.add_all(conversations)
+        session.commit()
+        return [conversation.id for conversation in conversations]
+
+
+def clean_up():
+    with create_db_session() as session:
+        session.exec(delete(Conversation).where(Conversation.user_id == USER_ID))
+        session.commit()
+
+
+async def load(
+    app: FastAPI, ids: list[str], clients: int, requests: int
+) -> tuple[float, int]:
+    """
+    requests per second and failed requests, every client alternating a get
+    and a list
+    """
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    failed = 0
+
+    async def client(n: int):
+        nonlocal failed
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://load-test"
+        ) as http:
+            for i in range(requests):
+                if i % 2:
+                    path = "/conversation/list"
+                else:
+                    path = f"/conversation/{ids[(n + i) % len(ids)]}"
+                response = await http.get(path)
+                failed += response.is_error
+
+    await client(0)  # warm up the pools
+    failed = 0
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return clients * requests / (time.perf_counter() - start), failed
+
+
+async def main(clients: int, requests: int):
+    create_db_and_tables()
+    ids = seed()
+    try:
+        for name, app in [
+            ("blocking session", app_with(legacy_router)),
+            ("async session", app_with(router)),
+        ]:
+            rate, failed = await load(app, ids, clients, requests)
+            print(f"{name:>16}: {rate:8.1f} requests/s, {failed} failed")
+    finally:
+        clean_up()
+
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{clients} clients, {requests} requests each")
+    asyncio.run(main(clients, requests))
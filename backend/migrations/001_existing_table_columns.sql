@@ -0,0 +1,16 @@
+-- columns added to tables that existed before, which create_all (run at
+-- startup) does not touch: it only creates missing tables. idempotent.
+--
+--     psql "$DATABASE_URL" -f migrations/001_existing_table_columns.sql
+
+-- sha256 of the uploaded audio, keys the result cache
+ALTER TABLE conversation ADD COLUMN IF NOT EXISTS content_hash VARCHAR;
+CREATE INDEX IF NOT EXISTS ix_conversation_content_hash ON conversation (content_hash);
+
+-- mono opus rendition the pipeline reads instead of the upload
+ALTER TABLE conversation ADD COLUMN IF NOT EXISTS canonical_file_path VARCHAR;
+ALTER TABLE conversation ADD COLUMN IF NOT EXISTS canonical_mime_type VARCHAR;
+
+-- columnar transcripts, new rows leave the json dump empty
+ALTER TABLE transcript ADD COLUMN IF NOT EXISTS captions_blob BYTEA;
+ALTER TABLE transcript ALTER COLUMN captions_dump DROP NOT NULL;
@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class ResultCacheEntry(SQLModel, table=True):
+    """Cached transcription / LLM output keyed by audio content hash"""
+
+    key: str = Field(primary_key=True)
+    audio_hash: str = Field(index=True)
+    service: str
+    prompt_version: str
+    value: bytes
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    last_accessed_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+class ResultCacheStats(SQLModel, table=True):
+    """Hit/miss counters per service"""
+
+    service: str = Field(primary_key=True)
+    hits: int = 0
+    misses: int = 0
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 from sqlmodel import SQLModel, Field
 from pydantic import RootModel, BaseModel
 import uuid
@@ -22,6 +22,12 @@ class ClipData(BaseModel):
     comment: str
     captions: ClipCaptions
     audio: Optional[bytes] = None
+    # SampleBuffer of the clip, kept in memory between the local stages
+    pcm: Any = Field(default=None, exclude=True)
+    # (offset in the clip, start, end in the source) of every piece, seconds
+    source_ranges: Optional[list[tuple[float, float, float]]] = Field(
+        default=None, exclude=True
+    )
 
 
 class ClipDatas(RootModel[list[ClipData]]):
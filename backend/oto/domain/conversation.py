@@ -37,6 +37,10 @@ class Conversation(SQLModel, table=True):
     file_name: str
     file_path: str
     mime_type: str
+    content_hash: Optional[str] = Field(default=None, index=True)  # sha256
+    # compact rendition made at ingest, what the pipeline reads when set
+    canonical_file_path: Optional[str] = None
+    canonical_mime_type: Optional[str] = None
 
     available_duration: Optional[str] = None
     language: Optional[str] = None
@@ -45,3 +49,9 @@ class Conversation(SQLModel, table=True):
     time: Optional[str] = None
     location: Optional[str] = None
     points: int = 0
+
+    def audio(self) -> tuple[str, str]:
+        """path and mime type of the audio to process"""
+        if self.canonical_file_path:
+            return self.canonical_file_path, self.canonical_mime_type
+        return self.file_path, self.mime_type
@@ -0,0 +1,25 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+
+class LLMCall(SQLModel, table=True):
+    """One paid model call (llm, embedding, tts, transcription, enhancement)"""
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    conversation_id: Optional[str] = Field(default=None, index=True)
+    service: str = Field(index=True)  # e.g. summary, clip_generate, tts
+    model: str
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    thoughts_tokens: int = 0
+    cached_tokens: int = 0
+    characters: int = 0  # tts input
+    audio_seconds: float = 0  # transcription input / tts output
+
+    latency_ms: float
+    retries: int = 0
+    error: Optional[str] = None
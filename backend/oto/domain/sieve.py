@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Any, Optional
+from pydantic import BaseModel
+from sqlmodel import SQLModel, Field
+
+
+class SieveJob(SQLModel, table=True):
+    """Sieve job submitted by a worker, completed by polling or webhook"""
+
+    id: str = Field(primary_key=True)  # sieve job id
+    function: str = ""  # unknown when the webhook arrives first
+    status: str = "queued"  # queued / started / processing / finished / error
+    submitted_at: datetime = Field(default_factory=datetime.now, index=True)
+    finished_at: Optional[datetime] = None
+    queue_seconds: Optional[float] = None  # submitted -> started
+    processing_seconds: Optional[float] = None  # started -> finished
+    job_dump: Optional[str] = None  # json dump of the last job object seen
+    error: Optional[str] = None
+
+
+class SieveJobResult(BaseModel):
+    id: str
+    outputs: list[Any]
+    queue_seconds: float  # submitted -> started
+    processing_seconds: float  # started -> finished
@@ -0,0 +1,149 @@
+import bisect
+import numpy as np
+from typing import Sequence
+
+
+def parse_timecodes(timecodes: Sequence[str]) -> np.ndarray:
+    """
+    seconds of `HH:MM:SS`, `MM:SS` or `SS` timecodes (fractions allowed),
+    parsed as arrays instead of string by string. raises ValueError on
+    anything else
+    """
+    timecodes = np.char.strip(np.asarray(timecodes, dtype=str).reshape(-1))
+    seconds = np.zeros(len(timecodes))
+    if len(timecodes) == 0:
+        return seconds
+    rest = timecodes
+    for scale in (1, 60, 3600):
+        parts = np.char.rpartition(rest, ":")
+        rest, field = parts[:, 0], parts[:, 2]
+        seconds += np.where(field == "", "0", field).astype(np.float64) * scale
+    if np.any(rest != ""):
+        raise ValueError(f"Invalid timecode: {timecodes[rest != ''][0]}")
+    return seconds
+
+
+def parse_timecode_ranges(timecodes: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """starts and ends of `start-end` timecodes, a lone `start` ends where it starts"""
+    if len(timecodes) == 0:
+        return np.zeros(0), np.zeros(0)
+    parts = np.char.partition(np.asarray(timecodes, dtype=str).reshape(-1), "-")
+    starts, ends = parts[:, 0], parts[:, 2]
+    return parse_timecodes(starts), parse_timecodes(np.where(ends == "", starts, ends))
+
+
+def format_timecodes(seconds: Sequence[float], milliseconds: bool = True) -> list[str]:
+    """`HH:MM:SS.SSS` (or whole `HH:MM:SS`) of every value"""
+    units = 1000 if milliseconds else 1
+    total = np.round(np.asarray(seconds, dtype=np.float64) * units).astype(np.int64)
+    hours, rest = np.divmod(total, 3600 * units)
+    minutes, rest = np.divmod(rest, 60 * units)
+    if not milliseconds:
+        return [
+            f"{h:02d}:{m:02d}:{s:02d}"
+            for h, m, s in zip(hours.tolist(), minutes.tolist(), rest.tolist())
+        ]
+    return [
+        f"{h:02d}:{m:02d}:{s // 1000:02d}.{s % 1000:03d}"
+        for h, m, s in zip(hours.tolist(), minutes.tolist(), rest.tolist())
+    ]
+
+
+class TimelineIndex:
+    """
+    word timings of a transcript, sorted for binary search.
+
+    overlapping words (crosstalk) are taken as one stretch of speech: every
+    word ends at the furthest end seen so far, so the ends are sorted too
+    """
+
+    def __init__(self, starts: Sequence[float], ends: Sequence[float]):
+        starts = np.asarray(starts, dtype=np.float64)
+        order = np.argsort(starts, kind="stable")
+        self.starts = starts[order]
+        self.ends = np.maximum.accumulate(np.asarray(ends, dtype=np.float64)[order])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def word_at(self, time: float) -> int:
+        """index of the word spoken at `time`, -1 in a pause"""
+        i = int(np.searchsorted(self.starts, time, side="right")) - 1
+        return i if i >= 0 and time < self.ends[i] else -1
+
+    def snap(self, time: float, direction: int = 0) -> float:
+        """
+        `time` moved out of the word it falls in, to its start (direction < 0),
+        its end (> 0) or whichever is closer (0). times in a pause stay
+        """
+        i = self.word_at(time)
+        if i < 0:
+            return time
+        start, end = float(self.starts[i]), float(self.ends[i])
+        if direction < 0 or (direction == 0 and time - start <= end - time):
+            return start
+        return end
+
+    def snap_range(self, start: float, end: float) -> tuple[float, float]:
+        """
+        (start, end) widened / narrowed to word boundaries: a time inside a
+        word moves to that word's edge, one in a pause to the edge of the
+        speech next to it. unchanged when no word lies in the range
+        """
+        first = int(np.searchsorted(self.ends, start, side="right"))
+        last = int(np.searchsorted(self.starts, end, side="left")) - 1
+        if first >= len(self) or last < 0 or last < first:
+            return start, end
+        return float(self.starts[first]), float(self.ends[last])
+
+    def snap_ranges(
+        self, starts: np.ndarray, ends: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """snap_range over arrays of ranges"""
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        if len(self) == 0:
+            return starts, ends
+        first = np.searchsorted(self.ends, starts, side="right")
+        last = np.searchsorted(self.starts, ends, side="left") - 1
+        valid = (first < len(self)) & (last >= 0) & (last >= first)
+        first = np.minimum(first, len(self) - 1)
+        last = np.maximum(last, 0)
+        return (
+            np.where(valid, self.starts[first], starts),
+            np.where(valid, self.ends[last], ends),
+        )
+
+
+class IntervalSet:
+    """
+    open intervals added one by one, kept merged into sorted disjoint ones so
+    that lookups are a binary search instead of a scan over everything added
+    """
+
+    def __init__(self):
+        self.starts: list[float] = []
+        self.ends: list[float] = []
+
+    def add(self, start: float, end: float):
+        if end <= start:
+            return
+        # overlapping intervals are [i, j), touching ones are kept apart as
+        # their shared point is in neither
+        i = bisect.bisect_right(self.ends, start)
+        j = bisect.bisect_left(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def contains(self, time: float) -> bool:
+        i = bisect.bisect_left(self.starts, time) - 1
+        return i >= 0 and time < self.ends[i]
+
+    def overlaps(self, start: float, end: float) -> bool:
+        if end <= start:
+            return False
+        i = bisect.bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
@@ -1,6 +1,11 @@
+import json
+import struct
+import numpy as np
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel, RootModel
 from sqlmodel import SQLModel, Field
+from oto.domain.timeline import TimelineIndex, parse_timecode_ranges
 
 
 class Caption(BaseModel):
@@ -13,12 +18,188 @@ class Captions(RootModel[list[Caption]]):
     pass
 
 
+class ColumnarTranscript:
+    """
+    word level transcript stored as columns instead of one Caption per word.
+
+    layout: header | speakers (json) | starts f32[n] | ends f32[n]
+    | speaker index u16[n] | text offsets u32[n+1] | utf-8 text blob
+    """
+
+    MAGIC = b"OTOC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBBIII")
+    FLAG_RANGE = 1  # timecodes are rendered as "start-end"
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        speaker_ids: np.ndarray,
+        speakers: list[str],
+        offsets: np.ndarray,
+        text: bytes,
+        has_range: bool = True,
+    ):
+        self.starts = starts
+        self.ends = ends
+        self.speaker_ids = speaker_ids
+        self.speakers = speakers
+        self.offsets = offsets
+        self.text = text
+        self.has_range = has_range
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_words(
+        cls,
+        starts: list[float],
+        ends: list[float],
+        speakers: list[str],
+        words: list[str],
+        has_range: bool = True,
+    ) -> "ColumnarTranscript":
+        interned: dict[str, int] = {}
+        speaker_ids = [interned.setdefault(s, len(interned)) for s in speakers]
+        encoded = [w.encode("utf-8") for w in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        offsets[1:] = np.cumsum([len(w) for w in encoded])
+        return cls(
+            starts=np.asarray(starts, dtype=np.float32),
+            ends=np.asarray(ends, dtype=np.float32),
+            speaker_ids=np.asarray(speaker_ids, dtype=np.uint16),
+            speakers=list(interned),
+            offsets=offsets,
+            text=b"".join(encoded),
+            has_range=has_range,
+        )
+
+    @classmethod
+    def from_captions(cls, captions: Captions) -> "ColumnarTranscript":
+        timecodes = [c.timecode for c in captions.root]
+        has_range = all("-" in timecode for timecode in timecodes)
+        starts, ends = parse_timecode_ranges(timecodes)
+        return cls.from_words(
+            starts,
+            ends,
+            [c.speaker for c in captions.root],
+            [c.caption for c in captions.root],
+            has_range=has_range,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ColumnarTranscript":
+        magic, version, flags, n, speakers_len, text_len = cls.HEADER.unpack_from(
+            data, 0
+        )
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("Invalid columnar transcript")
+        pos = cls.HEADER.size
+        speakers = json.loads(data[pos : pos + speakers_len].decode("utf-8"))
+        pos += speakers_len
+        starts = np.frombuffer(data, dtype=np.float32, count=n, offset=pos)
+        pos += 4 * n
+        ends = np.frombuffer(data, dtype=np.float32, count=n, offset=pos)
+        pos += 4 * n
+        speaker_ids = np.frombuffer(data, dtype=np.uint16, count=n, offset=pos)
+        pos += 2 * n
+        offsets = np.frombuffer(data, dtype=np.uint32, count=n + 1, offset=pos)
+        pos += 4 * (n + 1)
+        return cls(
+            starts=starts,
+            ends=ends,
+            speaker_ids=speaker_ids,
+            speakers=speakers,
+            offsets=offsets,
+            text=data[pos : pos + text_len],
+            has_range=bool(flags & cls.FLAG_RANGE),
+        )
+
+    def to_bytes(self) -> bytes:
+        speakers = json.dumps(self.speakers).encode("utf-8")
+        return b"".join(
+            [
+                self.HEADER.pack(
+                    self.MAGIC,
+                    self.VERSION,
+                    self.FLAG_RANGE if self.has_range else 0,
+                    len(self),
+                    len(speakers),
+                    len(self.text),
+                ),
+                speakers,
+                self.starts.astype("<f4").tobytes(),
+                self.ends.astype("<f4").tobytes(),
+                self.speaker_ids.astype("<u2").tobytes(),
+                self.offsets.astype("<u4").tobytes(),
+                self.text,
+            ]
+        )
+
+    def word(self, i: int) -> str:
+        return self.text[self.offsets[i] : self.offsets[i + 1]].decode("utf-8")
+
+    def speaker(self, i: int) -> str:
+        return self.speakers[self.speaker_ids[i]]
+
+    def timecode(self, i: int) -> str:
+        start = self._seconds_to_timecode(float(self.starts[i]))
+        if not self.has_range:
+            return start
+        return start + "-" + self._seconds_to_timecode(float(self.ends[i]))
+
+    def timeline(self) -> TimelineIndex:
+        return TimelineIndex(self.starts, self.ends)
+
+    def to_captions(self) -> Captions:
+        # the data was validated when it was written, skip validation here
+        return Captions.model_construct(
+            [
+                Caption.model_construct(
+                    timecode=self.timecode(i),
+                    speaker=self.speaker(i),
+                    caption=self.word(i),
+                )
+                for i in range(len(self))
+            ]
+        )
+
+    @staticmethod
+    def _seconds_to_timecode(seconds: float) -> str:
+        """
+        make seconds to HH:MM:SS
+        """
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        seconds = int(seconds % 60)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
 class Transcript(SQLModel, table=True):
     id: str = Field(primary_key=True)
     user_id: str = Field(index=True)
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
-    captions_dump: str  # json dump of captions
+    captions_dump: Optional[str] = None  # json dump of captions (legacy)
+    captions_blob: Optional[bytes] = None  # ColumnarTranscript bytes
+
+    def set_columnar(self, columnar: ColumnarTranscript):
+        self.captions_blob = columnar.to_bytes()
+        self.captions_dump = None
+
+    def get_columnar(self) -> ColumnarTranscript:
+        if self.captions_blob is not None:
+            return ColumnarTranscript.from_bytes(self.captions_blob)
+        return ColumnarTranscript.from_captions(
+            Captions.model_validate_json(self.captions_dump)
+        )
+
+    def get_captions(self) -> Captions:
+        if self.captions_blob is not None:
+            return ColumnarTranscript.from_bytes(self.captions_blob).to_captions()
+        return Captions.model_validate_json(self.captions_dump)
 
 
 class TranscriptResponse(BaseModel):
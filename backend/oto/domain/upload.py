@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field
+import uuid
+
+
+class UploadSession(SQLModel, table=True):
+    """Direct-to-bucket upload, parts are composed into file_path on completion"""
+
+    id: Optional[str] = Field(
+        default_factory=lambda: str(uuid.uuid4()), primary_key=True
+    )
+    user_id: str = Field(index=True)
+    # pending / assembling / composed / starting / completed / failed
+    status: str = "pending"
+    claimed_at: Optional[datetime] = None  # when a request took the status
+    created_at: datetime = Field(default_factory=datetime.now)
+    expires_at: datetime
+
+    file_name: str
+    file_path: str  # final object, the parts are stored under file_path.parts/
+    mime_type: str
+    size: int  # declared by the client, checked on completion
+    part_size: int
+    part_count: int
+    conversation_id: Optional[str] = None  # set on completion
+
+    def part_path(self, number: int) -> str:
+        return f"{self.file_path}.parts/{number:05d}"
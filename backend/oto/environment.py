@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -20,6 +21,90 @@ class Settings(BaseSettings):
     solana_keypair: str
     solana_rpc_url: str
 
+    database_echo: bool = True  # log every statement
+
+    # bearer token of the /health stats routes, they answer 404 when unset
+    admin_token: str = ""
+
+    fireworks_api_url: str = "https://audio-prod.us-virginia-1.direct.fireworks.ai"
+    sieve_api_url: str = "https://mango.sievedata.com"
+    # public url of POST /webhooks/sieve, jobs are only polled when unset
+    sieve_webhook_url: Optional[str] = None
+    sieve_webhook_secret: str = ""
+    sieve_job_timeout_seconds: float = 120
+
+    # outbound http
+    http_timeout_seconds: float = 30
+    http_max_connections_per_host: int = 10
+    http_max_retries: int = 4
+
+    # "gcs", or "local" to keep files in local_storage_path (development,
+    # benchmarks), served by /storage under local_storage_url
+    storage_backend: str = "gcs"
+    local_storage_path: str = "storage"
+    local_storage_url: str = "http://localhost:8000"
+    local_storage_secret: str = ""  # signs the /storage urls, required by "local"
+
+    # mono opus rendition every stage after ingest reads, 0 kbps disables it
+    canonical_sample_rate: int = 16000
+    canonical_bitrate_kbps: int = 24
+
+    # worker local cache of downloaded source audio, 0 disables it
+    blob_cache_path: str = "/tmp/oto-blob-cache"
+    blob_cache_megabytes: int = 4096
+
+    # signed urls, reissued once less than the refresh margin is left
+    signed_url_expiration_minutes: int = 60
+    signed_url_refresh_minutes: int = 10
+    signed_url_cache_entries: int = 10000
+
+    # direct uploads, at most 32 parts (one compose) of at least this size
+    upload_max_megabytes: int = 300
+    upload_part_megabytes: int = 8
+    upload_session_minutes: int = 60
+    # a completion claim older than this (the request died) is taken again
+    upload_claim_minutes: int = 5
+
+    # vertex ai gateway
+    vertexai_flash_concurrency: int = 16
+    vertexai_flash_tokens_per_minute: int = 4_000_000
+    vertexai_pro_concurrency: int = 4
+    vertexai_pro_tokens_per_minute: int = 1_000_000
+    vertexai_embedding_concurrency: int = 8
+    vertexai_embedding_tokens_per_minute: int = 1_000_000
+    vertexai_context_cache: bool = True  # share the transcript across the fan-out
+
+    # transcripts over this estimated size are analyzed in overlapping windows
+    analysis_window_tokens: int = 24_000
+    analysis_window_overlap_tokens: int = 1_000
+
+    # per call usage / latency records (LLMCall)
+    llm_ledger_enabled: bool = True
+    llm_ledger_flush_seconds: float = 2.0
+
+    # one combined request for summary / highlights / insights / breakdown
+    combined_analysis: bool = False
+
+    # result cache
+    result_cache_enabled: bool = True
+    result_cache_ttl_hours: int = 24 * 30
+    result_cache_max_entries: int = 10000
+
+    # clip post-processing, clips run concurrently within these caps
+    clip_concurrency: int = 3
+    sieve_concurrency: int = 4
+    tts_concurrency: int = 4
+    # "dsp" trims pauses and fillers locally from the transcript's word timings,
+    # "llm" asks the model (pretty) for the cut list
+    clip_trim_mode: str = "dsp"
+    # "transcript" picks clips from the transcript text once transcription is
+    # done, "audio" from the recording itself, alongside transcription
+    clip_selection_mode: str = "transcript"
+
+    # chunked transcription, 0 disables chunking
+    transcription_chunk_seconds: int = 600
+    transcription_chunk_concurrency: int = 4
+
 
 @lru_cache
 def get_settings() -> Settings:
@@ -0,0 +1,314 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Optional
+from oto.environment import get_settings
+from oto.infra.storage import Storage, get_storage, open_mapped
+
+
+@lru_cache
+def get_blob_cache() -> "BlobCache":
+    settings = get_settings()
+    return BlobCache(
+        get_storage(),
+        root=settings.blob_cache_path,
+        max_bytes=settings.blob_cache_megabytes * 1024 * 1024,
+    )
+
+
+class BlobCache:
+    """
+    read-through disk cache of stored files on this worker, so the tasks of a
+    flow (hashing, transcription, clip cutting) download the source audio
+    once. files are kept by the sha256 of their content, with an index from
+    storage path to content; stored files are never rewritten under the same
+    path. the least recently used files are evicted over max_bytes, only
+    idle ones: a file in use holds a shared flock, which eviction in every
+    process sharing root (prefect runs a process per flow run) respects.
+
+    concurrent requests for the same file wait for one download. bypassed
+    when the storage is on this machine already or max_bytes is 0
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, storage: Storage, root: str, max_bytes: int):
+        self.storage = storage
+        self.enabled = max_bytes > 0 and not storage.is_local
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # content hash -> size, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._pins: Counter[str] = Counter()
+        # content hash -> open file holding the shared lock while pinned
+        self._held: dict[str, int] = {}
+        self._in_flight: dict[str, Future] = {}
+        self._counts: Counter[str] = Counter()
+        if self.enabled:
+            for folder in ("blobs", "paths", "tmp"):
+                os.makedirs(os.path.join(root, folder), exist_ok=True)
+            self._load()
+
+    @contextmanager
+    def local_path(self, filename: str, content_hash: Optional[str] = None):
+        """
+        yields a local path of the stored file, downloaded unless cached.
+        content_hash (sha256) finds files cached under another path
+        """
+        if not self.enabled:
+            with self.storage.local_copy(filename) as path:
+                yield path
+            return
+
+        key = self._acquire(filename, content_hash)
+        try:
+            yield self._blob_path(key)
+        finally:
+            self._release(key)
+
+    @contextmanager
+    def open(self, filename: str, content_hash: Optional[str] = None):
+        """the stored file as a stream, see local_path"""
+        if not self.enabled:
+            with self.storage.open_for_read(filename) as f:
+                yield f
+            return
+
+        with self.local_path(filename, content_hash) as path:
+            with open_mapped(path) as f:
+                yield f
+
+    def upload(self, filename: str, data: bytes, mime_type: str) -> str:
+        """stores data under filename and keeps it cached, for files made here"""
+        self.storage.upload_bytes_as(data, filename, mime_type)
+        if self.enabled:
+
+            def write(path: str):
+                with open(path, "wb") as f:
+                    f.write(data)
+
+            key = self._insert(filename, write)
+            self._release(key)
+        return filename
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self._counts["hits"], self._counts["misses"]
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "waits": self._counts["waits"],
+                "downloaded_bytes": self._counts["downloaded_bytes"],
+                "evictions": self._counts["evictions"],
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+            }
+
+    def _acquire(self, filename: str, content_hash: Optional[str]) -> str:
+        """content hash of the cached file, pinned until released"""
+        while True:
+            with self._lock:
+                key = self._lookup(filename, content_hash)
+                if key is not None and self._pin(key):
+                    self._counts["hits"] += 1
+                    self._entries.move_to_end(key)
+                    break
+                if key is not None:  # evicted by another process meanwhile
+                    self._entries.pop(key, None)
+                future = self._in_flight.get(filename)
+                owner = future is None
+                if owner:
+                    future = self._in_flight[filename] = Future()
+                    self._counts["misses"] += 1
+                else:
+                    self._counts["waits"] += 1
+            if not owner:
+                # the download has been cached (or has failed) by now, the
+                # next lookup finds it unless it has been evicted meanwhile
+                future.result()
+                continue
+
+            try:
+                key = self._download(filename)
+                with self._lock:
+                    self._counts["downloaded_bytes"] += self._entries[key]
+                future.set_result(key)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    del self._in_flight[filename]
+            break
+
+        try:
+            os.utime(self._blob_path(key))  # recency for the next process
+        except OSError:
+            pass
+        return key
+
+    def _release(self, key: str):
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                del self._pins[key]
+                os.close(self._held.pop(key))  # drops the shared lock
+        self._evict()
+
+    def _pin(self, key: str, fd: Optional[int] = None) -> bool:
+        """
+        marks the cached file in use, under the lock. False when another
+        process has evicted it. fd is an open file of it to lock
+        """
+        if self._pins[key] == 0:
+            if fd is None:
+                try:
+                    fd = os.open(self._blob_path(key), os.O_RDONLY)
+                except FileNotFoundError:
+                    return False
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if os.fstat(fd).st_nlink == 0:  # removed before it was locked
+                os.close(fd)
+                return False
+            self._held[key] = fd
+        elif fd is not None:
+            os.close(fd)
+        self._pins[key] += 1
+        return True
+
+    def _lookup(self, filename: str, content_hash: Optional[str]) -> Optional[str]:
+        """content hash of filename when it is cached, under the lock"""
+        keys = [content_hash] if content_hash else []
+        try:
+            with open(self._index_path(filename)) as f:
+                keys.append(f.read().strip())
+        except FileNotFoundError:
+            pass
+        for key in keys:
+            if key in self._entries:
+                return key
+            # cached by another process on this machine
+            try:
+                self._entries[key] = os.path.getsize(self._blob_path(key))
+                return key
+            except OSError:
+                continue
+        return None
+
+    def _download(self, filename: str) -> str:
+        """downloads filename into the cache, pinned"""
+        return self._insert(
+            filename, lambda temporary: self.storage.download_to(filename, temporary)
+        )
+
+    def _insert(self, filename: str, write: Callable[[str], None]) -> str:
+        """
+        caches filename with the content `write` puts into the given path,
+        pinned
+        """
+        fd, temporary = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        os.close(fd)
+        try:
+            write(temporary)
+            digest = hashlib.sha256()
+            with open(temporary, "rb") as f:
+                while chunk := f.read(self.CHUNK_SIZE):
+                    digest.update(chunk)
+            key = digest.hexdigest()
+            size = os.path.getsize(temporary)
+            self._publish(key, temporary)
+        finally:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+
+        index = self._index_path(filename)
+        temporary = f"{index}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            f.write(key)
+        os.replace(temporary, index)
+        with self._lock:
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+        self._evict()
+        return key
+
+    def _publish(self, key: str, temporary: str):
+        """
+        makes temporary the cached file of key, pinned. locked before it
+        can be seen, so it is never evicted unpinned. a file cached by
+        another process meanwhile is kept: replacing it would move it out
+        from under that process' lock
+        """
+        fd = os.open(temporary, os.O_RDONLY)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            while True:
+                try:
+                    os.link(temporary, self._blob_path(key))
+                    with self._lock:
+                        self._pin(key, fd)
+                    return
+                except FileExistsError:
+                    with self._lock:
+                        if self._pin(key):
+                            break
+                    # evicted before it could be pinned, link ours
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+    def _evict(self):
+        with self._lock:
+            total = sum(self._entries.values())
+            for key in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                if self._pins[key] > 0:
+                    continue
+                try:
+                    fd = os.open(self._blob_path(key), os.O_RDONLY)
+                except FileNotFoundError:
+                    total -= self._entries.pop(key)
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # in use by another process
+                else:
+                    os.remove(self._blob_path(key))
+                finally:
+                    os.close(fd)
+                total -= self._entries.pop(key)
+                self._counts["evictions"] += 1
+
+    def _load(self):
+        """files cached by earlier processes, least recently used first"""
+        folder = os.path.join(self.root, "blobs")
+        found = []
+        for name in os.listdir(folder):
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+        self._evict()
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.root, "blobs", key)
+
+    def _index_path(self, filename: str) -> str:
+        name = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, "paths", name)
@@ -0,0 +1,183 @@
+import hashlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import BinaryIO, Callable, Optional, TypeVar
+from pydantic import BaseModel
+from sqlmodel import select, delete, func, update
+from oto.environment import get_settings
+from oto.infra.database import create_db_session, dialect_insert
+from oto.domain.cache import ResultCacheEntry, ResultCacheStats
+from oto.infra.ledger import llm_call_labels
+
+T = TypeVar("T", bound=BaseModel)
+
+
+@lru_cache
+def get_result_cache() -> "ResultCache":
+    settings = get_settings()
+    return ResultCache(
+        enabled=settings.result_cache_enabled,
+        ttl=timedelta(hours=settings.result_cache_ttl_hours),
+        max_entries=settings.result_cache_max_entries,
+    )
+
+
+def hash_stream(f: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """
+    sha256 of a seekable stream, the stream is rewound afterwards
+    """
+    digest = hashlib.sha256()
+    f.seek(0)
+    while chunk := f.read(chunk_size):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    caches transcription and LLM outputs by (audio hash, service, prompt version),
+    so re-uploads and re-runs of a flow skip the paid calls
+    """
+
+    def __init__(self, enabled: bool, ttl: timedelta, max_entries: int):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(
+        self, audio_hash: Optional[str], service: str, prompt_version: str
+    ) -> Optional[bytes]:
+        if not self.enabled or not audio_hash:
+            return None
+        key = self._key(audio_hash, service, prompt_version)
+        with create_db_session() as session:
+            entry = session.get(ResultCacheEntry, key)
+            if entry and entry.created_at < datetime.now() - self.ttl:
+                session.delete(entry)
+                entry = None
+            if entry:
+                entry.last_accessed_at = datetime.now()
+                session.add(entry)
+            self._count(session, service, hit=entry is not None)
+            session.commit()
+            return entry.value if entry else None
+
+    def contains(
+        self, audio_hash: Optional[str], service: str, prompt_version: str
+    ) -> bool:
+        """a get would hit, without counting it or touching the entry"""
+        if not self.enabled or not audio_hash:
+            return False
+        key = self._key(audio_hash, service, prompt_version)
+        with create_db_session() as session:
+            return (
+                session.exec(
+                    select(ResultCacheEntry.key).where(
+                        ResultCacheEntry.key == key,
+                        ResultCacheEntry.created_at >= datetime.now() - self.ttl,
+                    )
+                ).first()
+                is not None
+            )
+
+    def put(
+        self, audio_hash: Optional[str], service: str, prompt_version: str, value: bytes
+    ):
+        if not self.enabled or not audio_hash:
+            return
+        now = datetime.now()
+        with create_db_session() as session:
+            # racing computations of the same key, the last one is kept
+            insert = dialect_insert(session, ResultCacheEntry).values(
+                key=self._key(audio_hash, service, prompt_version),
+                audio_hash=audio_hash,
+                service=service,
+                prompt_version=prompt_version,
+                value=value,
+                created_at=now,
+                last_accessed_at=now,
+            )
+            session.exec(
+                insert.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={
+                        "value": insert.excluded.value,
+                        "created_at": now,
+                        "last_accessed_at": now,
+                    },
+                )
+            )
+            session.commit()
+            self._evict(session)
+
+    def get_or_compute(
+        self,
+        audio_hash: Optional[str],
+        service: str,
+        prompt_version: str,
+        compute: Callable[[], bytes],
+    ) -> bytes:
+        value = self.get(audio_hash, service, prompt_version)
+        if value is None:
+            with llm_call_labels(service=service):
+                value = compute()
+            self.put(audio_hash, service, prompt_version, value)
+        return value
+
+    def get_or_compute_model(
+        self,
+        audio_hash: Optional[str],
+        service: str,
+        prompt_version: str,
+        model: type[T],
+        compute: Callable[[], T],
+    ) -> T:
+        value = self.get_or_compute(
+            audio_hash,
+            service,
+            prompt_version,
+            lambda: compute().model_dump_json().encode("utf-8"),
+        )
+        return model.model_validate_json(value)
+
+    def stats(self) -> list[ResultCacheStats]:
+        with create_db_session() as session:
+            return list(session.exec(select(ResultCacheStats)).all())
+
+    def _evict(self, session):
+        session.exec(
+            delete(ResultCacheEntry).where(
+                ResultCacheEntry.created_at < datetime.now() - self.ttl
+            )
+        )
+        count = session.exec(select(func.count(ResultCacheEntry.key))).one()
+        if count > self.max_entries:
+            oldest = session.exec(
+                select(ResultCacheEntry.key)
+                .order_by(ResultCacheEntry.last_accessed_at)
+                .limit(count - self.max_entries)
+            ).all()
+            session.exec(
+                delete(ResultCacheEntry).where(ResultCacheEntry.key.in_(oldest))
+            )
+        session.commit()
+
+    def _count(self, session, service: str, hit: bool):
+        # concurrent first misses of a service would both insert its row
+        session.exec(
+            dialect_insert(session, ResultCacheStats)
+            .values(service=service, hits=0, misses=0)
+            .on_conflict_do_nothing(index_elements=["service"])
+        )
+        column = ResultCacheStats.hits if hit else ResultCacheStats.misses
+        session.exec(
+            update(ResultCacheStats)
+            .where(ResultCacheStats.service == service)
+            .values({column: column + 1})
+        )
+
+    def _key(self, audio_hash: str, service: str, prompt_version: str) -> str:
+        return hashlib.sha256(
+            f"{audio_hash}:{service}:{prompt_version}".encode("utf-8")
+        ).hexdigest()
@@ -1,31 +1,97 @@
-from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, select, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncGenerator, Optional
 from oto.environment import get_settings
 from oto.domain.clip import Clip
 from oto.domain.job import ConversationJob
+from oto.domain.cache import ResultCacheEntry, ResultCacheStats
+from oto.domain.llm_call import LLMCall
+from oto.domain.sieve import SieveJob
+from oto.domain.upload import UploadSession
 
 DATABASE_URL = get_settings().database_url
+DATABASE_ECHO = get_settings().database_echo
 
+
+def async_database_url(url: str) -> URL:
+    """the same database through its asyncio driver"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if url.get_backend_name() == "postgresql":
+        query = dict(url.query)
+        if "sslmode" in query:  # asyncpg calls it ssl
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    return url
+
+
+# tasks and scripts
 engine = create_engine(
     DATABASE_URL,
-    echo=True,
+    echo=DATABASE_ECHO,
     connect_args={"check_same_thread": False}
     if DATABASE_URL.startswith("sqlite")
     else {},
 )
 
+# api routes, queries do not block the event loop
+async_engine = create_async_engine(async_database_url(DATABASE_URL), echo=DATABASE_ECHO)
+
 
 def create_db_and_tables():
     """Create database tables"""
     SQLModel.metadata.create_all(engine)
 
 
-def get_db_session() -> Generator[Session, None, None]:
-    """Get database session"""
-    with Session(engine) as session:
+async def get_async_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Get database session, one per request: dependencies asking for it in
+    the same request share it. Loaded objects stay usable after commit,
+    lazy loads would need IO outside of an await
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
 
 
 def create_db_session() -> Session:
     """Create database session"""
     return Session(engine)
+
+
+def dialect_insert(session: Session, model: type[SQLModel]):
+    """
+    INSERT into the table of model for the database of session, with its
+    on_conflict_do_nothing / on_conflict_do_update upserts
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def grouped_percentiles(
+    session: Session, keys: list, value, where: list, percents=(50, 95)
+) -> dict[tuple, list[Optional[float]]]:
+    """
+    percentiles of value per group of keys over the rows matching where,
+    percentile_cont on postgres. sqlite has no percentile aggregate, there the
+    keys and value columns alone are read and numpy interpolates the same way
+    """
+    where = [*where, value.is_not(None)]
+    if session.get_bind().dialect.name == "postgresql":
+        columns = [func.percentile_cont(p / 100).within_group(value) for p in percents]
+        rows = session.exec(select(*keys, *columns).where(*where).group_by(*keys))
+        return {tuple(row[: len(keys)]): list(row[len(keys) :]) for row in rows}
+
+    values: dict[tuple, list[float]] = {}
+    for *group, v in session.exec(select(*keys, value).where(*where)):
+        values.setdefault(tuple(group), []).append(v)
+    return {
+        group: [float(np.percentile(v, p)) for p in percents]
+        for group, v in values.items()
+    }
@@ -1,9 +1,8 @@
-import requests
-from vertexai.generative_models import Part, GenerationConfig
-from oto.domain.transcript import Captions
+from typing import Optional
 from functools import lru_cache
 from oto.environment import get_settings
-from oto.infra.storage import get_storage
+from oto.infra.http import HttpClient, get_http_client
+from oto.infra.ledger import get_llm_ledger
 from io import TextIOWrapper
 from oto.domain.fireworks import FireworksTranscriptionResponse
 
@@ -11,32 +10,49 @@ from oto.domain.fireworks import FireworksTranscriptionResponse
 @lru_cache
 def get_fireworks() -> "Fireworks":
     settings = get_settings()
-    return Fireworks(settings.fireworks_api_key)
+    return Fireworks(
+        settings.fireworks_api_key, get_http_client(), settings.fireworks_api_url
+    )
 
 
 class Fireworks:
-    def __init__(self, api_key: str):
+    TRANSCRIPTION_TIMEOUT_SECONDS = 600
+    TRANSCRIPTION_MODEL = "whisper-v3"
+
+    def __init__(self, api_key: str, http: HttpClient, base_url: str):
         self.api_key = api_key
+        self.http = http
+        self.base_url = base_url.rstrip("/")
 
-    def transcribe(self, f: TextIOWrapper) -> FireworksTranscriptionResponse:
-        response = requests.post(
-            "https://audio-prod.us-virginia-1.direct.fireworks.ai/v1/audio/transcriptions",
-            headers={"Authorization": f"Bearer {self.api_key}"},
-            files={"file": f},
-            data={
-                "vad_model": "whisperx-pyannet",
-                "alignment_model": "mms_fa",
-                "preprocessing": "bass_dynamic",
-                "temperature": "0.2",
-                "timestamp_granularities": "word,segment",
-                "audio_window_seconds": "5",
-                "speculation_window_words": "4",
-                "diarize": "true",
-                "response_format": "verbose_json",
-            },
-        )
+    def transcribe(
+        self, f: TextIOWrapper, file_name: Optional[str] = None
+    ) -> FireworksTranscriptionResponse:
+        with get_llm_ledger().measure(
+            "transcription", self.TRANSCRIPTION_MODEL
+        ) as call:
+            response = self.http.post(
+                f"{self.base_url}/v1/audio/transcriptions",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                files={"file": (file_name, f) if file_name else f},
+                data={
+                    "vad_model": "whisperx-pyannet",
+                    "alignment_model": "mms_fa",
+                    "preprocessing": "bass_dynamic",
+                    "temperature": "0.2",
+                    "timestamp_granularities": "word,segment",
+                    "audio_window_seconds": "5",
+                    "speculation_window_words": "4",
+                    "diarize": "true",
+                    "response_format": "verbose_json",
+                },
+                timeout=self.TRANSCRIPTION_TIMEOUT_SECONDS,
+            )
 
-        if response.status_code == 200:
-            return FireworksTranscriptionResponse.model_validate_json(response.text)
-        else:
-            raise Exception(f"Error: {response.status_code}", response.text)
+            call["retries"] = response.extensions.get("retries", 0)
+            if response.status_code != 200:
+                raise Exception(f"Error: {response.status_code}", response.text)
+            transcription = FireworksTranscriptionResponse.model_validate_json(
+                response.text
+            )
+            call["audio_seconds"] = transcription.duration
+        return transcription
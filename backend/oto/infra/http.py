@@ -0,0 +1,218 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+import httpx
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlsplit
+from oto.environment import get_settings
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# the request has not reached the server, or it was turned away before any
+# work: the only failures a non-idempotent request (a paid job) is retried on
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+UNSENT_STATUS_CODES = {429}
+
+
+@lru_cache
+def get_http_client() -> "HttpClient":
+    settings = get_settings()
+    return HttpClient(
+        timeout=settings.http_timeout_seconds,
+        max_connections_per_host=settings.http_max_connections_per_host,
+        max_retries=settings.http_max_retries,
+    )
+
+
+class HttpClient:
+    """
+    pooled keep-alive client shared by every outbound integration.
+
+    the sync facade is used from prefect worker threads, the async facade from
+    event loops (one AsyncClient per loop, as httpx clients are loop bound).
+    both retry 429/5xx and transport errors with jittered exponential backoff
+    and cap the number of in-flight requests per host. POST and PATCH are
+    only retried when they cannot have been processed: connection failures
+    and 429, a timeout or 5xx may come after the server started the work.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30,
+        max_connections_per_host: int = 10,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.timeout = httpx.Timeout(timeout, connect=10)
+        self.limits = httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=max_connections_per_host * 4,
+            keepalive_expiry=30,
+        )
+        self.max_connections_per_host = max_connections_per_host
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.async_transport = async_transport
+
+        self.client = httpx.Client(
+            timeout=self.timeout,
+            limits=self.limits,
+            transport=transport,
+            follow_redirects=True,
+        )
+        self._lock = threading.Lock()
+        self._host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._async_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, httpx.AsyncClient
+        ] = weakref.WeakKeyDictionary()
+        self._async_host_semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]
+        ] = weakref.WeakKeyDictionary()
+
+    # sync facade
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        retries: Optional[int] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        retries = self.max_retries if retries is None else retries
+        positions = self._positions(kwargs)
+        semaphore = self._host_semaphore(url)
+        attempt = 0
+        while True:
+            self._rewind(kwargs, positions)
+            try:
+                with semaphore:
+                    response = self.client.request(method, url, **kwargs)
+                if not self._retry_status(method, response) or attempt >= retries:
+                    response.extensions["retries"] = attempt
+                    return response
+                delay = self._delay(attempt, response)
+            except httpx.TransportError as e:
+                if not self._retry_error(method, e) or attempt >= retries:
+                    raise
+                delay = self._delay(attempt)
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    # async facade
+
+    async def arequest(
+        self,
+        method: str,
+        url: str,
+        retries: Optional[int] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        retries = self.max_retries if retries is None else retries
+        positions = self._positions(kwargs)
+        client = self._async_client()
+        semaphore = self._async_host_semaphore(url)
+        attempt = 0
+        while True:
+            self._rewind(kwargs, positions)
+            try:
+                async with semaphore:
+                    response = await client.request(method, url, **kwargs)
+                if not self._retry_status(method, response) or attempt >= retries:
+                    response.extensions["retries"] = attempt
+                    return response
+                delay = self._delay(attempt, response)
+            except httpx.TransportError as e:
+                if not self._retry_error(method, e) or attempt >= retries:
+                    raise
+                delay = self._delay(attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client:
+            await client.aclose()
+
+    def close(self):
+        self.client.close()
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self.async_transport,
+                follow_redirects=True,
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.max_connections_per_host
+                )
+            return self._host_semaphores[host]
+
+    def _async_host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphores = self._async_host_semaphores.setdefault(
+            asyncio.get_running_loop(), {}
+        )
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return semaphores[host]
+
+    def _retry_status(self, method: str, response: httpx.Response) -> bool:
+        if method.upper() in IDEMPOTENT_METHODS:
+            return response.status_code in RETRY_STATUS_CODES
+        return response.status_code in UNSENT_STATUS_CODES
+
+    def _retry_error(self, method: str, error: httpx.TransportError) -> bool:
+        return method.upper() in IDEMPOTENT_METHODS or isinstance(error, UNSENT_ERRORS)
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        # full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _positions(self, kwargs: dict) -> dict:
+        """
+        remember where file uploads start so they can be re-sent on retry
+        """
+        positions = {}
+        for key, value in (kwargs.get("files") or {}).items():
+            f = value[1] if isinstance(value, tuple) else value
+            if hasattr(f, "seek") and hasattr(f, "tell"):
+                positions[key] = (f, f.tell())
+        return positions
+
+    def _rewind(self, kwargs: dict, positions: dict):
+        for f, position in positions.values():
+            f.seek(position)
@@ -0,0 +1,194 @@
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from sqlmodel import case, func, select
+from oto.environment import get_settings
+from oto.infra.database import create_db_session, grouped_percentiles
+from oto.domain.llm_call import LLMCall
+
+# conversation_id / service of the code running the call, set by the tasks
+_labels: ContextVar[dict] = ContextVar("llm_call_labels", default={})
+
+
+@lru_cache
+def get_llm_ledger() -> "LLMCallLedger":
+    settings = get_settings()
+    return LLMCallLedger(
+        enabled=settings.llm_ledger_enabled,
+        flush_seconds=settings.llm_ledger_flush_seconds,
+    )
+
+
+@contextmanager
+def llm_call_labels(**labels):
+    """label the model calls made inside the block, e.g. conversation_id=..."""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels() -> dict:
+    """capture before handing work to another thread (the vertex gateway)"""
+    return dict(_labels.get())
+
+
+class LLMCallLedger:
+    """
+    records every paid call in LLMCall. rows are queued and written in batches
+    by a background thread so the callers never wait for the database
+    """
+
+    BATCH_SIZE = 200
+
+    def __init__(self, enabled: bool = True, flush_seconds: float = 2.0):
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self._queue: queue.Queue = queue.Queue()
+        if enabled:
+            threading.Thread(
+                target=self._run, name="llm-call-ledger", daemon=True
+            ).start()
+            atexit.register(self.flush)
+
+    def record(
+        self,
+        default_service: str,
+        model: str,
+        latency_ms: float,
+        labels: Optional[dict] = None,
+        **fields,
+    ):
+        if not self.enabled:
+            return
+        labels = current_labels() if labels is None else labels
+        self._queue.put(
+            LLMCall(
+                conversation_id=labels.get("conversation_id"),
+                service=labels.get("service", default_service),
+                model=model,
+                latency_ms=latency_ms,
+                **fields,
+            )
+        )
+
+    @contextmanager
+    def measure(
+        self,
+        default_service: str,
+        model: str,
+        labels: Optional[dict] = None,
+        **fields,
+    ):
+        """
+        record the wrapped call. the yielded dict can be filled with token
+        counts / retries once the response is known
+        """
+        labels = current_labels() if labels is None else labels
+        started = time.perf_counter()
+        result = dict(fields)
+        try:
+            yield result
+        except Exception as e:
+            result["error"] = str(e)[:500]
+            raise
+        finally:
+            self.record(
+                default_service,
+                model,
+                (time.perf_counter() - started) * 1000,
+                labels,
+                **result,
+            )
+
+    def flush(self, timeout: float = 10):
+        """block until everything recorded so far is written"""
+        if not self.enabled:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stats(self, since: datetime) -> list[dict]:
+        """totals per service and model, aggregated by the database"""
+        keys = [LLMCall.service, LLMCall.model]
+        window = [LLMCall.created_at >= since]
+        with create_db_session() as session:
+            rows = session.exec(
+                select(
+                    *keys,
+                    func.count(),
+                    func.sum(case((LLMCall.error != "", 1), else_=0)),
+                    func.sum(LLMCall.retries),
+                    func.sum(LLMCall.prompt_tokens),
+                    func.sum(LLMCall.completion_tokens),
+                    func.sum(LLMCall.thoughts_tokens),
+                    func.sum(LLMCall.cached_tokens),
+                    func.sum(LLMCall.characters),
+                    func.sum(LLMCall.audio_seconds),
+                )
+                .where(*window)
+                .group_by(*keys)
+                .order_by(*keys)
+            ).all()
+            latencies = grouped_percentiles(session, keys, LLMCall.latency_ms, window)
+
+        stats = []
+        for service, model, calls, errors, retries, *usage in rows:
+            p50, p95 = latencies[(service, model)]
+            prompt, completion, thoughts, cached, characters, audio = usage
+            stats.append(
+                {
+                    "service": service,
+                    "model": model,
+                    "calls": calls,
+                    "errors": errors,
+                    "retries": retries,
+                    "latency_p50_ms": round(p50, 1),
+                    "latency_p95_ms": round(p95, 1),
+                    "prompt_tokens": prompt,
+                    "completion_tokens": completion,
+                    "thoughts_tokens": thoughts,
+                    "cached_tokens": cached,
+                    "characters": characters,
+                    "audio_seconds": round(audio, 1),
+                }
+            )
+        return stats
+
+    def _run(self):
+        while True:
+            batch: list[LLMCall] = []
+            waiters: list[threading.Event] = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    item = self._queue.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch: list[LLMCall]):
+        try:
+            with create_db_session() as session:
+                session.add_all(batch)
+                session.commit()
+        except Exception as e:
+            # losing usage rows must never fail a conversation
+            print(f"Dropped {len(batch)} llm call records: {e}")
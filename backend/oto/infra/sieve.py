@@ -0,0 +1,383 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlencode
+from sqlmodel import and_, case, func, not_, select
+from oto.environment import get_settings
+from oto.infra.database import create_db_session, dialect_insert, grouped_percentiles
+from oto.infra.http import HttpClient, get_http_client
+from oto.domain.sieve import SieveJob, SieveJobResult
+# we dont use sieva sdk, because it is shitty sdk, so we use rest api
+
+
+@lru_cache
+def get_sieve_job_manager() -> "SieveJobManager":
+    settings = get_settings()
+    return SieveJobManager(
+        settings.sieve_api_key,
+        get_http_client(),
+        settings.sieve_api_url,
+        webhook_url=settings.sieve_webhook_url,
+        webhook_secret=settings.sieve_webhook_secret,
+        timeout_seconds=settings.sieve_job_timeout_seconds,
+    )
+
+
+RUNNING_STATUSES = {"queued", "started", "processing"}
+FINAL_STATUSES = {"finished", "error"}
+
+
+class TrackedJob:
+    def __init__(
+        self, id: str, future: asyncio.Future, deadline: float, interval: float
+    ):
+        self.id = id
+        self.future = future
+        self.deadline = deadline
+        self.status = "queued"
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None  # when a poll first saw it running
+        self.interval = interval
+        self.next_poll = self.submitted + interval
+
+
+class SieveJobManager:
+    """
+    submits sieve jobs and tracks all outstanding ones from one poller on a
+    background loop, instead of a sleeping thread per job.
+
+    jobs are polled with a per job backoff that resets whenever the status
+    changes. with a webhook configured, completions written by the webhook
+    route are picked up from the SieveJob table and polling is only the
+    fallback for lost callbacks.
+    """
+
+    MIN_POLL_SECONDS = 1.0
+    MAX_POLL_SECONDS = 10.0
+    WEBHOOK_MIN_POLL_SECONDS = 10.0
+    WEBHOOK_MAX_POLL_SECONDS = 30.0
+    WEBHOOK_CHECK_SECONDS = 1.0
+    BACKOFF = 1.5
+
+    def __init__(
+        self,
+        api_key: str,
+        http: HttpClient,
+        base_url: str,
+        webhook_url: Optional[str] = None,
+        webhook_secret: str = "",
+        timeout_seconds: float = 120,
+    ):
+        self.api_key = api_key
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.timeout_seconds = timeout_seconds
+        if webhook_url:
+            self.min_poll_seconds = self.WEBHOOK_MIN_POLL_SECONDS
+            self.max_poll_seconds = self.WEBHOOK_MAX_POLL_SECONDS
+        else:
+            self.min_poll_seconds = self.MIN_POLL_SECONDS
+            self.max_poll_seconds = self.MAX_POLL_SECONDS
+
+        self._jobs: dict[str, TrackedJob] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._loop.run_forever, name="sieve-jobs", daemon=True
+        ).start()
+
+    def submit(self, function: str, inputs: dict) -> "Future[SieveJobResult]":
+        """push a job, the future resolves once it finished (or failed)"""
+        return asyncio.run_coroutine_threadsafe(
+            self._track(function, inputs), self._loop
+        )
+
+    async def submit_async(self, function: str, inputs: dict) -> SieveJobResult:
+        """awaitable from any event loop"""
+        return await asyncio.wrap_future(self.submit(function, inputs))
+
+    def stats(self, since: datetime) -> list[dict]:
+        """counts per function, aggregated by the database"""
+        keys = [SieveJob.function]
+        window = [SieveJob.submitted_at >= since]
+        done = [*window, SieveJob.processing_seconds.is_not(None)]
+        with create_db_session() as session:
+            rows = session.exec(
+                select(
+                    *keys,
+                    func.count(),
+                    func.sum(case((SieveJob.status == "finished", 1), else_=0)),
+                    func.sum(case((SieveJob.status == "error", 1), else_=0)),
+                    func.sum(case((SieveJob.status.in_(RUNNING_STATUSES), 1), else_=0)),
+                )
+                .where(*window)
+                .group_by(*keys)
+                .order_by(*keys)
+            ).all()
+            queue = grouped_percentiles(session, keys, SieveJob.queue_seconds, done)
+            processing = grouped_percentiles(
+                session, keys, SieveJob.processing_seconds, done
+            )
+
+        return [
+            {
+                "function": function,
+                "jobs": jobs,
+                "finished": finished,
+                "errors": errors,
+                "running": running,
+                **self._percentiles("queue", queue.get((function,))),
+                **self._percentiles("processing", processing.get((function,))),
+            }
+            for function, jobs, finished, errors, running in rows
+        ]
+
+    # on the poller loop
+
+    async def _track(self, function: str, inputs: dict) -> SieveJobResult:
+        job_id = await self._push(function, inputs)
+        job = TrackedJob(
+            job_id,
+            self._loop.create_future(),
+            time.monotonic() + self.timeout_seconds,
+            self.min_poll_seconds,
+        )
+        self._jobs[job_id] = job
+        try:
+            await asyncio.to_thread(self._insert, job_id, function)
+            if self._poller is None or self._poller.done():
+                self._wake = asyncio.Event()
+                self._poller = self._loop.create_task(self._poll())
+            self._wake.set()
+            return await job.future
+        finally:
+            self._jobs.pop(job_id, None)
+
+    async def _push(self, function: str, inputs: dict) -> str:
+        body: dict = {"function": function, "inputs": inputs}
+        if self.webhook_url:
+            query = urlencode({"token": self.webhook_secret})
+            body["webhooks"] = [
+                {"type": "job.complete", "url": f"{self.webhook_url}?{query}"}
+            ]
+        response = await self.http.apost(
+            f"{self.base_url}/v2/push",
+            headers={"Content-Type": "application/json", "X-API-Key": self.api_key},
+            json=body,
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def _poll(self):
+        while self._jobs:
+            if self.webhook_url:
+                await self._check_webhooks()
+
+            now = time.monotonic()
+            due = [j for j in self._jobs.values() if j.next_poll <= now]
+            await asyncio.gather(*(self._refresh(j) for j in due))
+
+            now = time.monotonic()
+            for job in list(self._jobs.values()):
+                if now > job.deadline and not job.future.done():
+                    job.future.set_exception(Exception(f"Job timed out: {job.id}"))
+                    await asyncio.to_thread(self._store, job.id, "timeout", None)
+
+            pending = [j for j in self._jobs.values() if not j.future.done()]
+            if not pending:
+                # finished futures leave _jobs once their caller resumed
+                await asyncio.sleep(0)
+                continue
+            wake_at = min(min(j.next_poll, j.deadline) for j in pending)
+            if self.webhook_url:
+                wake_at = min(wake_at, now + self.WEBHOOK_CHECK_SECONDS)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake_at - now))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, job: TrackedJob):
+        try:
+            response = await self.http.aget(
+                f"{self.base_url}/v2/jobs/{job.id}",
+                headers={"X-API-Key": self.api_key},
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            print(f"Polling sieve job {job.id} failed: {e}")
+            data = {"status": job.status}
+        await self._update(job, data)
+
+    async def _check_webhooks(self):
+        ids = [j.id for j in self._jobs.values() if not j.future.done()]
+        if not ids:
+            return
+        for data in await asyncio.to_thread(self._completed, ids):
+            job = self._jobs.get(data["id"])
+            if job is not None:
+                await self._update(job, data)
+
+    async def _update(self, job: TrackedJob, data: dict):
+        if job.future.done():
+            return
+        status = data.get("status", job.status)
+        now = time.monotonic()
+        if status != job.status:
+            job.status = status
+            job.interval = self.min_poll_seconds
+        else:
+            job.interval = min(self.max_poll_seconds, job.interval * self.BACKOFF)
+        job.next_poll = now + job.interval
+        if job.started is None and status in ("started", "processing"):
+            job.started = now
+
+        if status in RUNNING_STATUSES:
+            return
+        queue_seconds, processing_seconds = self._timings(job, data, now)
+        await asyncio.to_thread(
+            self._store,
+            job.id,
+            status,
+            data,
+            queue_seconds,
+            processing_seconds,
+        )
+        print(
+            f"Sieve job {job.id} {status}: queued {queue_seconds:.1f}s, "
+            f"processing {processing_seconds:.1f}s"
+        )
+        if status == "finished":
+            job.future.set_result(
+                SieveJobResult(
+                    id=job.id,
+                    outputs=data.get("outputs") or [],
+                    queue_seconds=queue_seconds,
+                    processing_seconds=processing_seconds,
+                )
+            )
+        elif status == "error":
+            job.future.set_exception(Exception(data.get("error")))
+        else:
+            job.future.set_exception(Exception(f"Unknown job status: {status}"))
+
+    def _timings(self, job: TrackedJob, data: dict, now: float) -> tuple[float, float]:
+        """
+        sieve's own timestamps when the job carries them, otherwise what the
+        polls observed (which only bounds the split by the poll interval)
+        """
+        created = self._timestamp(data.get("created_at"))
+        started = self._timestamp(data.get("started_at"))
+        completed = self._timestamp(data.get("completed_at"))
+        if created and started and completed:
+            return (
+                max(0.0, (started - created).total_seconds()),
+                max(0.0, (completed - started).total_seconds()),
+            )
+        started_at = job.started if job.started is not None else now
+        return started_at - job.submitted, now - started_at
+
+    def _timestamp(self, value) -> Optional[datetime]:
+        if not isinstance(value, str):
+            return None
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    def _percentiles(self, name: str, values: Optional[list[float]]) -> dict:
+        if values is None:
+            return {f"{name}_p50_seconds": None, f"{name}_p95_seconds": None}
+        p50, p95 = values
+        return {
+            f"{name}_p50_seconds": round(p50, 1),
+            f"{name}_p95_seconds": round(p95, 1),
+        }
+
+    # database, called through asyncio.to_thread
+
+    def _insert(self, job_id: str, function: str):
+        with create_db_session() as session:
+            insert = dialect_insert(session, SieveJob).values(
+                **SieveJob(id=job_id, function=function).model_dump()
+            )
+            # the webhook may be faster than us, even while we insert
+            session.exec(
+                insert.on_conflict_do_update(
+                    index_elements=["id"], set_={"function": function}
+                )
+            )
+            session.commit()
+
+    def _store(
+        self,
+        job_id: str,
+        status: str,
+        data: Optional[dict],
+        queue_seconds: Optional[float] = None,
+        processing_seconds: Optional[float] = None,
+    ):
+        with create_db_session() as session:
+            job = session.get(SieveJob, job_id)
+            if job is None:
+                return
+            job.status = status
+            job.finished_at = datetime.now()
+            job.queue_seconds = queue_seconds
+            job.processing_seconds = processing_seconds
+            if data is not None:
+                job.job_dump = json.dumps(data)
+                job.error = data.get("error") if status == "error" else None
+            session.add(job)
+            session.commit()
+
+    def _completed(self, ids: list[str]) -> list[dict]:
+        with create_db_session() as session:
+            jobs = session.exec(
+                select(SieveJob).where(
+                    SieveJob.id.in_(ids),
+                    SieveJob.status.in_(FINAL_STATUSES),
+                    SieveJob.job_dump.is_not(None),
+                )
+            ).all()
+            return [json.loads(job.job_dump) for job in jobs]
+
+
+def store_webhook_job(data: dict):
+    """
+    record a job object delivered by a sieve webhook, the worker waiting for
+    it picks the completion up from the table
+    """
+    job = SieveJob(id=data["id"], job_dump=json.dumps(data))
+    update = {"job_dump": job.job_dump}
+    if "status" in data:
+        job.status = data["status"]
+        job.error = data.get("error") if job.status == "error" else None
+        update.update(status=job.status, error=job.error)
+    with create_db_session() as session:
+        # in one statement, the worker may be inserting the job meanwhile
+        session.exec(
+            dialect_insert(session, SieveJob)
+            .values(**job.model_dump())
+            .on_conflict_do_update(
+                index_elements=["id"],
+                set_=update,
+                # unless the poller got there first
+                where=not_(
+                    and_(
+                        SieveJob.status.in_(FINAL_STATUSES),
+                        SieveJob.finished_at.is_not(None),
+                    )
+                ),
+            )
+        )
+        session.commit()
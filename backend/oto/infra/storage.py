@@ -1,23 +1,214 @@
+import hashlib
+import hmac
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from fastapi import UploadFile, HTTPException
 from google.cloud import storage
 from datetime import timedelta
 from functools import lru_cache
+from typing import Optional
+from urllib.parse import quote
 from oto.environment import get_settings
 
 
 @lru_cache
-def get_storage():
+def get_storage() -> "Storage":
     settings = get_settings()
+    signed_urls = dict(
+        signed_url_expiration=timedelta(minutes=settings.signed_url_expiration_minutes),
+        signed_url_refresh=timedelta(minutes=settings.signed_url_refresh_minutes),
+        signed_url_cache_entries=settings.signed_url_cache_entries,
+    )
+    if settings.storage_backend == "local":
+        if not settings.local_storage_secret:
+            # anyone could forge the /storage urls
+            raise ValueError("LOCAL_STORAGE_SECRET is required by the local storage")
+        return LocalStorage(
+            root=settings.local_storage_path,
+            base_url=settings.local_storage_url,
+            secret=settings.local_storage_secret,
+            **signed_urls,
+        )
     return GoogleCloudStorage(
         bucket_name=settings.google_cloud_bucket_name,
         credentials_path=settings.google_cloud_credential_path,
+        **signed_urls,
     )
 
 
-class GoogleCloudStorage:
-    def __init__(self, bucket_name: str, credentials_path: str = None):
+def open_mapped(path: str):
+    """a local file memory mapped, reads are copies out of the page cache"""
+    if os.path.getsize(path) == 0:  # empty files cannot be mapped
+        return open(path, "rb")
+    return MappedFile(path)
+
+
+class Storage(ABC):
+    """
+    what the pipeline needs from a file store, paths are `/` separated and
+    relative to the store. signed GET urls are cached per file until the
+    refresh margin before they expire. backends implement every abstract
+    method, a missing one fails when the backend is created
+    """
+
+    is_local = False  # files are on this machine already
+
+    def __init__(
+        self,
+        signed_url_expiration: timedelta = timedelta(minutes=60),
+        signed_url_refresh: timedelta = timedelta(minutes=10),
+        signed_url_cache_entries: int = 10000,
+    ):
+        self.signed_url_expiration = signed_url_expiration
+        self.signed_url_refresh = signed_url_refresh
+        self.signed_url_cache_entries = signed_url_cache_entries
+        self._lock = threading.Lock()
+        # path -> (url, expiry in epoch seconds), least recently used first
+        self._signed_urls: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    @abstractmethod
+    def upload_file(self, file: UploadFile, folder_path: str) -> str: ...
+
+    @abstractmethod
+    def upload_bytes(
+        self, bytes: bytes, folder_path: str, ext: str, mime_type: str
+    ) -> str: ...
+
+    @abstractmethod
+    def upload_bytes_as(self, bytes: bytes, filename: str, mime_type: str) -> str:
+        """upload under a fixed name, for content addressed files"""
+
+    @abstractmethod
+    def exists(self, filename: str) -> bool: ...
+
+    @abstractmethod
+    def delete_file(self, filename: str): ...
+
+    @abstractmethod
+    def generate_upload_urls(self, filenames: list[str]) -> dict[str, str]:
+        """signed PUT urls by path, for clients to upload to the store directly"""
+
+    @abstractmethod
+    def sizes(self, prefix: str) -> dict[str, int]:
+        """size of every file under prefix, by path"""
+
+    @abstractmethod
+    def compose(self, sources: list[str], filename: str, mime_type: str):
+        """concatenate sources into filename, the sources are deleted afterwards"""
+
+    @abstractmethod
+    def read_range(self, filename: str, start: int, end: int) -> bytes:
+        """bytes start..end (inclusive) of the file"""
+
+    @abstractmethod
+    def open_for_read(self, filename: str, chunk_kb: int = 1024):
+        """
+        returns a stream of the file
+        """
+
+    @abstractmethod
+    def local_copy(self, filename: str):
+        """
+        context manager yielding a local path of the file, for tools that
+        need to seek (ffmpeg) without holding it in memory
+        """
+
+    @abstractmethod
+    def download_to(self, filename: str, path: str):
+        """copy the file to the local path"""
+
+    def model_uri(self, filename: str) -> Optional[str]:
+        """uri vertex ai reads the file from, None to send it inline"""
+        return None
+
+    def generate_signed_url(self, filename: str) -> str:
+        return self.generate_signed_urls([filename])[filename]
+
+    def generate_signed_urls(self, filenames: list[str]) -> dict[str, str]:
+        """
+        signed GET urls by path, the cached ones as long as they are valid
+        for longer than the refresh margin. signing is local (a service
+        account key / hmac), nothing is fetched per file
+        """
+        now = time.time()
+        urls: dict[str, str] = {}
+        with self._lock:
+            for filename in filenames:
+                cached = self._signed_urls.get(filename)
+                if cached and cached[1] - now > self.signed_url_refresh.total_seconds():
+                    self._signed_urls.move_to_end(filename)
+                    urls[filename] = cached[0]
+        try:
+            signed = {
+                filename: self._sign(filename)
+                for filename in dict.fromkeys(filenames)
+                if filename not in urls
+            }
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Signed URL generation failed: {str(e)}"
+            )
+        if signed:
+            expires_at = now + self.signed_url_expiration.total_seconds()
+            with self._lock:
+                for filename, url in signed.items():
+                    self._signed_urls[filename] = (url, expires_at)
+                    self._signed_urls.move_to_end(filename)
+                while len(self._signed_urls) > self.signed_url_cache_entries:
+                    self._signed_urls.popitem(last=False)
+            urls.update(signed)
+        return urls
+
+    @abstractmethod
+    def _sign(self, filename: str) -> str:
+        """a GET url of filename valid for signed_url_expiration"""
+
+    def _forget(self, filename: str):
+        with self._lock:
+            self._signed_urls.pop(filename, None)
+
+    def unique_filename(self, ext: str, folder_path: str = "") -> str:
+        """a fresh path for a new file, as the upload methods pick them"""
+        return self._generate_unique_filename(ext, folder_path)
+
+    def _generate_unique_filename(self, ext: str, folder_path: str = "") -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_id = uuid.uuid4().hex[:8]
+        filename = f"{timestamp}_{unique_id}.{ext}"
+
+        if folder_path:
+            filename = f"{folder_path.strip('/')}/{filename}"
+
+        return filename
+
+
+class GoogleCloudStorage(Storage):
+    """
+    blobs are not probed before signing, the paths come from our own writes;
+    the ones written or found by this process are remembered
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        credentials_path: str = None,
+        signed_url_expiration: timedelta = timedelta(minutes=60),
+        signed_url_refresh: timedelta = timedelta(minutes=10),
+        signed_url_cache_entries: int = 10000,
+    ):
+        super().__init__(
+            signed_url_expiration, signed_url_refresh, signed_url_cache_entries
+        )
         self.bucket_name = bucket_name
         if credentials_path:
             self.client = storage.Client.from_service_account_json(credentials_path)
@@ -25,6 +216,7 @@ class GoogleCloudStorage:
             self.client = storage.Client()
 
         self.bucket = self.client.bucket(self.bucket_name)
+        self._known: OrderedDict[str, None] = OrderedDict()
 
     def upload_file(self, file: UploadFile, folder_path: str) -> str:
         try:
@@ -36,6 +228,7 @@ class GoogleCloudStorage:
 
             blob = self.bucket.blob(blob_name)
             blob.upload_from_file(file.file)
+            self._written(blob_name)
 
             return blob_name
         except Exception as e:
@@ -48,55 +241,339 @@ class GoogleCloudStorage:
             blob_name = self._generate_unique_filename(ext, folder_path)
             blob = self.bucket.blob(blob_name)
             blob.upload_from_string(bytes, content_type=mime_type)
+            self._written(blob_name)
             return blob_name
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-    def delete_file(self, filename: str):
+    def upload_bytes_as(self, bytes: bytes, filename: str, mime_type: str) -> str:
+        """upload under a fixed name, for content addressed files"""
         try:
             blob = self.bucket.blob(filename)
-            if not blob.exists():
-                raise HTTPException(status_code=404, detail="File not found")
-
-            blob.delete()
+            blob.upload_from_string(bytes, content_type=mime_type)
+            self._written(filename)
+            return filename
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-    def generate_signed_url(self, filename: str) -> str:
+    def exists(self, filename: str) -> bool:
+        with self._lock:
+            if filename in self._known:
+                return True
+        if not self.bucket.blob(filename).exists():
+            return False
+        self._written(filename)
+        return True
+
+    def delete_file(self, filename: str):
         try:
-            expiration_minutes = 60
-            method = "GET"
             blob = self.bucket.blob(filename)
             if not blob.exists():
                 raise HTTPException(status_code=404, detail="File not found")
 
-            expiration = datetime.now() + timedelta(minutes=expiration_minutes)
-
-            signed_url = blob.generate_signed_url(expiration=expiration, method=method)
+            blob.delete()
+            with self._lock:
+                self._known.pop(filename, None)
+            self._forget(filename)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
 
-            return signed_url
+    def _sign(self, filename: str) -> str:
+        return self.bucket.blob(filename).generate_signed_url(
+            expiration=self.signed_url_expiration, method="GET"
+        )
 
+    def generate_upload_urls(self, filenames: list[str]) -> dict[str, str]:
+        try:
+            return {
+                filename: self.bucket.blob(filename).generate_signed_url(
+                    version="v4", expiration=self.signed_url_expiration, method="PUT"
+                )
+                for filename in filenames
+            }
         except Exception as e:
             raise HTTPException(
                 status_code=500, detail=f"Signed URL generation failed: {str(e)}"
             )
 
-    def _generate_unique_filename(self, ext: str, folder_path: str = "") -> str:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = uuid.uuid4().hex[:8]
-        filename = f"{timestamp}_{unique_id}.{ext}"
+    def sizes(self, prefix: str) -> dict[str, int]:
+        return {
+            blob.name: blob.size
+            for blob in self.client.list_blobs(self.bucket, prefix=prefix)
+        }
 
-        if folder_path:
-            filename = f"{folder_path.strip('/')}/{filename}"
+    def compose(self, sources: list[str], filename: str, mime_type: str):
+        """
+        concatenate up to 32 blobs into filename inside the bucket, nothing
+        goes through this process. the sources are deleted afterwards
+        """
+        blob = self.bucket.blob(filename)
+        blob.content_type = mime_type
+        blob.compose([self.bucket.blob(source) for source in sources])
+        self._written(filename)
+        for source in sources:
+            try:
+                self.bucket.blob(source).delete()
+            except Exception as e:
+                print(f"Deleting {source} failed: {e}")
 
-        return filename
+    def read_range(self, filename: str, start: int, end: int) -> bytes:
+        return self.bucket.blob(filename).download_as_bytes(start=start, end=end)
+
+    def model_uri(self, filename: str) -> Optional[str]:
+        return f"gs://{self.bucket_name}/{filename}"
+
+    def _written(self, filename: str):
+        with self._lock:
+            self._known[filename] = None
+            self._known.move_to_end(filename)
+            while len(self._known) > self.signed_url_cache_entries:
+                self._known.popitem(last=False)
 
     def open_for_read(self, filename: str, chunk_kb: int = 1024):
-        """
-        returns a stream of the file
-        """
         blob = self.bucket.blob(filename)
         if not blob.exists():
             raise HTTPException(status_code=404, detail="File not found")
 
         return blob.open("rb", chunk_size=chunk_kb * 1024)
+
+    @contextmanager
+    def local_copy(self, filename: str):
+        """downloads the file to a temporary file and yields its path"""
+        blob = self.bucket.blob(filename)
+        if not blob.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+
+        suffix = os.path.splitext(filename)[1]
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            blob.download_to_filename(path)
+            yield path
+        finally:
+            os.remove(path)
+
+    def download_to(self, filename: str, path: str):
+        blob = self.bucket.blob(filename)
+        if not blob.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+        blob.download_to_filename(path)
+
+
+class LocalStorage(Storage):
+    """
+    files under a directory on this machine, for development and for
+    benchmarking the pipeline without the network. writes go to a temporary
+    file next to the target and are renamed over it, so readers never see a
+    partial file; reads are memory mapped. signed urls are hmac signatures
+    checked by the /storage routes
+    """
+
+    is_local = True
+
+    def __init__(
+        self,
+        root: str,
+        base_url: str,
+        secret: str,
+        signed_url_expiration: timedelta = timedelta(minutes=60),
+        signed_url_refresh: timedelta = timedelta(minutes=10),
+        signed_url_cache_entries: int = 10000,
+    ):
+        super().__init__(
+            signed_url_expiration, signed_url_refresh, signed_url_cache_entries
+        )
+        self.root = os.path.realpath(root)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret.encode()
+        os.makedirs(self.root, exist_ok=True)
+
+    def upload_file(self, file: UploadFile, folder_path: str) -> str:
+        if "." not in file.filename:
+            raise HTTPException(status_code=400, detail="File has no extension")
+
+        ext = file.filename.split(".")[-1]
+        filename = self._generate_unique_filename(ext, folder_path)
+        with self._atomic_write(filename) as f:
+            shutil.copyfileobj(file.file, f, 1024 * 1024)
+        return filename
+
+    def upload_bytes(
+        self, bytes: bytes, folder_path: str, ext: str, mime_type: str
+    ) -> str:
+        return self.upload_bytes_as(
+            bytes, self._generate_unique_filename(ext, folder_path), mime_type
+        )
+
+    def upload_bytes_as(self, bytes: bytes, filename: str, mime_type: str) -> str:
+        with self._atomic_write(filename) as f:
+            f.write(bytes)
+        return filename
+
+    def exists(self, filename: str) -> bool:
+        return os.path.isfile(self.path(filename))
+
+    def delete_file(self, filename: str):
+        try:
+            os.remove(self.path(filename))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        self._forget(filename)
+
+    def generate_upload_urls(self, filenames: list[str]) -> dict[str, str]:
+        return {filename: self._signed_url(filename, "PUT") for filename in filenames}
+
+    def sizes(self, prefix: str) -> dict[str, int]:
+        directory = self.path(prefix.rpartition("/")[0])
+        sizes: dict[str, int] = {}
+        for folder, _, files in os.walk(directory):
+            for name in files:
+                if name.startswith("."):  # writes in progress
+                    continue
+                path = os.path.join(folder, name)
+                filename = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if filename.startswith(prefix):
+                    sizes[filename] = os.path.getsize(path)
+        return sizes
+
+    def compose(self, sources: list[str], filename: str, mime_type: str):
+        with self._atomic_write(filename) as f:
+            for source in sources:
+                with open(self._existing(source), "rb") as part:
+                    shutil.copyfileobj(part, f, 1024 * 1024)
+        for source in sources:
+            try:
+                os.remove(self.path(source))
+            except OSError as e:
+                print(f"Deleting {source} failed: {e}")
+        for folder in {os.path.dirname(self.path(source)) for source in sources}:
+            try:
+                if folder != self.root:
+                    os.rmdir(folder)  # only if empty
+            except OSError:
+                pass
+
+    def read_range(self, filename: str, start: int, end: int) -> bytes:
+        with open(self._existing(filename), "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def open_for_read(self, filename: str, chunk_kb: int = 1024):
+        """the file memory mapped, see open_mapped"""
+        return open_mapped(self._existing(filename))
+
+    @contextmanager
+    def local_copy(self, filename: str):
+        """the file itself, it must not be modified"""
+        yield self._existing(filename)
+
+    def download_to(self, filename: str, path: str):
+        shutil.copyfile(self._existing(filename), path)
+
+    def path(self, filename: str) -> str:
+        """where filename lives on disk, paths leaving the root are rejected"""
+        path = os.path.realpath(os.path.join(self.root, filename))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise HTTPException(status_code=400, detail="Invalid path")
+        return path
+
+    def verify(self, filename: str, method: str, expires: int, signature: str) -> bool:
+        """whether a signed url's query is ours and still valid"""
+        if expires < time.time():
+            return False
+        expected = self._signature(filename, method, expires)
+        return hmac.compare_digest(signature.encode(), expected.encode())
+
+    def _sign(self, filename: str) -> str:
+        return self._signed_url(filename, "GET")
+
+    def _signed_url(self, filename: str, method: str) -> str:
+        expires = int(time.time() + self.signed_url_expiration.total_seconds())
+        signature = self._signature(filename, method, expires)
+        return (
+            f"{self.base_url}/storage/{quote(filename)}"
+            f"?expires={expires}&signature={signature}"
+        )
+
+    def _signature(self, filename: str, method: str, expires: int) -> str:
+        message = f"{method}\n{filename}\n{expires}".encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def _existing(self, filename: str) -> str:
+        path = self.path(filename)
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="File not found")
+        return path
+
+    @contextmanager
+    def _atomic_write(self, filename: str):
+        path = self.path(filename)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=folder, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+
+
+class MappedFile(io.RawIOBase):
+    """
+    read only stream over a memory mapped file, for code written against
+    files (hashing, multipart uploads, decoders) that should not copy the
+    whole file into the heap first
+    """
+
+    def __init__(self, path: str):
+        self.name = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._map) if size is None or size < 0 else self._position + size
+        data = self._map[self._position : end]
+        self._position += len(data)
+        return data
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._map)
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+            self._file.close()
+        super().close()
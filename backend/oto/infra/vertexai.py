@@ -1,11 +1,26 @@
 import json
+import asyncio
+import random
+import threading
+import time
 import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationResponse
+from datetime import timedelta
+from vertexai.generative_models import (
+    GenerativeModel,
+    GenerationResponse,
+    Part,
+    Content,
+)
+from vertexai.preview.caching import CachedContent
 from vertexai.language_models import TextEmbeddingModel, TextEmbeddingInput
+from google.api_core import exceptions as google_exceptions
 from google.oauth2 import service_account
 from functools import lru_cache
+from typing import Optional
 
 from oto.environment import get_settings
+from oto.infra.ledger import get_llm_ledger, current_labels
+from oto.infra.storage import get_storage
 
 
 @lru_cache
@@ -14,9 +29,46 @@ def get_vertexai() -> "VertexAI":
     return VertexAI(
         credentials_path=settings.google_cloud_credential_path,
         region=settings.google_cloud_region,
+        context_cache=settings.vertexai_context_cache,
+        limits={
+            "gemini-2.5-flash": (
+                settings.vertexai_flash_concurrency,
+                settings.vertexai_flash_tokens_per_minute,
+            ),
+            "gemini-2.5-pro": (
+                settings.vertexai_pro_concurrency,
+                settings.vertexai_pro_tokens_per_minute,
+            ),
+            "text-multilingual-embedding-002": (
+                settings.vertexai_embedding_concurrency,
+                settings.vertexai_embedding_tokens_per_minute,
+            ),
+        },
     )
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    rough local estimate: ~4 ascii characters per token, one token per
+    non-ascii (mostly CJK) character
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def file_part(path: str, mime_type: str) -> Part:
+    """
+    a stored file as model input: by uri when the model can read the storage
+    itself (the bucket), else inline, which is limited to ~20MB per request
+    """
+    storage = get_storage()
+    uri = storage.model_uri(path)
+    if uri:
+        return Part.from_uri(uri=uri, mime_type=mime_type)
+    with storage.open_for_read(path) as f:
+        return Part.from_data(data=f.read(), mime_type=mime_type)
+
+
 class Tokens:
     def __init__(
         self,
@@ -31,8 +83,57 @@ class Tokens:
         self.cache_tokens = cache_tokens
 
 
+class ModelLimiter:
+    """
+    concurrency cap and tokens-per-minute bucket of one model,
+    only used from the gateway loop
+    """
+
+    def __init__(self, concurrency: int, tokens_per_minute: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tokens_per_minute = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+
+    async def reserve(self, tokens: int) -> int:
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            self._refill()
+            if self.available >= tokens:
+                self.available -= tokens
+                return tokens
+            await asyncio.sleep((tokens - self.available) / self.tokens_per_minute * 60)
+
+    def settle(self, reserved: int, used: int):
+        # the estimate misses audio and output tokens, charge the real usage
+        self.available -= used - reserved
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(
+            self.tokens_per_minute,
+            self.available + (now - self.updated_at) * self.tokens_per_minute / 60,
+        )
+        self.updated_at = now
+
+
 class VertexAI:
-    def __init__(self, credentials_path: str, region: str):
+    MAX_RETRIES = 3
+    EMBEDDING_BATCH_SIZE = 250  # max instances per embedding request
+    MIN_CONTEXT_CACHE_TOKENS = 2048  # smaller prefixes are rejected by the api
+    RETRYABLE_ERRORS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+    )
+
+    def __init__(
+        self,
+        credentials_path: str,
+        region: str,
+        limits: Optional[dict[str, tuple[int, int]]] = None,
+        context_cache: bool = True,
+    ):
         self.credentials = service_account.Credentials.from_service_account_file(
             credentials_path
         )
@@ -47,6 +148,230 @@ class VertexAI:
             "text-multilingual-embedding-002"
         )
 
+        # every call runs on one gateway loop, so the per model semaphores and
+        # token budgets are shared by all prefect worker threads of the process
+        self.limits = limits or {}
+        self._limiters: dict[str, ModelLimiter] = {}
+        self._loop = asyncio.new_event_loop()
+
+        # transcript prefixes shared by the analysis fan-out, by conversation id
+        self.context_cache_enabled = context_cache
+        self._context_caches: dict[str, CachedContent] = {}
+        self._cached_models: dict[str, GenerativeModel] = {}
+        self._context_lock = threading.Lock()
+        threading.Thread(
+            target=self._loop.run_forever, name="vertexai-gateway", daemon=True
+        ).start()
+
+    def generate(
+        self,
+        model: GenerativeModel,
+        contents,
+        cached_content: Optional[CachedContent] = None,
+        **kwargs,
+    ) -> GenerationResponse:
+        """
+        blocking call, for prefect tasks and other sync callers.
+        with `cached_content`, `contents` continue the cached prefix
+        """
+        return self.run(
+            self._generate(model, contents, cached_content, current_labels(), **kwargs)
+        )
+
+    async def generate_async(
+        self,
+        model: GenerativeModel,
+        contents,
+        cached_content: Optional[CachedContent] = None,
+        **kwargs,
+    ) -> GenerationResponse:
+        """awaitable from any event loop"""
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(
+                self._generate(
+                    model, contents, cached_content, current_labels(), **kwargs
+                ),
+                self._loop,
+            )
+        )
+
+    def generate_many(
+        self, model: GenerativeModel, contents_list: list, **kwargs
+    ) -> list[GenerationResponse]:
+        """fan several requests out through the gateway and wait for all of them"""
+
+        labels = current_labels()
+
+        async def gather():
+            return await asyncio.gather(
+                *(
+                    self._generate(model, contents, None, labels, **kwargs)
+                    for contents in contents_list
+                )
+            )
+
+        return self.run(gather())
+
+    def create_context_cache(
+        self, key: str, text: str, ttl_seconds: int
+    ) -> Optional[CachedContent]:
+        """
+        upload `text` once as a cached prefix for self.model. returns None (and
+        callers send the text inline) when disabled or the text is too short
+        """
+        if not self.context_cache_enabled:
+            return None
+        if estimate_tokens(text) < self.MIN_CONTEXT_CACHE_TOKENS:
+            return None
+        try:
+            cache = CachedContent.create(
+                model_name=self.model_name(self.model),
+                contents=[Content(role="user", parts=[Part.from_text(text)])],
+                ttl=timedelta(seconds=ttl_seconds),
+                display_name=key,
+            )
+        except google_exceptions.GoogleAPICallError as e:
+            print(f"Context cache not created for {key}: {e}")
+            return None
+        with self._context_lock:
+            previous = self._context_caches.pop(key, None)
+            self._context_caches[key] = cache
+        if previous:
+            self._delete_cache(previous)
+        return cache
+
+    def context_cache(self, key: str) -> Optional[CachedContent]:
+        with self._context_lock:
+            return self._context_caches.get(key)
+
+    def delete_context_cache(self, key: str):
+        with self._context_lock:
+            cache = self._context_caches.pop(key, None)
+        if cache:
+            self._delete_cache(cache)
+
+    def _delete_cache(self, cache: CachedContent):
+        with self._context_lock:
+            self._cached_models.pop(cache.name, None)
+        try:
+            cache.delete()
+        except google_exceptions.GoogleAPICallError as e:
+            # expires on its own after the ttl
+            print(f"Context cache {cache.name} not deleted: {e}")
+
+    def _cached_model(self, cache: CachedContent) -> GenerativeModel:
+        with self._context_lock:
+            if cache.name not in self._cached_models:
+                self._cached_models[cache.name] = GenerativeModel.from_cached_content(
+                    cache
+                )
+            return self._cached_models[cache.name]
+
+    def get_embeddings(self, inputs: list[TextEmbeddingInput], **kwargs) -> list:
+        labels = current_labels()
+
+        async def gather():
+            batches = await asyncio.gather(
+                *(
+                    self._get_embeddings(
+                        inputs[i : i + self.EMBEDDING_BATCH_SIZE], labels, **kwargs
+                    )
+                    for i in range(0, len(inputs), self.EMBEDDING_BATCH_SIZE)
+                )
+            )
+            return [embedding for batch in batches for embedding in batch]
+
+        return self.run(gather())
+
+    def run(self, coro):
+        """run a coroutine on the gateway loop and wait for it"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _generate(
+        self,
+        model: GenerativeModel,
+        contents,
+        cached_content: Optional[CachedContent] = None,
+        labels: Optional[dict] = None,
+        **kwargs,
+    ) -> GenerationResponse:
+        name = self.model_name(model)
+        limiter = self._limiter(name)
+        estimated = sum(self._estimate(content) for content in contents)
+        if cached_content is not None:
+            model = self._cached_model(cached_content)
+        # waiting for the limiter is not part of the recorded latency
+        async with limiter.semaphore:
+            reserved = await limiter.reserve(estimated)
+            with get_llm_ledger().measure("vertexai", name, labels=labels) as call:
+                response, call["retries"] = await self._with_retries(
+                    lambda: model.generate_content_async(contents, **kwargs)
+                )
+                usage = response.usage_metadata
+                call["prompt_tokens"] = usage.prompt_token_count
+                call["completion_tokens"] = usage.candidates_token_count
+                call["thoughts_tokens"] = usage.thoughts_token_count
+                call["cached_tokens"] = usage.cached_content_token_count
+        limiter.settle(
+            reserved,
+            usage.prompt_token_count
+            + usage.candidates_token_count
+            + usage.thoughts_token_count,
+        )
+        return response
+
+    async def _get_embeddings(
+        self,
+        inputs: list[TextEmbeddingInput],
+        labels: Optional[dict] = None,
+        **kwargs,
+    ):
+        name = self.embed._model_id.split("/")[-1]
+        limiter = self._limiter(name)
+        estimated = sum(estimate_tokens(i.text) for i in inputs)
+        async with limiter.semaphore:
+            await limiter.reserve(estimated)
+            with get_llm_ledger().measure("embedding", name, labels=labels) as call:
+                embeddings, call["retries"] = await self._with_retries(
+                    lambda: self.embed.get_embeddings_async(inputs, **kwargs)
+                )
+                call["prompt_tokens"] = sum(
+                    int(e.statistics.token_count) for e in embeddings if e.statistics
+                )
+            return embeddings
+
+    async def _with_retries(self, call) -> tuple:
+        """returns the result and the number of retries it took"""
+        attempt = 0
+        while True:
+            try:
+                return await call(), attempt
+            except self.RETRYABLE_ERRORS:
+                if attempt >= self.MAX_RETRIES:
+                    raise
+                await asyncio.sleep(random.uniform(0, 2 ** (attempt + 1)))
+                attempt += 1
+
+    def model_name(self, model: GenerativeModel) -> str:
+        return model._model_name.split("/")[-1]
+
+    def _limiter(self, name: str) -> ModelLimiter:
+        if name not in self._limiters:
+            concurrency, tokens_per_minute = self.limits.get(name, (8, 1_000_000))
+            self._limiters[name] = ModelLimiter(concurrency, tokens_per_minute)
+        return self._limiters[name]
+
+    def _estimate(self, content) -> int:
+        if isinstance(content, str):
+            return estimate_tokens(content)
+        if isinstance(content, Part):
+            try:
+                return estimate_tokens(content.text)
+            except (AttributeError, ValueError):
+                # audio / file parts, charged after the call from usage_metadata
+                return 0
+        return 0
+
     def notify_response(self, response: GenerationResponse, model: GenerativeModel):
         print(
             {
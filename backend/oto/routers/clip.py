@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Response
-from sqlmodel import select, Session
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
-from oto.infra.database import get_db_session
+from oto.infra.database import get_async_db_session
 from oto.infra.storage import get_storage
 from oto.domain.clip import Clip
 from oto.routers.deps.auth import require_user_id, require_clip
@@ -42,7 +44,7 @@ async def get_clip_comment_audio_url(
 @router.get("/list")
 async def list_clips(
     user_id: str = Depends(require_user_id),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
     conversation_id: Optional[str] = Query(
         default=None, description="Filter clips by conversation ID"
     ),
@@ -56,7 +58,14 @@ async def list_clips(
     if conversation_id:
         query = query.where(Clip.conversation_id == conversation_id)
 
-    clips = session.exec(query.order_by(Clip.created_at.desc()).limit(limit)).all()
+    clips = (
+        await session.exec(query.order_by(Clip.created_at.desc()).limit(limit))
+    ).all()
+    # one signing pass for every clip, mostly served from the url cache
+    urls = await run_in_threadpool(
+        get_storage().generate_signed_urls,
+        [path for clip in clips for path in (clip.file_path, clip.comment_file_path)],
+    )
 
     return {
         "clips": [
@@ -71,6 +80,8 @@ async def list_clips(
                 "description": clip.description,
                 "comment": clip.comment,
                 "captions": clip.get_clip_data().captions,
+                "audio_url": urls[clip.file_path],
+                "comment_audio_url": urls[clip.comment_file_path],
             }
             for clip in clips
         ],
@@ -1,50 +1,58 @@
 import asyncio
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 from fastapi import APIRouter, UploadFile, Depends, HTTPException, Query, Body, Path
-from sqlmodel import select, Session
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 from oto.infra.storage import get_storage
-from oto.infra.database import get_db_session
+from oto.infra.database import get_async_db_session
 from oto.domain.conversation import Conversation
+from oto.domain.upload import UploadSession
+from oto.environment import get_settings
+from oto.services.content import media
 from oto.routers.deps.auth import require_user_id, require_conversation
 from prefect.deployments import run_deployment
-from oto.services.safety import check_conversation_limit_exceeded
+from oto.services.safety import check_conversation_limit_exceeded_async
 from oto.infra.job import get_prefect_job_manager
+from oto.infra.cache import hash_stream
 from prefect.exceptions import ObjectNotFound
 
 router = APIRouter(prefix="/conversation")
 
 
-@router.post("/create")
-async def create_conversation(
-    file: UploadFile,
-    user_id: str = Depends(require_user_id),
-    session: Session = Depends(get_db_session),
-):
-    if not file.content_type.startswith("audio/"):
+MEGABYTE = 1024 * 1024
+MAX_COMPOSE_PARTS = 32  # sources of one compose request
+
+
+class UploadRequest(BaseModel):
+    file_name: str
+    mime_type: str
+    size: int  # bytes
+
+
+async def validate_upload(mime_type: str, size: int, session: AsyncSession):
+    if not mime_type.startswith("audio/"):
         raise HTTPException(status_code=400, detail="File is not an audio file")
 
-    # 300MB
-    if file.size > 300 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File is too large (max 300MB)")
+    max_megabytes = get_settings().upload_max_megabytes
+    if size > max_megabytes * MEGABYTE:
+        raise HTTPException(
+            status_code=400, detail=f"File is too large (max {max_megabytes}MB)"
+        )
 
     try:
-        check_conversation_limit_exceeded()
+        await check_conversation_limit_exceeded_async(session)
     except Exception as _:
         raise HTTPException(status_code=503, detail="Our server reached its limit")
 
-    storage = get_storage()
-    filepath = storage.upload_file(file, f"uploads/{user_id}")
 
-    conversation = Conversation(
-        user_id=user_id,
-        file_name=file.filename,
-        file_path=filepath,
-        mime_type=file.content_type,
-    )
+async def start_processing(
+    conversation: Conversation, user_id: str, session: AsyncSession
+) -> dict:
     session.add(conversation)
-    session.flush()
-    session.refresh(conversation)
-    session.commit()
+    await session.commit()
 
     flow_run = await run_deployment(
         name="process_conversation/process_conversation",
@@ -53,7 +61,8 @@ async def create_conversation(
     )
 
     prefect = get_prefect_job_manager()
-    prefect.put_job(
+    await run_in_threadpool(
+        prefect.put_job,
         job_type="process_conversation",
         flow_run_id=str(flow_run.id),
         conversation_id=conversation.id,
@@ -67,10 +76,235 @@ async def create_conversation(
     }
 
 
+@router.post("/create")
+async def create_conversation(
+    file: UploadFile,
+    user_id: str = Depends(require_user_id),
+    session: AsyncSession = Depends(get_async_db_session),
+):
+    """upload through the api, /upload is preferred for large files"""
+    await validate_upload(file.content_type, file.size, session)
+
+    # hashing and uploading block, keep them off the event loop
+    content_hash = await run_in_threadpool(hash_stream, file.file)
+
+    storage = get_storage()
+    filepath = await run_in_threadpool(storage.upload_file, file, f"uploads/{user_id}")
+
+    conversation = Conversation(
+        user_id=user_id,
+        file_name=file.filename,
+        file_path=filepath,
+        mime_type=file.content_type,
+        content_hash=content_hash,
+    )
+    return await start_processing(conversation, user_id, session)
+
+
+@router.post("/upload")
+async def create_upload(
+    request: UploadRequest,
+    user_id: str = Depends(require_user_id),
+    session: AsyncSession = Depends(get_async_db_session),
+):
+    """
+    first half of a direct upload: signed PUT urls for the parts of the file,
+    which the client uploads in parallel before calling /complete
+    """
+    await validate_upload(request.mime_type, request.size, session)
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="File is empty")
+    if "." not in request.file_name:
+        raise HTTPException(status_code=400, detail="File has no extension")
+
+    settings = get_settings()
+    part_size = max(
+        settings.upload_part_megabytes * MEGABYTE,
+        math.ceil(request.size / MAX_COMPOSE_PARTS),
+    )
+    storage = get_storage()
+    upload = UploadSession(
+        user_id=user_id,
+        expires_at=datetime.now() + timedelta(minutes=settings.upload_session_minutes),
+        file_name=request.file_name,
+        file_path=storage.unique_filename(
+            request.file_name.split(".")[-1], f"uploads/{user_id}"
+        ),
+        mime_type=request.mime_type,
+        size=request.size,
+        part_size=part_size,
+        part_count=math.ceil(request.size / part_size),
+    )
+    parts = [upload.part_path(number) for number in range(upload.part_count)]
+    urls = await run_in_threadpool(storage.generate_upload_urls, parts)
+    session.add(upload)
+    await session.commit()
+
+    return {
+        "upload_id": upload.id,
+        "part_size": upload.part_size,
+        "parts": [
+            {"number": number, "url": urls[part]} for number, part in enumerate(parts)
+        ],
+        "expires_at": upload.expires_at,
+    }
+
+
+def assemble_upload(upload: UploadSession):
+    """
+    compose the uploaded parts into the final file, once they are all there
+    and add up to the declared size. the parts are deleted by composing, a
+    file composed by an attempt that died before recording it is kept
+    """
+    storage = get_storage()
+    if storage.exists(upload.file_path):
+        return
+    sizes = storage.sizes(f"{upload.file_path}.parts/")
+    parts = [upload.part_path(number) for number in range(upload.part_count)]
+    missing = [number for number, part in enumerate(parts) if part not in sizes]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing parts: {', '.join(str(number) for number in missing)}",
+        )
+    if sum(sizes[part] for part in parts) != upload.size:
+        raise HTTPException(
+            status_code=400, detail="Uploaded size does not match the declared size"
+        )
+    storage.compose(parts, upload.file_path, upload.mime_type)
+
+
+def is_audio_upload(upload: UploadSession) -> bool:
+    """the composed file starts like audio"""
+    head = get_storage().read_range(upload.file_path, 0, 127)
+    return media.sniff_format(head) is not None
+
+
+async def set_upload_status(session: AsyncSession, upload_id: str, status: str):
+    await session.exec(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .values(status=status, claimed_at=datetime.now())
+    )
+    await session.commit()
+
+
+async def claim_upload(
+    session: AsyncSession, upload: UploadSession, status: str
+) -> bool:
+    """
+    move the upload to status if nobody changed it since it was loaded, in
+    one statement so only one of concurrent requests gets it
+    """
+    claimed_at = (
+        UploadSession.claimed_at.is_(None)
+        if upload.claimed_at is None
+        else UploadSession.claimed_at == upload.claimed_at
+    )
+    now = datetime.now()
+    result = await session.exec(
+        update(UploadSession)
+        .where(
+            UploadSession.id == upload.id,
+            UploadSession.status == upload.status,
+            claimed_at,
+        )
+        .values(status=status, claimed_at=now)
+    )
+    await session.commit()
+    if result.rowcount != 1:
+        return False
+    upload.status, upload.claimed_at = status, now
+    return True
+
+
+# a claimed step, and the state a claim older than upload_claim_minutes
+# (the request died) is taken again from
+CLAIMED_UPLOAD_STEPS = {"assembling": "pending", "starting": "composed"}
+
+
+@router.post("/upload/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str = Path(...),
+    user_id: str = Depends(require_user_id),
+    session: AsyncSession = Depends(get_async_db_session),
+):
+    """
+    second half of a direct upload: verify, then create and process.
+    pending -> assembling -> composed -> starting -> completed, a request
+    claims the upload for each step. starting is committed as soon as the
+    parts are composed, a failure after that leaves it composed: the parts
+    are gone and the next call checks the file and starts processing
+    """
+    upload = await session.get(UploadSession, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    step = upload.status
+    if step in CLAIMED_UPLOAD_STEPS:
+        claim_minutes = get_settings().upload_claim_minutes
+        if upload.claimed_at > datetime.now() - timedelta(minutes=claim_minutes):
+            raise HTTPException(status_code=409, detail="Upload is being completed")
+        step = CLAIMED_UPLOAD_STEPS[step]
+    if step not in ("pending", "composed"):
+        raise HTTPException(status_code=409, detail=f"Upload is {step}")
+    if step == "pending" and upload.expires_at < datetime.now():
+        raise HTTPException(status_code=410, detail="Upload expired")
+
+    claim = "assembling" if step == "pending" else "starting"
+    if not await claim_upload(session, upload, claim):
+        raise HTTPException(status_code=409, detail="Upload is being completed")
+
+    if claim == "assembling":
+        try:
+            await run_in_threadpool(assemble_upload, upload)
+        except BaseException:
+            # missing parts: pending, so they can still be uploaded
+            await set_upload_status(session, upload_id, "pending")
+            raise
+        # composed, still claimed by this request
+        await set_upload_status(session, upload_id, "starting")
+
+    failed = False
+    try:
+        if not await run_in_threadpool(is_audio_upload, upload):
+            failed = True
+            await run_in_threadpool(get_storage().delete_file, upload.file_path)
+            raise HTTPException(status_code=400, detail="File is not an audio file")
+
+        # a conversation created by an earlier attempt is reused
+        conversation = (
+            await session.get(Conversation, upload.conversation_id)
+            if upload.conversation_id
+            else None
+        )
+        if conversation is None:
+            # hashed by the flow, the file never passes through here
+            conversation = Conversation(
+                user_id=user_id,
+                file_name=upload.file_name,
+                file_path=upload.file_path,
+                mime_type=upload.mime_type,
+            )
+            upload.conversation_id = conversation.id
+            session.add(upload)
+        response = await start_processing(conversation, user_id, session)
+    except BaseException:
+        await session.rollback()
+        await set_upload_status(session, upload_id, "failed" if failed else "composed")
+        raise
+
+    upload.status = "completed"
+    session.add(upload)
+    await session.commit()
+    return response
+
+
 @router.get("/list")
 async def list_conversations(
     user_id: str = Depends(require_user_id),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
     start: datetime = Query(default=None),
     end: datetime = Query(default=None),
 ):
@@ -79,8 +313,8 @@ async def list_conversations(
         query = query.where(Conversation.created_at >= start)
     if end:
         query = query.where(Conversation.created_at <= end)
-    conversations = session.exec(
-        query.order_by(Conversation.created_at.desc()).limit(30)
+    conversations = (
+        await session.exec(query.order_by(Conversation.created_at.desc()).limit(30))
     ).all()
     return conversations
 
@@ -95,7 +329,7 @@ async def get_conversation(
 @router.patch("/{conversation_id}")
 async def patch_metadata(
     conversation: Conversation = Depends(require_conversation),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
     place: str = Body(default=None),
     location: str = Body(default=None),
 ):
@@ -104,8 +338,7 @@ async def patch_metadata(
     if location:
         conversation.location = location
     session.add(conversation)
-    session.commit()
-    session.refresh(conversation)
+    await session.commit()
     return conversation
 
 
@@ -114,7 +347,9 @@ async def get_conversation_job_status(
     conversation: Conversation = Depends(require_conversation),
 ):
     prefect = get_prefect_job_manager()
-    job = prefect.get_job("process_conversation", conversation.id)
+    job = await run_in_threadpool(
+        prefect.get_job, "process_conversation", conversation.id
+    )
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     try:
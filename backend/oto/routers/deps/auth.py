@@ -1,7 +1,10 @@
+import hmac
 from fastapi import Header, HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Path, Depends
-from oto.infra.database import create_db_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from oto.environment import get_settings
+from oto.infra.database import get_async_db_session
 from oto.domain.conversation import Conversation
 from oto.domain.clip import Clip
 from oto.infra.auth import get_auth_service
@@ -22,30 +25,46 @@ async def require_user_id(
     return user_id
 
 
+async def require_admin(
+    creds: HTTPAuthorizationCredentials = Security(bearer_scheme),
+):
+    """operational routes, for the ADMIN_TOKEN bearer. not found when unset"""
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if creds is None or not hmac.compare_digest(
+        creds.credentials.encode(), token.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing credentials",
+        )
+
+
 async def require_conversation(
     conversation_id: str = Path(..., alias="conversation_id"),
     user_id: str = Depends(require_user_id),
+    session: AsyncSession = Depends(get_async_db_session),
 ) -> Conversation:
-    with create_db_session() as session:
-        conversation = session.get(Conversation, conversation_id)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-        if conversation.user_id != user_id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        return conversation
+    conversation = await session.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if conversation.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return conversation
 
 
 async def require_clip(
     clip_id: str = Path(..., alias="clip_id"),
     user_id: str = Depends(require_user_id),
+    session: AsyncSession = Depends(get_async_db_session),
 ) -> Clip:
-    with create_db_session() as session:
-        clip = session.get(Clip, clip_id)
-        if not clip:
-            raise HTTPException(status_code=404, detail="Clip not found")
-        if clip.user_id != user_id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        return clip
+    clip = await session.get(Clip, clip_id)
+    if not clip:
+        raise HTTPException(status_code=404, detail="Clip not found")
+    if clip.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return clip
 
 
 def verify_token(token: str, user_id: str) -> bool:
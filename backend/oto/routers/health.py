@@ -1,4 +1,10 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Query
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from oto.infra.cache import get_result_cache
+from oto.infra.ledger import get_llm_ledger
+from oto.infra.sieve import get_sieve_job_manager
+from oto.routers.deps.auth import require_admin
 
 router = APIRouter(prefix="/health")
 
@@ -6,3 +12,32 @@ router = APIRouter(prefix="/health")
 @router.get("")
 async def health():
     return {"status": "ok"}
+
+
+@router.get("/cache", dependencies=[Depends(require_admin)])
+async def cache_stats():
+    """Result cache hit/miss counters per service"""
+    stats = await run_in_threadpool(get_result_cache().stats)
+    return {
+        "services": stats,
+        "hits": sum(s.hits for s in stats),
+        "misses": sum(s.misses for s in stats),
+    }
+
+
+@router.get("/llm", dependencies=[Depends(require_admin)])
+async def llm_call_stats(hours: float = Query(default=24, gt=0, le=24 * 30)):
+    """Latency percentiles and usage of model calls per service and model"""
+    stats = await run_in_threadpool(
+        get_llm_ledger().stats, datetime.now() - timedelta(hours=hours)
+    )
+    return {"hours": hours, "stages": stats}
+
+
+@router.get("/sieve", dependencies=[Depends(require_admin)])
+async def sieve_job_stats(hours: float = Query(default=24, gt=0, le=24 * 30)):
+    """Queue and processing time percentiles of sieve jobs per function"""
+    stats = await run_in_threadpool(
+        get_sieve_job_manager().stats, datetime.now() - timedelta(hours=hours)
+    )
+    return {"hours": hours, "functions": stats}
@@ -0,0 +1,49 @@
+import os
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from oto.infra.storage import LocalStorage, get_storage
+
+router = APIRouter(prefix="/storage")
+
+
+def require_signed(filename: str, method: str, expires: int, signature: str):
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not storage.verify(filename, method, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    return storage
+
+
+@router.get("/{filename:path}")
+async def get_file(
+    filename: str,
+    expires: int = Query(...),
+    signature: str = Query(...),
+):
+    """Download a file of the local storage backend through a signed URL"""
+    storage = require_signed(filename, "GET", expires, signature)
+    path = storage.path(filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(path)
+
+
+@router.put("/{filename:path}")
+async def put_file(
+    filename: str,
+    request: Request,
+    expires: int = Query(...),
+    signature: str = Query(...),
+):
+    """Upload a file to the local storage backend through a signed URL"""
+    storage = require_signed(filename, "PUT", expires, signature)
+    body = await request.body()
+    await run_in_threadpool(
+        storage.upload_bytes_as,
+        body,
+        filename,
+        request.headers.get("content-type", "application/octet-stream"),
+    )
+    return {"status": "ok"}
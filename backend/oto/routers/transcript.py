@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session
-from oto.infra.database import get_db_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from oto.infra.database import get_async_db_session
 from oto.domain.conversation import Conversation
 from oto.routers.deps.auth import require_conversation
-from oto.domain.transcript import Captions, Transcript, TranscriptResponse
+from oto.domain.transcript import Transcript, TranscriptResponse
 
 
 router = APIRouter(prefix="/transcript")
@@ -12,13 +12,13 @@ router = APIRouter(prefix="/transcript")
 @router.get("/{conversation_id}")
 async def get_transcript(
     conversation: Conversation = Depends(require_conversation),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
 ):
-    transcript = session.get(Transcript, conversation.id)
+    transcript = await session.get(Transcript, conversation.id)
     if not transcript:
         raise HTTPException(status_code=404, detail="Transcript not found")
 
-    captions = Captions.model_validate_json(transcript.captions_dump)
+    captions = transcript.get_captions()
 
     return TranscriptResponse(
         id=transcript.id,
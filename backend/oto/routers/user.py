@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session
-from oto.infra.database import get_db_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from oto.infra.database import get_async_db_session
 from oto.domain.user import User, UpdateUser
 from oto.routers.deps.auth import require_user_id
 
@@ -10,10 +10,10 @@ router = APIRouter(prefix="/user")
 @router.post("/create")
 async def create_user(
     user_id: str = Depends(require_user_id),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
 ):
     session.add(User(id=user_id))
-    session.commit()
+    await session.commit()
 
     return {"id": user_id}
 
@@ -21,9 +21,9 @@ async def create_user(
 @router.get("/get")
 async def get_user(
     user_id: str = Depends(require_user_id),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
 ):
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
 
     return user
 
@@ -32,9 +32,9 @@ async def get_user(
 async def update_user(
     body: UpdateUser,
     user_id: str = Depends(require_user_id),
-    session: Session = Depends(get_db_session),
+    session: AsyncSession = Depends(get_async_db_session),
 ):
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         user = User(id=user_id)
 
@@ -45,6 +45,6 @@ async def update_user(
         setattr(user, key, value)
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
     return {"id": user_id}
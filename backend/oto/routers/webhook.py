@@ -0,0 +1,25 @@
+import hmac
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from oto.environment import get_settings
+from oto.infra.sieve import store_webhook_job
+
+router = APIRouter(prefix="/webhooks")
+
+
+@router.post("/sieve")
+async def sieve_webhook(request: Request, token: str = Query(default="")):
+    """Job completion callback registered by the sieve job manager"""
+    secret = get_settings().sieve_webhook_secret
+    if not secret:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(token.encode(), secret.encode()):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    payload = await request.json()
+    # {"type": "job.complete", "body": {job}}
+    job = payload.get("body", payload) if isinstance(payload, dict) else None
+    if not isinstance(job, dict) or "id" not in job:
+        raise HTTPException(status_code=400, detail="Missing job")
+    await run_in_threadpool(store_webhook_job, job)
+    return {"status": "ok"}
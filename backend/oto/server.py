@@ -8,6 +8,8 @@ from oto.routers.transcript import router as transcript_router
 from oto.routers.analysis import router as analysis_router
 from oto.routers.trend import router as trend_router
 from oto.routers.clip import router as clip_router
+from oto.routers.webhook import router as webhook_router
+from oto.routers.storage import router as storage_router
 from fastapi.middleware.cors import CORSMiddleware
 
 create_db_and_tables()
@@ -30,3 +32,5 @@ app.include_router(transcript_router)
 app.include_router(analysis_router)
 app.include_router(trend_router)
 app.include_router(clip_router)
+app.include_router(webhook_router)
+app.include_router(storage_router)
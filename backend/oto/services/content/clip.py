@@ -1,20 +1,32 @@
-from oto.infra.vertexai import VertexAI, get_vertexai
+from oto.infra.vertexai import VertexAI, file_part, get_vertexai
 from vertexai.generative_models import Part, GenerationConfig, SafetySetting
 from functools import lru_cache
-from oto.environment import get_settings
 from oto.domain.clip import ClipDatas, ClipCaptions
+from oto.domain.transcript import ColumnarTranscript
+from oto.domain.timeline import format_timecodes, parse_timecodes
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 
 
 @lru_cache
 def get_clip_generator_service() -> "ClipGeneratorService":
-    settings = get_settings()
-    return ClipGeneratorService(get_vertexai(), settings.google_cloud_bucket_name)
+    return ClipGeneratorService(get_vertexai(), get_transcript_compaction_service())
 
 
 class ClipGeneratorService:
-    def __init__(self, vertexai: VertexAI, bucket_name: str):
+    PROMPT_VERSION = "2"  # bump to invalidate cached results
+    # words per transcript line, short lines give the model finer timecodes
+    LINE_CAPTIONS = 12
+
+    def __init__(
+        self,
+        vertexai: VertexAI,
+        compaction: TranscriptCompactionService,
+    ):
         self.vertexai = vertexai
-        self.bucket_name = bucket_name
+        self.compaction = compaction
         self.generation_config = GenerationConfig(
             max_output_tokens=65535,
             temperature=1,
@@ -49,7 +61,8 @@ class ClipGeneratorService:
             Part.from_data(audio_buffer, mime_type),
         ]
 
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model_large,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
@@ -92,12 +105,11 @@ class ClipGeneratorService:
     def generate(self, audio_file_path: str, mime_type: str) -> ClipDatas:
         messages = [
             self._prompt(),
-            Part.from_uri(
-                uri=f"gs://{self.bucket_name}/{audio_file_path}", mime_type=mime_type
-            ),
+            file_part(audio_file_path, mime_type),
         ]
 
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model_large,
             messages,
             generation_config=self.generation_config,
             safety_settings=self.safety_settings,
@@ -105,12 +117,55 @@ class ClipGeneratorService:
 
         self.vertexai.notify_response(response, self.vertexai.model_large)
 
-        messages.append(self._prompt_2())
+        return self._refine(messages, response.text, self.generation_config)
+
+    def generate_from_transcript(self, transcript: ColumnarTranscript) -> ClipDatas:
+        """
+        same selection as generate, but from the text of the transcript instead
+        of the audio. the ranges the model picks are snapped to word boundaries
+        """
+        messages = [
+            self.compaction.render(transcript.to_captions(), self.LINE_CAPTIONS),
+            self._prompt_transcript(),
+        ]
+        generation_config = GenerationConfig(max_output_tokens=65535, temperature=1)
+
+        print("Stage 1/3: selecting from the transcript...")
+        response = self.vertexai.generate(
+            self.vertexai.model_large,
+            messages,
+            generation_config=generation_config,
+            safety_settings=self.safety_settings,
+        )
+
+        self.vertexai.notify_response(response, self.vertexai.model_large)
+
+        clip_datas = self._refine(messages, response.text, generation_config)
+        timeline = transcript.timeline()
+        for clip_data in clip_datas.root:
+            captions = clip_data.captions.root
+            starts, ends = timeline.snap_ranges(
+                parse_timecodes([c.timecode_start for c in captions]),
+                parse_timecodes([c.timecode_end for c in captions]),
+            )
+            for caption, start, end in zip(
+                captions, format_timecodes(starts), format_timecodes(ends)
+            ):
+                caption.timecode_start = start
+                caption.timecode_end = end
+        return clip_datas
+
+    def _refine(
+        self, messages: list, selection: str, generation_config: GenerationConfig
+    ) -> ClipDatas:
+        """stages 2 and 3: rework the selection, then structure it"""
+        messages = [*messages, selection, self._prompt_2()]
 
         print("Stage 2/3: refining...")
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model_large,
             messages,
-            generation_config=self.generation_config,
+            generation_config=generation_config,
             safety_settings=self.safety_settings,
         )
 
@@ -122,7 +177,8 @@ class ClipGeneratorService:
         ]
 
         print("Stage 3/3: structuring...")
-        response = self.vertexai.model_large.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model_large,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
@@ -177,6 +233,20 @@ class ClipGeneratorService:
 
 そしてその切り抜きの前に、煽り者がいうべきセリフも付け加えてください。"彼は...と, ...といったのです。これを聞いてください" などといった煽りを短的に1文で。"""
 
+    def _prompt_transcript(self) -> str:
+        return """これは会話の文字起こしです。各行は `[開始-終了] 話者: 発言` の形式です。この会話から切り抜きのトランスクリプトとタイムスタンプを作成してください。
+
+切り抜く場所についてですが、どんなにイタズラな切り抜き、あまりに取り上げ方が湾曲している、こういったあらゆるテクニックを許容して、むしろ用いて、特別な切り抜きを作り上げてください。つまり恣意的な切り抜きによって、この会話している人物がとてつもなく素晴らしい人間であり、仮にコンテンツとして拡散したら、とてつもなく人気になってしまうであろう切り取りモーメントを作り上げることがあなたの目的です。
+
+切り抜きを聞いた時に、数秒で驚き、興味を惹かれ、話を聞き、納得で終わる。そのような壮大な美しく楽しめる切り抜きである必要があります。魅力を最大限に引き出し、モーメントを作成しましょう。
+起承転結、ハリウッド構成、あらゆるテクニックを駆使して切り抜いてください。
+
+さて、そのようなモーメントを3つ挙げてください。それぞれ、30秒以内であることが好ましいでしょう。不要な部分は抜いて、タイムスタンプのレンジ一覧とその文字起こしで示すことができます。
+
+そしてその切り抜きの前に、煽り者がいうべきセリフも付け加えてください。"彼は...と, ...といったのです。これを聞いてください" などといった煽りを短的に1文で。
+
+タイムスタンプは文字起こしの時刻を元に `HH:MM:SS` の形式で示してください。"""
+
     def _prompt_2(self) -> str:
         return """精査してください。少し文脈から外れすぎているものを抜いたり、調整したり。
 切り抜きのタイムスタンプの順序を入れ替えたりして、もっとドラマティックな表現にしてください。典型的には結論を最初に持ってくるなど。順序なんて気にするな。ただし文脈は正しく、邪魔なものは入れない。
@@ -1,13 +1,153 @@
+import math
+import subprocess
+from typing import Optional
 from pydub import AudioSegment
+from pydub.audio_segment import fix_wav_headers
+from pydub.utils import mediainfo_json
 from oto.infra.vertexai import VertexAI, get_vertexai
 from vertexai.generative_models import Part, GenerationConfig
 from functools import lru_cache
 from oto.environment import get_settings
 from oto.domain.clip import ClipDatas, ClipCaptions
 from typing import BinaryIO
-from io import BytesIO
 import pydub
 from oto.infra.storage import get_storage
+from oto.services.content.sample_buffer import SampleBuffer
+from oto.domain.timeline import (
+    IntervalSet,
+    TimelineIndex,
+    format_timecodes,
+    parse_timecodes,
+)
+
+
+class AudioRangeReader:
+    """
+    decodes only the requested time ranges of a local audio file.
+
+    windows start on whole seconds, so a position maps to the same frame as
+    in a full decode (pydub rounds ms to frames from the start of the file),
+    and start PAD_SECONDS early so the decoder has settled when they are used
+    """
+
+    PAD_SECONDS = 2
+    WINDOW_SECONDS = 60
+    EOF_TOLERANCE_SECONDS = 0.5
+    # demuxers whose seeking is not sample exact (opus in webm lands a few ms
+    # off), these are decoded from the start and trimmed by sample count
+    INEXACT_SEEK_FORMATS = {"matroska", "webm"}
+
+    def __init__(self, path: str):
+        self.path = path
+        info = mediainfo_json(path)
+        self.acodec = self._acodec(info)
+        self.sample_rate = self._sample_rate(info)
+        self.seekable = self.sample_rate is None or not (
+            set(info.get("format", {}).get("format_name", "").split(","))
+            & self.INEXACT_SEEK_FORMATS
+        )
+        self.duration: Optional[float] = None  # known once the end was decoded
+        self.window: Optional[SampleBuffer] = None
+        self.window_start = 0
+        self.valid_from = 0.0
+        self.window_end = 0.0
+
+    def slice(self, start_time: float, end_time: float) -> SampleBuffer:
+        """same samples as AudioSegment.from_file(path)[start * 1000 : end * 1000]"""
+        self._ensure(start_time, end_time)
+        window = self.window
+        offset = self.window_start * window.frame_rate
+        # callers clamp to the duration in seconds, anything past the decoded
+        # audio is simply cut off
+        start, end = (
+            min(window.frame_at(ms) - offset, window.frame_count)
+            for ms in (start_time * 1000, end_time * 1000)
+        )
+        return window.slice_frames(start, end)
+
+    def _ensure(self, start_time: float, end_time: float):
+        if (
+            self.window is not None
+            and self.valid_from <= start_time
+            and end_time <= self.window_end
+        ):
+            return
+        self.window_start = max(0, math.floor(start_time) - self.PAD_SECONDS)
+        self.valid_from = (
+            self.window_start + self.PAD_SECONDS if self.window_start else 0
+        )
+        self.window_end = max(
+            math.ceil(end_time) + 1, self.window_start + self.WINDOW_SECONDS
+        )
+        duration = self.window_end - self.window_start
+        self.window = SampleBuffer.from_segment(
+            self._decode(self.window_start, duration)
+        )
+        # some containers trim a few ms of encoder delay, anything shorter
+        # than that means the file ended inside the window
+        missing = duration - self.window.duration_seconds
+        if missing > self.EOF_TOLERANCE_SECONDS and (
+            self.window.frame_count or not self.window_start
+        ):
+            rate = self.window.frame_rate
+            self.duration = (self.window_start * rate + self.window.frame_count) / rate
+            self.window_end = math.inf
+
+    def _decode(self, start: int, duration: int) -> AudioSegment:
+        command = [AudioSegment.converter, "-y"]
+        if start > 0 and self.seekable:
+            command += ["-ss", str(start)]
+        command += ["-i", self.path]
+        if self.acodec:
+            command += ["-acodec", self.acodec]
+        command += ["-vn", "-f", "wav"]
+        if self.seekable:
+            command += ["-t", str(duration)]
+        else:
+            first = start * self.sample_rate
+            last = (start + duration) * self.sample_rate
+            command += ["-af", f"atrim=start_sample={first}:end_sample={last}"]
+        command += ["-"]
+        p = subprocess.run(command, capture_output=True)
+        if p.returncode != 0 or len(p.stdout) == 0:
+            raise Exception(
+                f"Decoding failed: {p.stderr.decode(errors='ignore')[-1000:]}"
+            )
+        data = bytearray(p.stdout)
+        fix_wav_headers(data)
+        return AudioSegment(bytes(data))
+
+    def _sample_rate(self, info: dict) -> Optional[int]:
+        for stream in info.get("streams", []):
+            if stream["codec_type"] == "audio" and stream.get("sample_rate"):
+                return int(stream["sample_rate"])
+        return None
+
+    def _acodec(self, info: dict) -> Optional[str]:
+        """same output sample format as AudioSegment.from_file picks"""
+        audio_streams = [
+            s for s in info.get("streams", []) if s["codec_type"] == "audio"
+        ]
+        if not audio_streams:
+            return None
+        stream = audio_streams[0]
+        if stream.get("sample_fmt") == "fltp" and stream.get("codec_name") in [
+            "mp3",
+            "mp4",
+            "aac",
+            "webm",
+            "ogg",
+        ]:
+            bits_per_sample = 16
+        else:
+            bits_per_sample = stream["bits_per_sample"]
+        if not bits_per_sample:
+            # not reported by float decoders like opus, where pydub would ask
+            # for pcm_s0le; ffmpeg's default is 16 bit
+            return None
+        if bits_per_sample == 8:
+            return "pcm_u8"
+        return "pcm_s%dle" % bits_per_sample
 
 
 @lru_cache
@@ -17,70 +157,99 @@ def get_clip_construct_service() -> "ClipConstructService":
 
 
 class ClipConstructService:
+    JOIN_FADE_MS = 5  # short ramps against clicks where captions are joined
+    PAD_SECONDS = 1  # kept around every caption when it overlaps no other
+
     def __init__(self, vertexai: VertexAI, bucket_name: str):
         self.vertexai = vertexai
         self.bucket_name = bucket_name
 
-    def construct(self, audio_data: BinaryIO, clip_datas: ClipDatas) -> ClipDatas:
-        audio_segment: AudioSegment = AudioSegment.from_file(audio_data)
-        audio_duration = audio_segment.duration_seconds
+    def construct(
+        self,
+        audio_path: str,
+        clip_datas: ClipDatas,
+        timeline: Optional[TimelineIndex] = None,
+    ) -> ClipDatas:
+        """
+        audio_path is a local file (see storage.local_copy), only the ranges
+        around the captions are decoded. with the transcript's timeline the
+        padding around every caption stops short of words it would cut into
+        """
+        reader = AudioRangeReader(audio_path)
 
         for clip_data in clip_datas.root:
-            clip = AudioSegment.empty()
-            contained_ranges: list[tuple[float, float]] = []
-            for caption in clip_data.captions.root:
-                start_time = self.timecode_to_seconds(caption.timecode_start)
+            captions = clip_data.captions.root
+            starts = parse_timecodes([c.timecode_start for c in captions])
+            ends = parse_timecodes([c.timecode_end for c in captions])
+            pieces: list[SampleBuffer] = []
+            contained = IntervalSet()
+            source_ranges: list[tuple[float, float, float]] = []
+            offset = 0.0
+            for start_time, end_time in zip(starts.tolist(), ends.tolist()):
                 # include -1 seconds if not overlapping with other captions
-                if not self.is_already_contained(start_time - 1, contained_ranges):
-                    start_time = start_time - 1
+                if not contained.contains(start_time - self.PAD_SECONDS):
+                    padded = start_time - self.PAD_SECONDS
+                    if timeline is not None:
+                        padded = min(timeline.snap(padded, 1), start_time)
+                    start_time = padded
                 if start_time < 0:
                     start_time = 0
-                end_time = self.timecode_to_seconds(caption.timecode_end)
                 # include +1 seconds if not overlapping with other captions
-                if not self.is_already_contained(end_time + 1, contained_ranges):
-                    end_time = end_time + 1
-                if end_time > audio_duration:
-                    end_time = audio_duration
-
-                contained_ranges.append((start_time, end_time))
-                clip += audio_segment[start_time * 1000 : end_time * 1000]
-            bytes_io = BytesIO()
-            clip.export(bytes_io, format="wav")
-            clip_data.audio = bytes_io.getvalue()
-            bytes_io.close()
+                if not contained.contains(end_time + self.PAD_SECONDS):
+                    padded = end_time + self.PAD_SECONDS
+                    if timeline is not None:
+                        padded = max(timeline.snap(padded, -1), end_time)
+                    end_time = padded
+                segment = reader.slice(start_time, end_time)
+                if reader.duration is not None and end_time > reader.duration:
+                    end_time = reader.duration
 
-        return clip_datas
+                contained.add(start_time, end_time)
+                source_ranges.append((offset, start_time, end_time))
+                offset += segment.duration_seconds
+                pieces.append(segment)
+            clip_data.pcm = SampleBuffer.concat(pieces, self.JOIN_FADE_MS)
+            clip_data.source_ranges = source_ranges
+            # wav only wraps the pcm, no encoding
+            clip_data.audio = clip_data.pcm.export("wav")
 
-    def is_already_contained(
-        self, target_time: float, contained_ranges: list[tuple[float, float]]
-    ) -> bool:
-        for contained_start, contained_end in contained_ranges:
-            if target_time > contained_start and target_time < contained_end:
-                return True
-        return False
+        return clip_datas
 
     def construct_with_captions(
         self, audio_data: BinaryIO, captions: ClipCaptions
     ) -> tuple[bytes, ClipCaptions]:
+        source = SampleBuffer.from_segment(AudioSegment.from_file(audio_data))
+        clip, captions = self.assemble(source, captions)
+        return clip.export("wav"), captions
+
+    def assemble(
+        self, source: SampleBuffer, captions: ClipCaptions
+    ) -> tuple[SampleBuffer, ClipCaptions]:
+        """
+        join the caption ranges of source, with the captions moved to where
+        they land in the joined clip
+        """
         captions = captions.model_copy(deep=True)
-        audio_segment: AudioSegment = AudioSegment.from_file(audio_data)
-
-        clip = AudioSegment.empty()
-        for caption in captions.root:
-            new_start_seconds = clip.duration_seconds
-            start_time = self.timecode_to_seconds(caption.timecode_start)
-            end_time = self.timecode_to_seconds(caption.timecode_end)
-            clip += audio_segment[start_time * 1000 : end_time * 1000]
-            new_end_seconds = clip.duration_seconds
-            caption.timecode_start = self.seconds_to_timecode(new_start_seconds)
-            caption.timecode_end = self.seconds_to_timecode(new_end_seconds)
-            print(caption.timecode_start, caption.timecode_end)
-        bytes_io = BytesIO()
-        clip.export(bytes_io, format="wav")
-        audio = bytes_io.getvalue()
-        bytes_io.close()
-
-        return audio, captions
+        starts = parse_timecodes([c.timecode_start for c in captions.root])
+        ends = parse_timecodes([c.timecode_end for c in captions.root])
+        pieces: list[SampleBuffer] = []
+        new_starts: list[float] = []
+        new_ends: list[float] = []
+        frames = 0
+        frame_rate = 1  # rate of the empty clip, as AudioSegment.empty()
+        for start_time, end_time in zip(starts.tolist(), ends.tolist()):
+            new_starts.append(frames / frame_rate)
+            piece = source.slice_ms(start_time * 1000, end_time * 1000)
+            pieces.append(piece)
+            frames += piece.frame_count
+            frame_rate = source.frame_rate
+            new_ends.append(frames / frame_rate)
+        for caption, start, end in zip(
+            captions.root, format_timecodes(new_starts), format_timecodes(new_ends)
+        ):
+            caption.timecode_start = start
+            caption.timecode_end = end
+        return SampleBuffer.concat(pieces, self.JOIN_FADE_MS), captions
 
     def seconds_to_timecode(self, seconds: float) -> str:
         # h, m, s, ms
@@ -0,0 +1,198 @@
+import re
+import numpy as np
+from functools import lru_cache
+from oto.domain.clip import ClipCaption, ClipCaptions
+from oto.domain.transcript import ColumnarTranscript
+from oto.services.content.sample_buffer import SampleBuffer
+from oto.services.transcript_compaction import join_word
+
+
+@lru_cache
+def get_clip_trim_service() -> "ClipTrimService":
+    return ClipTrimService()
+
+
+class ClipWord:
+    def __init__(self, start: float, end: float, speaker: str, text: str):
+        self.start = start
+        self.end = end
+        self.speaker = speaker
+        self.text = text
+
+
+class ClipTrimService:
+    """
+    local stand-in for ClipGeneratorService.pretty: cuts fillers by the
+    transcript's word timings and long pauses by the energy of the clip, and
+    tightens every cut to where the speech actually starts / ends.
+
+    the result has the shape pretty returns, clip relative `MM:SS.SSS` ranges
+    with speaker and text, so it goes through ClipConstructService.assemble
+    the same way
+    """
+
+    FRAME_SECONDS = 0.02
+    THRESHOLD_DB = 12  # speech is this much above the noise floor
+    DYNAMIC_RANGE_DB = 45  # ... and never further below the loudest frame
+    MIN_SPEECH_SECONDS = 0.1  # shorter bursts are clicks, not speech
+    MAX_PAUSE_SECONDS = 0.4  # longer pauses are cut
+    SNAP_SECONDS = 0.15  # word boundaries move to speech edges this close
+    PAD_SECONDS = 0.08  # kept around speech at every cut
+
+    FILLER = re.compile(
+        r"^(え+ー+(っ?と)?|えっと|あ+ー+|あのー+|そのー+|まあー+|うー+ん|んー+|"
+        r"u+h*m+|u+h+|e+r+m*|h+m+|m{2,})$"
+    )
+    PUNCTUATION = re.compile(r"[\s、。，．,.!?！？…「」]+")
+
+    def words(
+        self,
+        transcript: ColumnarTranscript,
+        source_ranges: list[tuple[float, float, float]],
+    ) -> list[ClipWord]:
+        """transcript words inside the clip's source ranges, in clip time"""
+        midpoints = (transcript.starts + transcript.ends) / 2
+        words: list[ClipWord] = []
+        for offset, start, end in source_ranges:
+            for i in np.flatnonzero((midpoints >= start) & (midpoints < end)):
+                words.append(
+                    ClipWord(
+                        start=max(start, float(transcript.starts[i])) - start + offset,
+                        end=min(end, float(transcript.ends[i])) - start + offset,
+                        speaker=transcript.speaker(i),
+                        text=transcript.word(i),
+                    )
+                )
+        return words
+
+    def trim(self, clip: SampleBuffer, words: list[ClipWord]) -> ClipCaptions:
+        speech = self.speech(clip)
+        captions: list[ClipCaption] = []
+        previous_end = 0.0
+        for run, lower, upper in self._runs(words, clip.duration_seconds):
+            for start, end, piece in self._tighten(run, lower, upper, speech):
+                start = max(previous_end, lower, start - self.PAD_SECONDS)
+                end = min(upper, end + self.PAD_SECONDS)
+                if end <= start:
+                    continue
+                text = ""
+                for word in piece:
+                    text = join_word(text, word.text)
+                captions.append(
+                    ClipCaption(
+                        timecode_start=self._timecode(start),
+                        timecode_end=self._timecode(end),
+                        speaker=piece[0].speaker,
+                        caption=text,
+                    )
+                )
+                previous_end = end
+        return ClipCaptions(captions)
+
+    def speech(self, clip: SampleBuffer) -> list[tuple[float, float]]:
+        """
+        (start, end) seconds of speech, by frame energy against the noise
+        floor, with short pauses bridged and clicks dropped
+        """
+        frame = max(1, int(clip.frame_rate * self.FRAME_SECONDS))
+        n_frames = clip.frame_count // frame
+        if n_frames == 0:
+            return []
+        full_scale = float(2 ** (8 * clip.sample_width - 1))
+        mono = clip.samples[: n_frames * frame].astype(np.float32).mean(axis=1)
+        power = ((mono / full_scale).reshape(n_frames, frame) ** 2).mean(axis=1)
+        db = 10 * np.log10(power + 1e-10)
+        threshold = max(
+            float(np.percentile(db, 10)) + self.THRESHOLD_DB,
+            float(db.max()) - self.DYNAMIC_RANGE_DB,
+        )
+        active = db > threshold
+
+        # frame runs as (start, end) frame indices
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], active, [0]])))
+        runs = list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+        max_gap = self.MAX_PAUSE_SECONDS / self.FRAME_SECONDS
+        min_length = self.MIN_SPEECH_SECONDS / self.FRAME_SECONDS
+        merged: list[list[int]] = []
+        for start, end in runs:
+            if merged and start - merged[-1][1] <= max_gap:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        seconds = frame / clip.frame_rate
+        return [
+            (start * seconds, end * seconds)
+            for start, end in merged
+            if end - start >= min_length
+        ]
+
+    def is_filler(self, text: str) -> bool:
+        normalized = self.PUNCTUATION.sub("", text).lower()
+        normalized = re.sub(r"[ーｰ~〜]+", "ー", normalized)
+        return bool(normalized) and bool(self.FILLER.match(normalized))
+
+    def _runs(
+        self, words: list[ClipWord], duration: float
+    ) -> list[tuple[list[ClipWord], float, float]]:
+        """
+        consecutive words that stay together, with the end of the word before
+        and the start of the word after as bounds. a run ends at a filler
+        (which is dropped), a speaker change and a jump in time
+        """
+        runs: list[tuple[list[ClipWord], float, float]] = []
+        current: list[ClipWord] = []
+        lower = 0.0
+        previous_end = 0.0
+        for word in words:
+            if current and (
+                word.speaker != current[-1].speaker
+                or not 0 <= word.start - current[-1].end <= self.MAX_PAUSE_SECONDS
+                or self.is_filler(word.text)
+            ):
+                runs.append((current, lower, max(current[-1].end, word.start)))
+                current = []
+            if self.is_filler(word.text):
+                previous_end = word.end
+                continue
+            if not current:
+                lower = min(previous_end, word.start)
+            current.append(word)
+            previous_end = word.end
+        if current:
+            runs.append((current, lower, max(current[-1].end, duration)))
+        return runs
+
+    def _tighten(
+        self,
+        run: list[ClipWord],
+        lower: float,
+        upper: float,
+        speech: list[tuple[float, float]],
+    ) -> list[tuple[float, float, list[ClipWord]]]:
+        """
+        the run cut to the speech inside it: ends in a pause move to the speech,
+        ends a bit inside speech move out to its edge, and pauses within the
+        run (whisper often stretches words over them) are cut out. every piece
+        keeps the words closest to it, speech without words is dropped
+        """
+        start = max(lower, run[0].start - self.SNAP_SECONDS)
+        end = min(upper, run[-1].end + self.SNAP_SECONDS)
+        segments = [
+            (max(a, start), min(b, end)) for a, b in speech if a < end and b > start
+        ]
+        if not segments:
+            return [(run[0].start, run[-1].end, run)]
+
+        pieces: list[list[ClipWord]] = [[] for _ in segments]
+        for word in run:
+            middle = (word.start + word.end) / 2
+            distances = [
+                0 if a <= middle <= b else min(abs(middle - a), abs(middle - b))
+                for a, b in segments
+            ]
+            pieces[int(np.argmin(distances))].append(word)
+        return [(a, b, piece) for (a, b), piece in zip(segments, pieces) if piece]
+
+    def _timecode(self, seconds: float) -> str:
+        seconds = round(seconds, 3)
+        return f"{int(seconds // 60):02d}:{seconds % 60:06.3f}"
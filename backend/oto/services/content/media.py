@@ -0,0 +1,169 @@
+import re
+import struct
+import subprocess
+import wave
+import numpy as np
+from io import BytesIO
+from typing import BinaryIO, Optional
+from pydub import AudioSegment
+
+OPUS_RATE = 48000  # ogg opus granule positions are always 48kHz samples
+CANONICAL_MIME_TYPE = "audio/ogg"
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """container / codec of encoded audio from its magic bytes"""
+    if data[:4] == b"OggS":
+        return "opus" if b"OpusHead" in data[:128] else "ogg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[4:8] == b"ftyp":
+        return "mp4"
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if data[:3] == b"ID3" or (
+        len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0
+    ):
+        return "mp3"
+    return None
+
+
+def duration_seconds(data: bytes) -> Optional[float]:
+    """
+    duration read from the container, without decoding.
+    None when it can not be told from the headers
+    """
+    fmt = sniff_format(data)
+    if fmt == "opus":
+        return _opus_duration(data)
+    if fmt == "wav":
+        try:
+            with wave.open(BytesIO(data)) as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError):
+            return None
+    return None
+
+
+def convert(data: bytes, format: str) -> tuple[bytes, float]:
+    """
+    `data` as `format` and its duration. passed through untouched when it
+    already is in that format, otherwise decoded and encoded once
+    """
+    if sniff_format(data) == format:
+        duration = duration_seconds(data)
+        if duration is not None:
+            return data, duration
+    seg: AudioSegment = AudioSegment.from_file(BytesIO(data))
+    bytes_io = BytesIO()
+    seg.export(bytes_io, format=format)
+    audio = bytes_io.getvalue()
+    bytes_io.close()
+    return audio, seg.duration_seconds
+
+
+def to_canonical(
+    path: str, sample_rate: int = 16000, bitrate_kbps: int = 24
+) -> tuple[bytes, float, Optional[str]]:
+    """
+    mono ogg opus of a local audio file, its duration and the source codec.
+    one ffmpeg run, the input description it prints is the probe
+    """
+    p = subprocess.run(
+        [
+            AudioSegment.converter,
+            "-hide_banner",
+            "-i",
+            path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "-c:a",
+            "libopus",
+            "-b:a",
+            f"{bitrate_kbps}k",
+            "-application",
+            "voip",
+            "-f",
+            "ogg",
+            "-",
+        ],
+        capture_output=True,
+    )
+    log = p.stderr.decode(errors="ignore")
+    if p.returncode != 0 or len(p.stdout) == 0:
+        raise Exception(f"Transcoding failed: {log[-1000:]}")
+
+    codec = re.search(r"Stream #0:\d+.*?: Audio: (\w+)", log)
+    duration = _opus_duration(p.stdout)
+    if duration is None:
+        duration = _logged_duration(log)
+    return p.stdout, duration, codec.group(1) if codec else None
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """
+    duration of a local audio file as its container states it, read by
+    ffmpeg without decoding. None when the container does not say
+    """
+    # with no output ffmpeg stops after describing the input
+    p = subprocess.run(
+        [AudioSegment.converter, "-hide_banner", "-i", path], capture_output=True
+    )
+    return _logged_duration(p.stderr.decode(errors="ignore"))
+
+
+def decode_pcm(f: BinaryIO, sample_rate: int) -> np.ndarray:
+    """
+    16 bit mono samples of encoded audio at sample_rate, resampled by ffmpeg.
+    unlike AudioSegment.from_file this needs no ffprobe, which reports no
+    sample size for opus
+    """
+    p = subprocess.run(
+        [
+            AudioSegment.converter,
+            "-hide_banner",
+            "-i",
+            "pipe:0",
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "-f",
+            "s16le",
+            "-",
+        ],
+        input=f.read(),
+        capture_output=True,
+    )
+    if p.returncode != 0:
+        raise Exception(f"Decoding failed: {p.stderr.decode(errors='ignore')[-1000:]}")
+    return np.frombuffer(p.stdout, dtype=np.int16)
+
+
+def _logged_duration(log: str) -> Optional[float]:
+    match = re.search(r"Duration: (\d+):(\d+):([\d.]+)", log)
+    if not match:
+        return None
+    h, m, s = match.groups()
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def _opus_duration(data: bytes) -> Optional[float]:
+    head = data.find(b"OpusHead")
+    if head < 0 or len(data) < head + 12:
+        return None
+    pre_skip = struct.unpack_from("<H", data, head + 10)[0]
+    # granule position of the last page is the end of the stream
+    position = len(data)
+    while (position := data.rfind(b"OggS", 0, position)) >= 0:
+        if len(data) >= position + 14 and data[position + 4] == 0:
+            granule = struct.unpack_from("<q", data, position + 6)[0]
+            if granule >= 0:
+                return max(0, granule - pre_skip) / OPUS_RATE
+    return None
@@ -0,0 +1,136 @@
+import numpy as np
+from io import BytesIO
+from pydub import AudioSegment
+
+DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+class SampleBuffer:
+    """
+    pcm frames as a (frames, channels) numpy array.
+
+    slicing returns views and concat copies every piece once into a
+    preallocated output, where `clip += segment` on AudioSegment copies the
+    whole accumulated clip on every append. positions follow pydub's
+    millisecond to frame rounding, so the results are sample identical.
+    """
+
+    def __init__(self, samples: np.ndarray, frame_rate: int, sample_width: int):
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+
+    @classmethod
+    def from_segment(cls, segment: AudioSegment) -> "SampleBuffer":
+        """
+        8 bit audio is widened to 16 bits, so every buffer is centred on 0:
+        pydub keeps it signed, biased from the unsigned pcm of wav files
+        """
+        samples = np.frombuffer(segment.raw_data, dtype=DTYPES[segment.sample_width])
+        sample_width = segment.sample_width
+        if sample_width == 1:
+            samples = samples.astype(np.int16) << 8
+            sample_width = 2
+        return cls(
+            samples.reshape(-1, segment.channels),
+            segment.frame_rate,
+            sample_width,
+        )
+
+    @classmethod
+    def empty(cls) -> "SampleBuffer":
+        # same parameters as AudioSegment.empty()
+        return cls(np.zeros((0, 1), dtype=np.int8), 1, 1)
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def frame_count(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frame_count / self.frame_rate
+
+    def __len__(self) -> int:
+        """length in ms, rounded like AudioSegment"""
+        return round(1000 * self.duration_seconds)
+
+    def slice_frames(self, start: int, end: int) -> "SampleBuffer":
+        """
+        view of frames [start, end). like AudioSegment slicing, frames missing
+        past the end (pydub rounds the length to whole ms) are padded with
+        silence, unless nothing is left to pad
+        """
+        piece = self.samples[start : max(start, end)]
+        missing = max(0, end - start) - len(piece)
+        if missing > 0 and len(piece):
+            piece = np.concatenate(
+                [piece, np.zeros((missing, self.channels), piece.dtype)]
+            )
+        return SampleBuffer(piece, self.frame_rate, self.sample_width)
+
+    def slice_ms(self, start_ms: float, end_ms: float) -> "SampleBuffer":
+        """same frames as AudioSegment[start_ms:end_ms]"""
+        length = len(self)
+        return self.slice_frames(
+            self.frame_at(min(start_ms, length)), self.frame_at(min(end_ms, length))
+        )
+
+    def frame_at(self, ms: float) -> int:
+        if ms < 0:
+            ms = len(self) - abs(ms)
+        return int(ms * (self.frame_rate / 1000.0))
+
+    @classmethod
+    def concat(cls, pieces: list["SampleBuffer"], fade_ms: float = 0) -> "SampleBuffer":
+        """
+        join pieces into one preallocated buffer. with fade_ms the audio is
+        ramped down / up around every join, without changing any length
+        """
+        pieces = [p for p in pieces if p.frame_count] or pieces
+        if not pieces:
+            return cls.empty()
+        first = pieces[0]
+        samples = np.empty(
+            (sum(p.frame_count for p in pieces), first.channels),
+            dtype=first.samples.dtype,
+        )
+        joins = []
+        position = 0
+        for piece in pieces:
+            samples[position : position + piece.frame_count] = piece.samples
+            position += piece.frame_count
+            joins.append(position)
+        buffer = cls(samples, first.frame_rate, first.sample_width)
+        if fade_ms > 0:
+            buffer._fade_joins(joins[:-1], int(fade_ms * first.frame_rate / 1000))
+        return buffer
+
+    def to_segment(self) -> AudioSegment:
+        return AudioSegment(
+            data=self.samples.tobytes(),
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels,
+        )
+
+    def export(self, format: str = "wav") -> bytes:
+        bytes_io = BytesIO()
+        self.to_segment().export(bytes_io, format=format)
+        audio = bytes_io.getvalue()
+        bytes_io.close()
+        return audio
+
+    def _fade_joins(self, joins: list[int], frames: int):
+        for join in joins:
+            n = min(frames, join, self.frame_count - join)
+            if n <= 0:
+                continue
+            down = np.linspace(1.0, 0.0, n, endpoint=False, dtype=np.float32)[:, None]
+            before = self.samples[join - n : join]
+            after = self.samples[join : join + n]
+            before[:] = np.rint(before * down).astype(before.dtype)
+            after[:] = np.rint(after * down[::-1]).astype(after.dtype)
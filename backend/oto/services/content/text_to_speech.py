@@ -1,31 +1,108 @@
-from pydub import AudioSegment
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
 from oto.environment import get_settings
-from io import BytesIO
 from openai import OpenAI
+from oto.infra.http import HttpClient, get_http_client
+from oto.infra.ledger import current_labels, get_llm_ledger, llm_call_labels
+from oto.infra.storage import get_storage
+from oto.services.content import media
 
 
 @lru_cache
 def get_text_to_speech_service() -> "TextToSpeechService":
     settings = get_settings()
-    return TextToSpeechService(settings.openai_api_key)
+    return TextToSpeechService(
+        settings.openai_api_key,
+        get_http_client(),
+        concurrency=settings.tts_concurrency,
+    )
 
 
 class TextToSpeechService:
-    def __init__(self, openai_api_key: str):
-        self.openai_api_key = openai_api_key
+    MODEL = "gpt-4o-mini-tts"
+    VOICE = "nova"
+    INSTRUCTIONS = "Speak in a calm and soothing tone"
+    CACHE_FOLDER = "tts_cache"
+    MIME_TYPES = {"opus": "audio/opus", "mp3": "audio/mpeg", "wav": "audio/wav"}
+
+    def __init__(self, openai_api_key: str, http: HttpClient, concurrency: int = 4):
+        # one client for every call, its connections go through the shared pool
+        self.client = OpenAI(api_key=openai_api_key, http_client=http.client)
+        self.concurrency = max(1, concurrency)
+        self.semaphore = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = {}
 
     def generate(self, text: str, format: str = "opus") -> bytes:
-        client = OpenAI(api_key=self.openai_api_key)
-        response = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            input=text,
-            voice="nova",
-            instructions="Speak in a calm and soothing tone",
-        )
-        seg: AudioSegment = AudioSegment.from_file(BytesIO(response.content))
-        bytes_io = BytesIO()
-        seg.export(bytes_io, format=format)
-        audio = bytes_io.getvalue()
-        bytes_io.close()
+        """the api encodes `format` itself, the response is passed through"""
+        with self.semaphore:
+            with get_llm_ledger().measure(
+                "tts", self.MODEL, characters=len(text)
+            ) as call:
+                response = self.client.audio.speech.create(
+                    model=self.MODEL,
+                    input=text,
+                    voice=self.VOICE,
+                    instructions=self.INSTRUCTIONS,
+                    response_format=format,
+                )
+                audio, call["audio_seconds"] = media.convert(response.content, format)
         return audio
+
+    def synthesize(self, text: str, format: str = "opus") -> str:
+        """
+        storage path of `text` read out as `format`. stored once per text,
+        voice and format: later calls, and calls racing the first one in this
+        process, get the same file
+        """
+        path = self.cache_path(text, format)
+        with self._lock:
+            future = self._in_flight.get(path)
+            owner = future is None
+            if owner:
+                future = self._in_flight[path] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            storage = get_storage()
+            if not storage.exists(path):
+                storage.upload_bytes_as(
+                    self.generate(text, format),
+                    path,
+                    self.MIME_TYPES.get(format, "application/octet-stream"),
+                )
+            future.set_result(path)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[path]
+        return path
+
+    def synthesize_many(self, texts: list[str], format: str = "opus") -> list[str]:
+        """synthesize for every text, concurrently and each distinct text once"""
+        unique = list(dict.fromkeys(texts))
+        labels = current_labels()
+
+        def synthesize(text: str) -> str:
+            with llm_call_labels(**labels):
+                return self.synthesize(text, format)
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.concurrency, len(unique)) or 1
+        ) as pool:
+            paths = dict(zip(unique, pool.map(synthesize, unique)))
+        return [paths[text] for text in texts]
+
+    def cache_path(self, text: str, format: str) -> str:
+        key = json.dumps(
+            [self.MODEL, self.VOICE, self.INSTRUCTIONS, format, text],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return f"{self.CACHE_FOLDER}/{digest}.{format}"
@@ -1,83 +1,99 @@
 from oto.infra.vertexai import VertexAI, get_vertexai
-from vertexai.generative_models import Part, GenerationConfig
+from typing import Optional
+from vertexai.generative_models import GenerationConfig
+from vertexai.preview.caching import CachedContent
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationBreakdown
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 from functools import lru_cache
 
 
 @lru_cache
 def get_conversation_breakdown_service() -> "ConversationBreakdownService":
-    return ConversationBreakdownService(get_vertexai())
+    return ConversationBreakdownService(
+        get_vertexai(), get_transcript_compaction_service()
+    )
 
 
 class ConversationBreakdownService:
-    def __init__(self, vertexai: VertexAI):
+    PROMPT_VERSION = "1"  # bump to invalidate cached results
+    RESPONSE_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "metadata": {
+                "type": "object",
+                "properties": {
+                    "duration": {"type": "string"},
+                    "language": {"type": "string"},
+                    "situation": {"type": "string"},
+                    "place": {"type": "string"},
+                    "time": {"type": "string"},
+                    "location": {"type": "string"},
+                    "participants": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                    },
+                },
+                "required": [
+                    "duration",
+                    "language",
+                    "situation",
+                    "place",
+                    "time",
+                    "location",
+                    "participants",
+                ],
+            },
+            "sentiment": {
+                "type": "object",
+                "properties": {
+                    "positive": {"type": "number"},
+                    "neutral": {"type": "number"},
+                    "negative": {"type": "number"},
+                },
+                "required": ["positive", "neutral", "negative"],
+            },
+            "keywords": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "keyword": {"type": "string"},
+                        "importance_score": {"type": "number"},
+                    },
+                    "required": ["keyword", "importance_score"],
+                },
+            },
+        },
+        "required": [
+            "metadata",
+            "sentiment",
+            "keywords",
+        ],
+    }
+
+    def __init__(self, vertexai: VertexAI, compaction: TranscriptCompactionService):
         self.vertexai = vertexai
+        self.compaction = compaction
 
-    def get_breakdown(self, captions: Captions) -> ConversationBreakdown:
+    def get_breakdown(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> ConversationBreakdown:
         messages = [
-            Part.from_text(captions.model_dump_json()),
+            *self.compaction.prefix(captions, context),
             self._prompt(),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
+            cached_content=context,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
-                response_schema={
-                    "type": "object",
-                    "properties": {
-                        "metadata": {
-                            "type": "object",
-                            "properties": {
-                                "duration": {"type": "string"},
-                                "language": {"type": "string"},
-                                "situation": {"type": "string"},
-                                "place": {"type": "string"},
-                                "time": {"type": "string"},
-                                "location": {"type": "string"},
-                                "participants": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                },
-                            },
-                            "required": [
-                                "duration",
-                                "language",
-                                "situation",
-                                "place",
-                                "time",
-                                "location",
-                                "participants",
-                            ],
-                        },
-                        "sentiment": {
-                            "type": "object",
-                            "properties": {
-                                "positive": {"type": "number"},
-                                "neutral": {"type": "number"},
-                                "negative": {"type": "number"},
-                            },
-                            "required": ["positive", "neutral", "negative"],
-                        },
-                        "keywords": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "keyword": {"type": "string"},
-                                    "importance_score": {"type": "number"},
-                                },
-                                "required": ["keyword", "importance_score"],
-                            },
-                        },
-                    },
-                    "required": [
-                        "metadata",
-                        "sentiment",
-                        "keywords",
-                    ],
-                },
+                response_schema=self.RESPONSE_SCHEMA,
             ),
         )
 
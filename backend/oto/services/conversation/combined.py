@@ -0,0 +1,127 @@
+from oto.infra.vertexai import VertexAI, get_vertexai
+from typing import Optional
+from vertexai.generative_models import GenerationConfig
+from vertexai.preview.caching import CachedContent
+from oto.domain.transcript import Captions
+from oto.domain.analysis import ConversationAnalysisData
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
+from oto.services.conversation.summary import (
+    ConversationSummaryService,
+    get_conversation_summary_service,
+)
+from oto.services.conversation.highlight import (
+    ConversationHighlightService,
+    get_conversation_highlight_service,
+)
+from oto.services.conversation.insight import (
+    ConversationInsightService,
+    get_conversation_insight_service,
+)
+from oto.services.conversation.breakdown import (
+    ConversationBreakdownService,
+    get_conversation_breakdown_service,
+)
+from functools import lru_cache
+
+
+@lru_cache
+def get_conversation_combined_service() -> "ConversationCombinedService":
+    return ConversationCombinedService(
+        get_vertexai(),
+        get_transcript_compaction_service(),
+        get_conversation_summary_service(),
+        get_conversation_highlight_service(),
+        get_conversation_insight_service(),
+        get_conversation_breakdown_service(),
+    )
+
+
+class ConversationCombinedService:
+    """
+    summary, highlights, insights and breakdown in one request,
+    so the transcript is sent once instead of four times
+    """
+
+    def __init__(
+        self,
+        vertexai: VertexAI,
+        compaction: TranscriptCompactionService,
+        summary: ConversationSummaryService,
+        highlight: ConversationHighlightService,
+        insight: ConversationInsightService,
+        breakdown: ConversationBreakdownService,
+    ):
+        self.vertexai = vertexai
+        self.compaction = compaction
+        self.summary = summary
+        self.highlight = highlight
+        self.insight = insight
+        self.breakdown = breakdown
+        self.PROMPT_VERSION = "-".join(
+            [
+                "1",
+                summary.PROMPT_VERSION,
+                highlight.PROMPT_VERSION,
+                insight.PROMPT_VERSION,
+                breakdown.PROMPT_VERSION,
+            ]
+        )
+
+    def get_analysis(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> ConversationAnalysisData:
+        windows = self.compaction.windows(
+            captions, self.summary.window_tokens, self.summary.overlap_tokens
+        )
+        if len(windows) > 1:
+            # the per-section services split long transcripts, this one can't
+            raise ValueError("Transcript exceeds the analysis window")
+
+        messages = [
+            *self.compaction.prefix(captions, context),
+            self._prompt(),
+        ]
+        response = self.vertexai.generate(
+            self.vertexai.model,
+            messages,
+            cached_content=context,
+            generation_config=GenerationConfig(
+                max_output_tokens=65535,
+                response_mime_type="application/json",
+                response_schema={
+                    "type": "object",
+                    "properties": {
+                        "summary": self.summary.RESPONSE_SCHEMA,
+                        "highlights": self.highlight.RESPONSE_SCHEMA,
+                        "insights": self.insight.RESPONSE_SCHEMA,
+                        "breakdown": self.breakdown.RESPONSE_SCHEMA,
+                    },
+                    "required": ["summary", "highlights", "insights", "breakdown"],
+                },
+            ),
+        )
+
+        self.vertexai.notify_response(response, self.vertexai.model)
+
+        # raises ValidationError, callers fall back to the per-section services
+        analysis = ConversationAnalysisData.model_validate_json(response.text)
+        return analysis
+
+    def _prompt(self) -> str:
+        return f"""Analyze this conversation and fill in every section of the response.
+
+# summary
+{self.summary._prompt()}
+
+# highlights
+{self.highlight._prompt()}
+
+# insights
+{self.insight._prompt()}
+
+# breakdown
+{self.breakdown._prompt()}
+"""
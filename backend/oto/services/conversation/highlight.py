@@ -1,50 +1,83 @@
+import numpy as np
 from oto.infra.vertexai import VertexAI, get_vertexai
-from vertexai.generative_models import Part, GenerationConfig
+from typing import Optional
+from vertexai.generative_models import GenerationConfig
+from vertexai.preview.caching import CachedContent
 from oto.domain.transcript import Captions
-from oto.domain.analysis import ConversationHighlights
+from oto.domain.timeline import TimelineIndex, format_timecodes, parse_timecodes
+from oto.domain.analysis import ConversationHighlight, ConversationHighlights
+from oto.environment import get_settings
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 from functools import lru_cache
 
 
 @lru_cache
 def get_conversation_highlight_service() -> "ConversationHighlightService":
-    return ConversationHighlightService(get_vertexai())
+    settings = get_settings()
+    return ConversationHighlightService(
+        get_vertexai(),
+        get_transcript_compaction_service(),
+        window_tokens=settings.analysis_window_tokens,
+        overlap_tokens=settings.analysis_window_overlap_tokens,
+    )
 
 
 class ConversationHighlightService:
-    def __init__(self, vertexai: VertexAI):
+    PROMPT_VERSION = "1"  # bump to invalidate cached results
+    RESPONSE_SCHEMA = {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "highlight": {"type": "string"},
+                "timecode_start_at": {"type": "string"},
+                "timecode_end_at": {"type": "string"},
+                "favorite": {"type": "boolean"},
+            },
+            "required": [
+                "summary",
+                "highlight",
+                "timecode_start_at",
+                "timecode_end_at",
+                "favorite",
+            ],
+        },
+    }
+
+    def __init__(
+        self,
+        vertexai: VertexAI,
+        compaction: TranscriptCompactionService,
+        window_tokens: int = 24_000,
+        overlap_tokens: int = 1_000,
+    ):
         self.vertexai = vertexai
+        self.compaction = compaction
+        self.window_tokens = window_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def get_highlights(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> ConversationHighlights:
+        windows = self.compaction.windows(
+            captions, self.window_tokens, self.overlap_tokens
+        )
+        if len(windows) > 1:
+            return self._map_reduce(windows)
 
-    def get_highlights(self, captions: Captions) -> ConversationHighlights:
         messages = [
-            Part.from_text(captions.model_dump_json()),
+            *self.compaction.prefix(captions, context),
             self._prompt(),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
-            generation_config=GenerationConfig(
-                max_output_tokens=65535,
-                response_mime_type="application/json",
-                response_schema={
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "summary": {"type": "string"},
-                            "highlight": {"type": "string"},
-                            "timecode_start_at": {"type": "string"},
-                            "timecode_end_at": {"type": "string"},
-                            "favorite": {"type": "boolean"},
-                        },
-                        "required": [
-                            "summary",
-                            "highlight",
-                            "timecode_start_at",
-                            "timecode_end_at",
-                            "favorite",
-                        ],
-                    },
-                },
-            ),
+            cached_content=context,
+            generation_config=self._generation_config(),
         )
 
         self.vertexai.notify_response(response, self.vertexai.model)
@@ -52,6 +85,86 @@ class ConversationHighlightService:
         highlights = ConversationHighlights.model_validate_json(response.text)
         return highlights
 
+    def snap(
+        self, highlights: ConversationHighlights, timeline: TimelineIndex
+    ) -> ConversationHighlights:
+        """
+        highlight ranges moved to the word boundaries of the transcript, kept
+        in whole `HH:MM:SS` (start rounded down, end up). left as they are when
+        a timecode can not be read
+        """
+        items = highlights.root
+        try:
+            starts = parse_timecodes([h.timecode_start_at for h in items])
+            ends = parse_timecodes([h.timecode_end_at for h in items])
+        except ValueError:
+            return highlights
+        starts, ends = timeline.snap_ranges(starts, ends)
+        return ConversationHighlights(
+            [
+                highlight.model_copy(
+                    update={"timecode_start_at": start, "timecode_end_at": end}
+                )
+                for highlight, start, end in zip(
+                    items,
+                    format_timecodes(np.floor(starts), milliseconds=False),
+                    format_timecodes(np.ceil(ends), milliseconds=False),
+                )
+            ]
+        )
+
+    def _map_reduce(self, windows: list[str]) -> ConversationHighlights:
+        """
+        highlight every window in parallel, then drop the duplicates
+        the overlapping parts produce
+        """
+        responses = self.vertexai.generate_many(
+            self.vertexai.model,
+            [[window, self._prompt()] for window in windows],
+            generation_config=self._generation_config(),
+        )
+        highlights: list[ConversationHighlight] = []
+        for response in responses:
+            self.vertexai.notify_response(response, self.vertexai.model)
+            highlights.extend(
+                ConversationHighlights.model_validate_json(response.text).root
+            )
+        return ConversationHighlights(self._dedupe(highlights))
+
+    def _dedupe(
+        self, highlights: list[ConversationHighlight]
+    ) -> list[ConversationHighlight]:
+        """
+        highlights covering mostly the same time range are the same one seen
+        from two windows, keep the first and carry over the favorite flag
+        """
+        kept: list[tuple[float, float, ConversationHighlight]] = []
+        for highlight in highlights:
+            start = self.compaction.to_seconds(highlight.timecode_start_at)
+            end = self.compaction.to_seconds(highlight.timecode_end_at)
+            if start is None or end is None:
+                kept.append((0, 0, highlight))
+                continue
+            duplicate = None
+            for kept_start, kept_end, other in kept:
+                overlap = min(end, kept_end) - max(start, kept_start)
+                shorter = max(1.0, min(end - start, kept_end - kept_start))
+                if start == kept_start or overlap > shorter / 2:
+                    duplicate = other
+                    break
+            if duplicate is not None:
+                duplicate.favorite = duplicate.favorite or highlight.favorite
+                continue
+            kept.append((start, end, highlight))
+        return [highlight for _, _, highlight in sorted(kept, key=lambda item: item[0])]
+
+    def _generation_config(self) -> GenerationConfig:
+        return GenerationConfig(
+            max_output_tokens=65535,
+            response_mime_type="application/json",
+            response_schema=self.RESPONSE_SCHEMA,
+        )
+
     def _prompt(self) -> str:
         return """Please create highlights from this transcript, dividing it into appropriate sections.  
 Then, for the part you find most interesting, set `"favorite": true` (at least one, but not too many—choose the most compelling segment overall).
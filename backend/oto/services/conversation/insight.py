@@ -1,51 +1,67 @@
 from oto.infra.vertexai import VertexAI, get_vertexai
-from vertexai.generative_models import Part, GenerationConfig
+from typing import Optional
+from vertexai.generative_models import GenerationConfig
+from vertexai.preview.caching import CachedContent
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationInsight
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 from functools import lru_cache
 
 
 @lru_cache
 def get_conversation_insight_service() -> "ConversationInsightService":
-    return ConversationInsightService(get_vertexai())
+    return ConversationInsightService(
+        get_vertexai(), get_transcript_compaction_service()
+    )
 
 
 class ConversationInsightService:
-    def __init__(self, vertexai: VertexAI):
+    PROMPT_VERSION = "1"  # bump to invalidate cached results
+    RESPONSE_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "suggestions": {
+                "type": "array",
+                "items": {"type": "string"},
+            },
+            "boring_score": {"type": "number"},
+            "density_score": {"type": "number"},
+            "clarity_score": {"type": "number"},
+            "engagement_score": {"type": "number"},
+            "interesting_score": {"type": "number"},
+        },
+        "required": [
+            "suggestions",
+            "boring_score",
+            "density_score",
+            "clarity_score",
+            "engagement_score",
+            "interesting_score",
+        ],
+    }
+
+    def __init__(self, vertexai: VertexAI, compaction: TranscriptCompactionService):
         self.vertexai = vertexai
+        self.compaction = compaction
 
-    def get_insights(self, captions: Captions) -> ConversationInsight:
+    def get_insights(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> ConversationInsight:
         messages = [
-            Part.from_text(captions.model_dump_json()),
+            *self.compaction.prefix(captions, context),
             self._prompt(),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
+            cached_content=context,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
-                response_schema={
-                    "type": "object",
-                    "properties": {
-                        "suggestions": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                        },
-                        "boring_score": {"type": "number"},
-                        "density_score": {"type": "number"},
-                        "clarity_score": {"type": "number"},
-                        "engagement_score": {"type": "number"},
-                        "interesting_score": {"type": "number"},
-                    },
-                    "required": [
-                        "suggestions",
-                        "boring_score",
-                        "density_score",
-                        "clarity_score",
-                        "engagement_score",
-                        "interesting_score",
-                    ],
-                },
+                response_schema=self.RESPONSE_SCHEMA,
             ),
         )
 
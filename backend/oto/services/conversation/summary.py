@@ -1,35 +1,66 @@
 from oto.infra.vertexai import VertexAI, get_vertexai
-from vertexai.generative_models import Part, GenerationConfig
+from typing import Optional
+from vertexai.generative_models import GenerationConfig
+from vertexai.preview.caching import CachedContent
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationSummary
+from oto.environment import get_settings
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 from functools import lru_cache
 
 
 @lru_cache
 def get_conversation_summary_service() -> "ConversationSummaryService":
-    return ConversationSummaryService(get_vertexai())
+    settings = get_settings()
+    return ConversationSummaryService(
+        get_vertexai(),
+        get_transcript_compaction_service(),
+        window_tokens=settings.analysis_window_tokens,
+        overlap_tokens=settings.analysis_window_overlap_tokens,
+    )
 
 
 class ConversationSummaryService:
-    def __init__(self, vertexai: VertexAI):
+    PROMPT_VERSION = "1"  # bump to invalidate cached results
+    RESPONSE_SCHEMA = {
+        "type": "object",
+        "properties": {"summary": {"type": "string"}},
+        "required": ["summary"],
+    }
+
+    def __init__(
+        self,
+        vertexai: VertexAI,
+        compaction: TranscriptCompactionService,
+        window_tokens: int = 24_000,
+        overlap_tokens: int = 1_000,
+    ):
         self.vertexai = vertexai
+        self.compaction = compaction
+        self.window_tokens = window_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def get_summary(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> ConversationSummary:
+        windows = self.compaction.windows(
+            captions, self.window_tokens, self.overlap_tokens
+        )
+        if len(windows) > 1:
+            return self._map_reduce(windows)
 
-    def get_summary(self, captions: Captions) -> ConversationSummary:
         messages = [
-            Part.from_text(captions.model_dump_json()),
+            *self.compaction.prefix(captions, context),
             self._prompt(),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
-            generation_config=GenerationConfig(
-                max_output_tokens=65535,
-                response_mime_type="application/json",
-                response_schema={
-                    "type": "object",
-                    "properties": {"summary": {"type": "string"}},
-                    "required": ["summary"],
-                },
-            ),
+            cached_content=context,
+            generation_config=self._generation_config(),
         )
 
         self.vertexai.notify_response(response, self.vertexai.model)
@@ -37,7 +68,50 @@ class ConversationSummaryService:
         summary = ConversationSummary.model_validate_json(response.text)
         return summary
 
+    def _map_reduce(self, windows: list[str]) -> ConversationSummary:
+        """
+        summarize every window in parallel, then summarize the summaries
+        """
+        responses = self.vertexai.generate_many(
+            self.vertexai.model,
+            [
+                [window, self._window_prompt(i, len(windows))]
+                for i, window in enumerate(windows)
+            ],
+            generation_config=self._generation_config(),
+        )
+        partials = []
+        for i, response in enumerate(responses):
+            self.vertexai.notify_response(response, self.vertexai.model)
+            summary = ConversationSummary.model_validate_json(response.text)
+            partials.append(f"Part {i + 1}: {summary.summary}")
+
+        response = self.vertexai.generate(
+            self.vertexai.model,
+            ["\n".join(partials), self._reduce_prompt()],
+            generation_config=self._generation_config(),
+        )
+
+        self.vertexai.notify_response(response, self.vertexai.model)
+
+        return ConversationSummary.model_validate_json(response.text)
+
+    def _generation_config(self) -> GenerationConfig:
+        return GenerationConfig(
+            max_output_tokens=65535,
+            response_mime_type="application/json",
+            response_schema=self.RESPONSE_SCHEMA,
+        )
+
     def _prompt(self) -> str:
         return (
             """Please create an overall summary of this transcript under 100 words."""
         )
+
+    def _window_prompt(self, index: int, count: int) -> str:
+        return f"""This is part {index + 1} of {count} of a longer transcript, consecutive parts overlap slightly.
+Please create a summary of this part under 100 words."""
+
+    def _reduce_prompt(self) -> str:
+        return """These are the summaries of consecutive parts of one conversation.
+Please create an overall summary of the whole conversation under 100 words."""
@@ -32,7 +32,8 @@ class CreateClusterService:
             self._prompt(),
             Part.from_text(prompt),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
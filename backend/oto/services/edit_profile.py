@@ -1,32 +1,45 @@
 from oto.infra.vertexai import VertexAI, get_vertexai
+from typing import Optional
 from vertexai.generative_models import Part, GenerationConfig
+from vertexai.preview.caching import CachedContent
 from oto.domain.transcript import Captions
 from oto.domain.analysis import ConversationHighlights
 from oto.domain.user import UpdateUser
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 from functools import lru_cache
 
 
 @lru_cache
 def get_edit_profile_service() -> "EditProfileService":
-    return EditProfileService(get_vertexai())
+    return EditProfileService(get_vertexai(), get_transcript_compaction_service())
 
 
 class EditProfileService:
-    def __init__(self, vertexai: VertexAI):
+    def __init__(self, vertexai: VertexAI, compaction: TranscriptCompactionService):
         self.vertexai = vertexai
+        self.compaction = compaction
 
     def edit_profile(
-        self, captions: Captions, current_profile: UpdateUser
+        self,
+        captions: Captions,
+        current_profile: UpdateUser,
+        context: Optional[CachedContent] = None,
     ) -> UpdateUser:
+        # the transcript goes first so it can be served from the context cache
         messages = [
-            "Last conversation:",
-            Part.from_text(captions.model_dump_json()),
+            *self.compaction.prefix(captions, context),
+            "The transcript above is the user's last conversation.",
             "Current profile:",
             Part.from_text(current_profile.model_dump_json()),
             self._prompt(),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
+            cached_content=context,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
                 response_mime_type="application/json",
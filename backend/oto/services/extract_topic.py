@@ -1,80 +1,180 @@
+import numpy as np
 from oto.infra.vertexai import VertexAI, get_vertexai
-from vertexai.generative_models import Part, GenerationConfig
+from typing import Optional
+from vertexai.generative_models import GenerationConfig
+from vertexai.preview.caching import CachedContent
 from vertexai.language_models import TextEmbeddingInput
 from oto.domain.transcript import Captions
-from oto.domain.analysis import TopicDataList
+from oto.domain.analysis import TopicData, TopicDataList
+from oto.environment import get_settings
+from oto.services.transcript_compaction import (
+    TranscriptCompactionService,
+    get_transcript_compaction_service,
+)
 from functools import lru_cache
 
 
 @lru_cache
 def get_extract_topic_service() -> "ExtractTopicService":
-    return ExtractTopicService(get_vertexai())
+    settings = get_settings()
+    return ExtractTopicService(
+        get_vertexai(),
+        get_transcript_compaction_service(),
+        window_tokens=settings.analysis_window_tokens,
+        overlap_tokens=settings.analysis_window_overlap_tokens,
+    )
 
 
 class ExtractTopicService:
-    def __init__(self, vertexai: VertexAI):
-        self.vertexai = vertexai
-
-    def extract_topics(self, captions: Captions) -> TopicDataList:
-        messages = [
-            Part.from_text(
-                "```" + captions.model_dump_json() + "\n```\n\n" + self._prompt()
-            ),
-        ]
-        response = self.vertexai.model.generate_content(
-            messages,
-            generation_config=GenerationConfig(
-                max_output_tokens=65535,
-                response_mime_type="application/json",
-                response_schema={
+    PROMPT_VERSION = "2"  # bump to invalidate cached results
+    RESPONSE_SCHEMA = {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "topic": {"type": "string"},
+                "words": {"type": "array", "items": {"type": "string"}},
+                "related_conversations": {
                     "type": "array",
                     "items": {
                         "type": "object",
                         "properties": {
-                            "topic": {"type": "string"},
-                            "words": {"type": "array", "items": {"type": "string"}},
-                            "related_conversations": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "timecode": {"type": "string"},
-                                        "speaker": {"type": "string"},
-                                        "caption": {"type": "string"},
-                                    },
-                                    "required": ["timecode", "speaker", "caption"],
-                                },
-                            },
-                            "sentiment": {"type": "number"},
+                            "timecode": {"type": "string"},
+                            "speaker": {"type": "string"},
+                            "caption": {"type": "string"},
                         },
-                        "required": [
-                            "topic",
-                            "words",
-                            "related_conversations",
-                            "sentiment",
-                        ],
+                        "required": ["timecode", "speaker", "caption"],
                     },
                 },
-            ),
+                "sentiment": {"type": "number"},
+            },
+            "required": [
+                "topic",
+                "words",
+                "related_conversations",
+                "sentiment",
+            ],
+        },
+    }
+    MAX_TOPICS = 30
+    MERGE_SIMILARITY = 0.9
+
+    def __init__(
+        self,
+        vertexai: VertexAI,
+        compaction: TranscriptCompactionService,
+        window_tokens: int = 24_000,
+        overlap_tokens: int = 1_000,
+    ):
+        self.vertexai = vertexai
+        self.compaction = compaction
+        self.window_tokens = window_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def extract_topics(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> TopicDataList:
+        windows = self.compaction.windows(
+            captions, self.window_tokens, self.overlap_tokens
         )
+        if len(windows) > 1:
+            # map: topics of every window in parallel, reduce: merge the
+            # topics that several windows found, by embedding similarity
+            responses = self.vertexai.generate_many(
+                self.vertexai.model,
+                [[window, self._prompt()] for window in windows],
+                generation_config=self._generation_config(),
+            )
+        else:
+            messages = [
+                *self.compaction.prefix(captions, context),
+                self._prompt(),
+            ]
+            responses = [
+                self.vertexai.generate(
+                    self.vertexai.model,
+                    messages,
+                    cached_content=context,
+                    generation_config=self._generation_config(),
+                )
+            ]
 
-        topics = TopicDataList.model_validate_json(response.text)
+        topics = TopicDataList([])
+        for response in responses:
+            topics.root.extend(TopicDataList.model_validate_json(response.text).root)
 
         inputs = []
         for topic in topics.root:
             inputs.append(
                 TextEmbeddingInput(text=" ".join(topic.words), task_type="CLUSTERING")
             )
-        embeddings = self.vertexai.embed.get_embeddings(
-            inputs, output_dimensionality=64
-        )
+        embeddings = self.vertexai.get_embeddings(inputs, output_dimensionality=64)
         for topic, embedding in zip(topics.root, embeddings):
             topic.embedding = embedding.values
 
-        self.vertexai.notify_response(response, self.vertexai.model)
+        for response in responses:
+            self.vertexai.notify_response(response, self.vertexai.model)
+
+        if len(responses) > 1:
+            topics = self._merge(topics)
 
         return topics
 
+    def _merge(self, topics: TopicDataList) -> TopicDataList:
+        """
+        fold each topic into the first earlier one it is nearly identical to,
+        then keep the MAX_TOPICS topics with the most related conversations
+        """
+        if not topics.root:
+            return topics
+        vectors = np.array([topic.embedding for topic in topics.root], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+        similarity = vectors @ vectors.T
+
+        merged: list[TopicData] = []
+        representatives: list[int] = []
+        counts: list[int] = []
+        for i, topic in enumerate(topics.root):
+            match = next(
+                (
+                    k
+                    for k, j in enumerate(representatives)
+                    if similarity[i, j] >= self.MERGE_SIMILARITY
+                ),
+                None,
+            )
+            if match is None:
+                merged.append(topic.model_copy(deep=True))
+                representatives.append(i)
+                counts.append(1)
+                continue
+            target = merged[match]
+            target.words.extend(w for w in topic.words if w not in target.words)
+            timecodes = {c.timecode for c in target.related_conversations}
+            target.related_conversations.extend(
+                c for c in topic.related_conversations if c.timecode not in timecodes
+            )
+            target.sentiment = (target.sentiment * counts[match] + topic.sentiment) / (
+                counts[match] + 1
+            )
+            counts[match] += 1
+
+        if len(merged) > self.MAX_TOPICS:
+            ranked = sorted(
+                range(len(merged)),
+                key=lambda k: len(merged[k].related_conversations),
+                reverse=True,
+            )[: self.MAX_TOPICS]
+            merged = [merged[k] for k in sorted(ranked)]
+        return TopicDataList(merged)
+
+    def _generation_config(self) -> GenerationConfig:
+        return GenerationConfig(
+            max_output_tokens=65535,
+            response_mime_type="application/json",
+            response_schema=self.RESPONSE_SCHEMA,
+        )
+
     def _prompt(self) -> str:
         return """From this transcript, please extract each topic of interest, the related words and conversation snippets, and assign an associated sentiment score on a scale from -1 (negative) to 1 (positive). Clip only the relevant portions of the dialogue with their timestamps. If the relevant parts are far apart, you may split them into separate elements in the array; if they form a continuous exchange, group them together.
 Write each topic as a sentence that clearly conveys the overall idea.
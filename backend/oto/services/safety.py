@@ -1,11 +1,24 @@
 from oto.infra.database import create_db_session
 from oto.domain.conversation import Conversation
 from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
 from oto.environment import get_settings
 
 
 def check_conversation_limit_exceeded():
     with create_db_session() as session:
         total_conversations = session.exec(select(func.count(Conversation.id))).first()
-        if total_conversations > get_settings().maximum_conversations_limit:
-            raise ValueError("Conversation limit exceeded")
+        _check_total(total_conversations)
+
+
+async def check_conversation_limit_exceeded_async(session: AsyncSession):
+    """same check for the api, on the request's session"""
+    total_conversations = (
+        await session.exec(select(func.count(Conversation.id)))
+    ).first()
+    _check_total(total_conversations)
+
+
+def _check_total(total_conversations: int):
+    if total_conversations > get_settings().maximum_conversations_limit:
+        raise ValueError("Conversation limit exceeded")
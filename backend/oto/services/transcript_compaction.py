@@ -0,0 +1,269 @@
+import numpy as np
+from typing import Optional
+from pydantic import BaseModel
+from functools import lru_cache
+from oto.domain.transcript import Captions, ColumnarTranscript
+from vertexai.generative_models import Part
+from vertexai.preview.caching import CachedContent
+from oto.infra.vertexai import estimate_tokens
+
+
+@lru_cache
+def get_transcript_compaction_service() -> "TranscriptCompactionService":
+    return TranscriptCompactionService()
+
+
+def join_word(text: str, word: str) -> str:
+    """append a transcript word, spacing it the way the language does"""
+    if word[:1].isspace():
+        return text + word.rstrip()
+    word = word.strip()
+    if not text or not word:
+        return text + word
+    # no spaces between CJK characters
+    if not text[-1].isascii() and not word[0].isascii():
+        return text + word
+    return text + " " + word
+
+
+class Utterance(BaseModel):
+    timecode_start: str
+    timecode_end: str
+    speaker: str
+    text: str
+
+
+class CompactionReport(BaseModel):
+    captions: int
+    utterances: int
+    original_tokens: int
+    compact_tokens: int
+
+    @property
+    def saved_ratio(self) -> float:
+        if self.original_tokens == 0:
+            return 0
+        return 1 - self.compact_tokens / self.original_tokens
+
+
+class TranscriptCompactionService:
+    """
+    merges consecutive captions of the same speaker into utterances and renders
+    them one per line, instead of a json object per (word level) caption
+    """
+
+    MAX_GAP_SECONDS = 2
+    MAX_UTTERANCE_CAPTIONS = 80
+    HEADER = "Transcript, one utterance per line: [start-end] speaker: text"
+
+    def coalesce(
+        self, captions: Captions, max_captions: Optional[int] = None
+    ) -> list[Utterance]:
+        """max_captions caps the captions per utterance, for finer timecodes"""
+        max_captions = max_captions or self.MAX_UTTERANCE_CAPTIONS
+        utterances: list[Utterance] = []
+        count = 0
+        last_end = None
+        for caption in captions.root:
+            start, _, end = caption.timecode.partition("-")
+            end = end or start
+            start_seconds = self.to_seconds(start)
+            current = utterances[-1] if utterances else None
+            if (
+                current is None
+                or current.speaker != caption.speaker
+                or count >= max_captions
+                or (
+                    start_seconds is not None
+                    and last_end is not None
+                    and start_seconds - last_end > self.MAX_GAP_SECONDS
+                )
+            ):
+                utterances.append(
+                    Utterance(
+                        timecode_start=start,
+                        timecode_end=end,
+                        speaker=caption.speaker,
+                        text=caption.caption.strip(),
+                    )
+                )
+                count = 1
+            else:
+                current.timecode_end = end
+                current.text = self._join(current.text, caption.caption)
+                count += 1
+            last_end = self.to_seconds(end)
+        return utterances
+
+    def render(self, captions: Captions, max_captions: Optional[int] = None) -> str:
+        lines = [self.HEADER]
+        for utterance in self.coalesce(captions, max_captions):
+            lines.append(self._line(utterance))
+        return "\n".join(lines)
+
+    def windows(
+        self, captions: Captions, max_tokens: int, overlap_tokens: int = 0
+    ) -> list[str]:
+        """
+        render the transcript as consecutive windows of at most `max_tokens`
+        (estimated), each repeating the last `overlap_tokens` of the previous
+        one so that no exchange is only seen cut in half
+        """
+        budget = max_tokens - estimate_tokens(self.HEADER)
+        overlap_tokens = min(overlap_tokens, budget // 2)
+        windows: list[list[str]] = []
+        current: list[str] = []
+        size = 0
+        for utterance in self.coalesce(captions):
+            line = self._line(utterance)
+            tokens = estimate_tokens(line) + 1
+            if current and size + tokens > budget:
+                windows.append(current)
+                carried: list[str] = []
+                size = 0
+                for previous in reversed(current):
+                    previous_tokens = estimate_tokens(previous) + 1
+                    if size + previous_tokens > overlap_tokens:
+                        break
+                    carried.insert(0, previous)
+                    size += previous_tokens
+                current = carried
+            current.append(line)
+            size += tokens
+        if current or not windows:
+            windows.append(current)
+        return ["\n".join([self.HEADER, *lines]) for lines in windows]
+
+    def prefix(
+        self, captions: Captions, context: Optional[CachedContent] = None
+    ) -> list[Part]:
+        """
+        leading message parts of a transcript prompt, nothing when the rendered
+        transcript is already held by the context cache
+        """
+        if context is not None:
+            return []
+        return [Part.from_text(self.render(captions))]
+
+    def report(self, transcript: ColumnarTranscript) -> CompactionReport:
+        """
+        sizes of the transcript as a json dump of captions and rendered,
+        counted from the columns without building either. utterances are
+        split like coalesce, tokens are estimated like estimate_tokens from
+        the ascii and non-ascii characters
+        """
+        n = len(transcript)
+        if n == 0:
+            return CompactionReport(
+                captions=0,
+                utterances=0,
+                original_tokens=estimate_tokens("[]"),
+                compact_tokens=estimate_tokens(self.HEADER),
+            )
+
+        data = np.frombuffer(transcript.text, dtype=np.uint8)
+        offsets = transcript.offsets.astype(np.int64)
+        starts, ends = offsets[:-1], offsets[1:]
+
+        def per_word(mask: np.ndarray) -> np.ndarray:
+            counts = np.concatenate([[0], np.cumsum(mask, dtype=np.int64)])
+            return counts[ends] - counts[starts]
+
+        word_ascii = per_word(data < 0x80)
+        word_other = per_word(data >= 0xC0)  # utf-8 lead bytes
+        word_escaped = per_word((data == 0x22) | (data == 0x5C) | (data < 0x20))
+        # surrounding whitespace of every word, stripped when rendering
+        space = np.isin(data, list(b" \t\n\r"))
+        position = np.arange(len(data))
+        next_visible = np.append(
+            np.minimum.accumulate(np.where(space, len(data), position)[::-1])[::-1],
+            len(data),
+        )
+        last_visible = np.append(
+            np.maximum.accumulate(np.where(space, -1, position)), -1
+        )
+        leading = np.minimum(next_visible[starts], ends) - starts
+        trailing = ends - 1 - last_visible[ends - 1]
+        stripped = np.minimum(leading + trailing, ends - starts)
+        speaker_ascii = np.array(
+            [len(s.encode("ascii", "ignore")) for s in transcript.speakers]
+        )
+        speaker_other = np.array([len(s) for s in transcript.speakers]) - speaker_ascii
+        ids = transcript.speaker_ids
+        timecode = 17 if transcript.has_range else 8
+
+        # [{"timecode":"..","speaker":"..","caption":".."},...]
+        caption = len('{"timecode":"","speaker":"","caption":""}') + timecode
+        original_ascii = (
+            1
+            + n * (caption + 1)
+            + speaker_ascii[ids].sum()
+            + word_ascii.sum()
+            + word_escaped.sum()
+        )
+        original_other = speaker_other[ids].sum() + word_other.sum()
+
+        # utterances, as coalesce splits them on the rendered whole seconds
+        start_seconds = np.floor(transcript.starts)
+        end_seconds = np.floor(
+            transcript.ends if transcript.has_range else transcript.starts
+        )
+        run = np.ones(n, dtype=bool)
+        run[1:] = (ids[1:] != ids[:-1]) | (
+            start_seconds[1:] - end_seconds[:-1] > self.MAX_GAP_SECONDS
+        )
+        run_start = np.maximum.accumulate(np.where(run, np.arange(n), 0))
+        first = (np.arange(n) - run_start) % self.MAX_UTTERANCE_CAPTIONS == 0
+        utterances = int(first.sum())
+
+        # "\n[start-end] speaker: text", words joined by a space except
+        # between non-ascii characters, surrounding whitespace dropped
+        nonempty = stripped < ends - starts  # blank words add nothing
+        padded = np.append(data, np.uint8(0))
+        head = np.where(nonempty, padded[starts], 0)
+        tail = np.where(nonempty, padded[last_visible[ends - 1]], 0)
+        index = np.arange(n)
+        utterance_start = np.maximum.accumulate(np.where(first, index, 0))
+        previous = np.full(n, -1)  # last non-empty word before each word
+        previous[1:] = np.maximum.accumulate(np.where(nonempty, index, -1))[:-1]
+        after_text = previous >= utterance_start
+        joined = (head >= 0x80) & (tail[previous] >= 0x80)
+        leading_space = np.isin(head, list(b" \t\n\r"))
+        separators = int(
+            (nonempty & ~first & (leading_space | (after_text & ~joined))).sum()
+        )
+        line = len("\n[-] : ") + 2 * 8
+        compact_ascii = (
+            len(self.HEADER)
+            + utterances * line
+            + speaker_ascii[ids[first]].sum()
+            + word_ascii.sum()
+            - stripped.sum()
+            + separators
+        )
+        compact_other = speaker_other[ids[first]].sum() + word_other.sum()
+
+        return CompactionReport(
+            captions=n,
+            utterances=utterances,
+            original_tokens=int((original_ascii + 3) // 4 + original_other),
+            compact_tokens=int((compact_ascii + 3) // 4 + compact_other),
+        )
+
+    def _line(self, utterance: Utterance) -> str:
+        return (
+            f"[{utterance.timecode_start}-{utterance.timecode_end}] "
+            f"{utterance.speaker}: {utterance.text}"
+        )
+
+    def _join(self, text: str, word: str) -> str:
+        return join_word(text, word)
+
+    def to_seconds(self, timecode: str) -> Optional[float]:
+        seconds = 0.0
+        try:
+            for part in timecode.strip().split(":"):
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            return None
+        return seconds
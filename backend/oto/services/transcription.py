@@ -1,29 +1,25 @@
-from oto.infra.vertexai import VertexAI, get_vertexai
-from vertexai.generative_models import Part, GenerationConfig
+from oto.infra.vertexai import VertexAI, file_part, get_vertexai
+from vertexai.generative_models import GenerationConfig
 from oto.domain.transcript import Captions
 from functools import lru_cache
-from oto.environment import get_settings
 
 
 @lru_cache
 def get_transcription_service() -> "TranscriptionService":
-    settings = get_settings()
-    return TranscriptionService(get_vertexai(), settings.google_cloud_bucket_name)
+    return TranscriptionService(get_vertexai())
 
 
 class TranscriptionService:
-    def __init__(self, vertexai: VertexAI, bucket_name: str):
+    def __init__(self, vertexai: VertexAI):
         self.vertexai = vertexai
-        self.bucket_name = bucket_name
 
     def transcribe(self, audio_file_path: str, mime_type: str) -> Captions:
         messages = [
             self._prompt(),
-            Part.from_uri(
-                uri=f"gs://{self.bucket_name}/{audio_file_path}", mime_type=mime_type
-            ),
+            file_part(audio_file_path, mime_type),
         ]
-        response = self.vertexai.model.generate_content(
+        response = self.vertexai.generate(
+            self.vertexai.model,
             messages,
             generation_config=GenerationConfig(
                 max_output_tokens=65535,
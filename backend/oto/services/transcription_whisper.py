@@ -1,55 +1,266 @@
-import requests
-from vertexai.generative_models import Part, GenerationConfig
-from oto.domain.transcript import Captions, Caption
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pydub import AudioSegment
+from oto.domain.transcript import ColumnarTranscript
+from oto.domain.fireworks import Word, Segment
 from functools import lru_cache
 from oto.environment import get_settings
-from oto.infra.storage import get_storage
+from oto.infra.blob_cache import BlobCache, get_blob_cache
 from oto.infra.fireworks import Fireworks, get_fireworks
+from oto.infra.ledger import llm_call_labels, current_labels
+from oto.infra.storage import open_mapped
+from oto.services.content import media
 
 
 @lru_cache
 def get_transcription_service() -> "TranscriptionService":
-    return TranscriptionService(get_fireworks())
+    settings = get_settings()
+    return TranscriptionService(
+        get_fireworks(),
+        chunk_seconds=settings.transcription_chunk_seconds,
+        concurrency=settings.transcription_chunk_concurrency,
+    )
+
+
+class AudioChunk:
+    def __init__(self, index: int, cut_start: float, cut_end: float, offset: float):
+        # words whose midpoint falls in [cut_start, cut_end) belong to this chunk,
+        # the audio itself starts at `offset` and overlaps its neighbours
+        self.index = index
+        self.cut_start = cut_start
+        self.cut_end = cut_end
+        self.offset = offset
+        self.audio: bytes = b""
 
 
 class TranscriptionService:
-    def __init__(self, fireworks: Fireworks):
+    PROMPT_VERSION = "2"  # bump to invalidate cached results
+
+    SAMPLE_RATE = 16000
+    FRAME_SECONDS = 0.05
+    SMOOTHING_SECONDS = 0.5
+    OVERLAP_SECONDS = 5.0
+
+    def __init__(
+        self, fireworks: Fireworks, chunk_seconds: int = 0, concurrency: int = 1
+    ):
         self.fireworks = fireworks
-        self.storage = get_storage()
+        self.blob_cache: BlobCache = get_blob_cache()
+        self.chunk_seconds = chunk_seconds
+        self.concurrency = max(1, concurrency)
 
     def transcribe(
         self, audio_file_path: str, mime_type: str
-    ) -> tuple[Captions, float]:
-        with self.storage.open_for_read(audio_file_path) as f:
-            response = self.fireworks.transcribe(f)
-
-            captions = []
-
-            total_active_seconds = 0
-
-            for segment in response.segments:
-                if segment.no_speech:
-                    continue
-                total_active_seconds += segment.end - segment.start
-
-            for word in response.words:
-                captions.append(
-                    Caption(
-                        timecode=self._seconds_to_timecode(word.start)
-                        + "-"
-                        + self._seconds_to_timecode(word.end),
-                        speaker=word.speaker_id,
-                        caption=word.word,
-                    )
+    ) -> tuple[ColumnarTranscript, float]:
+        with self.blob_cache.local_path(audio_file_path) as path:
+            if self.chunk_seconds > 0:
+                # only files that may need splitting are decoded
+                duration = media.probe_duration(path)
+                if duration is None or duration > self.chunk_seconds:
+                    with open_mapped(path) as f:
+                        samples, sample_width = self._decode(f)
+                    if len(samples) > self.chunk_seconds * self.SAMPLE_RATE:
+                        return self._transcribe_chunked(samples, sample_width)
+
+            with open_mapped(path) as f:
+                response = self.fireworks.transcribe(f)
+            return self._to_transcript(response.words, response.segments)
+
+    def _to_transcript(
+        self, words: list[Word], segments: list[Segment]
+    ) -> tuple[ColumnarTranscript, float]:
+        total_active_seconds = 0
+
+        for segment in segments:
+            if segment.no_speech:
+                continue
+            total_active_seconds += segment.end - segment.start
+
+        transcript = ColumnarTranscript.from_words(
+            starts=[word.start for word in words],
+            ends=[word.end for word in words],
+            speakers=[word.speaker_id for word in words],
+            words=[word.word for word in words],
+        )
+
+        return transcript, total_active_seconds
+
+    def _decode(self, f) -> tuple[np.ndarray, int]:
+        """
+        decode to 16kHz mono, which is what whisper works on anyway. ffmpeg
+        resamples and downmixes: the rate and channels are output options
+        """
+        return media.decode_pcm(f, self.SAMPLE_RATE), 2
+
+    def _transcribe_chunked(
+        self, samples: np.ndarray, sample_width: int
+    ) -> tuple[ColumnarTranscript, float]:
+        chunks = self._split(samples)
+        for chunk in chunks:
+            start = int(chunk.offset * self.SAMPLE_RATE)
+            end = int((chunk.cut_end + self.OVERLAP_SECONDS) * self.SAMPLE_RATE)
+            seg = AudioSegment(
+                data=samples[start:end].tobytes(),
+                sample_width=sample_width,
+                frame_rate=self.SAMPLE_RATE,
+                channels=1,
+            )
+            bytes_io = BytesIO()
+            seg.export(bytes_io, format="flac")
+            chunk.audio = bytes_io.getvalue()
+            bytes_io.close()
+
+        print(f"Transcribing {len(chunks)} chunks, concurrency {self.concurrency}")
+        labels = current_labels()
+
+        def transcribe(chunk: AudioChunk):
+            with llm_call_labels(**labels):
+                return self.fireworks.transcribe(
+                    BytesIO(chunk.audio), f"chunk_{chunk.index}.flac"
                 )
 
-            return Captions(captions), total_active_seconds
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            responses = list(executor.map(transcribe, chunks))
+
+        words, segments = self._stitch(chunks, responses)
+        return self._to_transcript(words, segments)
 
-    def _seconds_to_timecode(self, seconds: float) -> str:
+    def _split(self, samples: np.ndarray) -> list[AudioChunk]:
         """
-        make seconds to HH:MM:SS
+        cut at the quietest point of the second half of every window,
+        so each window stays shorter than chunk_seconds
         """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        frame = int(self.SAMPLE_RATE * self.FRAME_SECONDS)
+        n_frames = len(samples) // frame
+        energy = (
+            samples[: n_frames * frame].astype(np.float32).reshape(n_frames, frame) ** 2
+        ).mean(axis=1)
+        k = max(1, int(self.SMOOTHING_SECONDS / self.FRAME_SECONDS))
+        smoothed = np.convolve(energy, np.ones(k) / k, mode="same")
+
+        window = int(self.chunk_seconds / self.FRAME_SECONDS)
+        cuts = [0.0]
+        pos = 0
+        while n_frames - pos > window:
+            lo = pos + window // 2
+            cut = lo + int(np.argmin(smoothed[lo : pos + window]))
+            cuts.append(cut * self.FRAME_SECONDS)
+            pos = cut
+        cuts.append(len(samples) / self.SAMPLE_RATE)
+
+        return [
+            AudioChunk(
+                index=i,
+                cut_start=start,
+                cut_end=end,
+                offset=max(0.0, start - self.OVERLAP_SECONDS),
+            )
+            for i, (start, end) in enumerate(zip(cuts[:-1], cuts[1:]))
+        ]
+
+    def _stitch(
+        self, chunks: list[AudioChunk], responses: list
+    ) -> tuple[list[Word], list[Segment]]:
+        words: list[Word] = []
+        segments: list[Segment] = []
+        used_speakers: set[str] = set()
+        previous_words: list[Word] = []
+
+        for chunk, response in zip(chunks, responses):
+            chunk_words = [self._shift_word(w, chunk.offset) for w in response.words]
+            chunk_segments = [
+                segment.model_copy(
+                    update={
+                        "start": segment.start + chunk.offset,
+                        "end": segment.end + chunk.offset,
+                        "words": [
+                            self._shift_word(w, chunk.offset) for w in segment.words
+                        ],
+                    }
+                )
+                for segment in response.segments
+            ]
+
+            mapping = self._match_speakers(
+                previous_words, chunk_words, chunk.cut_start, used_speakers
+            )
+            used_speakers.update(mapping.values())
+
+            for w in chunk_words:
+                w.speaker_id = mapping[w.speaker_id]
+            for segment in chunk_segments:
+                segment.speaker_id = mapping.get(segment.speaker_id, segment.speaker_id)
+                for w in segment.words:
+                    w.speaker_id = mapping.get(w.speaker_id, w.speaker_id)
+
+            is_last = chunk.index == len(chunks) - 1
+            words.extend(w for w in chunk_words if self._owns(chunk, w, is_last))
+            segments.extend(s for s in chunk_segments if self._owns(chunk, s, is_last))
+            previous_words = chunk_words
+
+        return words, segments
+
+    def _owns(self, chunk: AudioChunk, item: Word | Segment, is_last: bool) -> bool:
+        midpoint = (item.start + item.end) / 2
+        return chunk.cut_start <= midpoint and (is_last or midpoint < chunk.cut_end)
+
+    def _shift_word(self, word: Word, offset: float) -> Word:
+        return word.model_copy(
+            update={"start": word.start + offset, "end": word.end + offset}
+        )
+
+    def _match_speakers(
+        self,
+        previous_words: list[Word],
+        words: list[Word],
+        cut: float,
+        used_speakers: set[str],
+    ) -> dict[str, str]:
+        """
+        diarization labels are local to each chunk, so labels of this chunk are
+        mapped to the labels of the previous one by how long they talk at the
+        same time in the overlapping audio around the cut
+        """
+        lo, hi = cut - self.OVERLAP_SECONDS, cut + self.OVERLAP_SECONDS
+        votes: dict[tuple[str, str], float] = {}
+        previous = [w for w in previous_words if w.end > lo and w.start < hi]
+        for w in words:
+            if w.end <= lo or w.start >= hi:
+                continue
+            for p in previous:
+                overlap = min(w.end, p.end) - max(w.start, p.start)
+                if overlap > 0:
+                    key = (w.speaker_id, p.speaker_id)
+                    votes[key] = votes.get(key, 0) + overlap
+
+        mapping: dict[str, str] = {}
+        taken: set[str] = set()
+        for (label, previous_label), _ in sorted(
+            votes.items(), key=lambda item: item[1], reverse=True
+        ):
+            if label in mapping or previous_label in taken:
+                continue
+            mapping[label] = previous_label
+            taken.add(previous_label)
+
+        for label in dict.fromkeys(w.speaker_id for w in words):
+            if label in mapping:
+                continue
+            if label not in used_speakers and label not in taken:
+                mapping[label] = label
+            else:
+                mapping[label] = self._new_speaker_id(
+                    label, used_speakers | taken | set(mapping.values())
+                )
+            taken.add(mapping[label])
+
+        return mapping
+
+    def _new_speaker_id(self, label: str, used: set[str]) -> str:
+        prefix = label.rstrip("0123456789")
+        width = len(label) - len(prefix)
+        n = 0
+        while f"{prefix}{n:0{width}d}" in used:
+            n += 1
+        return f"{prefix}{n:0{width}d}"
@@ -29,10 +29,9 @@ def create_clip_flow() -> None:
         pickle.dump(result, open("result.pkl", "wb"))
 
     storage = get_storage()
-    audio_file = storage.open_for_read(path)
-
     clip_construct_service = get_clip_construct_service()
-    result = clip_construct_service.construct(audio_file, result)
+    with storage.local_copy(path) as audio_path:
+        result = clip_construct_service.construct(audio_path, result)
 
     i = 0
     for target_data in result.root:
@@ -1,14 +1,22 @@
+import hashlib
 from prefect import task, get_run_logger
 from oto.infra.database import create_db_session
 from oto.services.content.clip import get_clip_generator_service
 from oto.services.content.clip_construct import get_clip_construct_service
+from oto.services.content.clip_trim import get_clip_trim_service
 from oto.services.content.audio_enhancer import get_audio_enhancer_service
 from oto.services.content.text_to_speech import get_text_to_speech_service
 from oto.infra.storage import get_storage
-from oto.domain.clip import Clip, ClipData
+from oto.infra.blob_cache import get_blob_cache
+from oto.domain.clip import Clip, ClipData, ClipDatas, ClipCaptions
+from oto.infra.cache import get_result_cache
+from oto.infra.ledger import llm_call_labels, current_labels
 from oto.domain.conversation import Conversation
+from oto.domain.transcript import ColumnarTranscript, Transcript
+from oto.environment import get_settings
 from sqlmodel import select
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 
 def get_conversation(conversation_id: str) -> Conversation:
@@ -18,99 +26,191 @@ def get_conversation(conversation_id: str) -> Conversation:
         ).first()
 
 
-@task(task_run_name="create_clip")
-def create_clip_task(conversation_id: str) -> None:
-    log = get_run_logger()
-    log.info("▶️ Creating clips for conversation %s", conversation_id)
-    conversation = get_conversation(conversation_id)
+def get_columnar_transcript(conversation_id: str) -> Optional[ColumnarTranscript]:
+    with create_db_session() as session:
+        transcript = session.get(Transcript, conversation_id)
+        return transcript.get_columnar() if transcript is not None else None
+
 
-    path = conversation.file_path
-    import_mime_type = conversation.mime_type
+class ProcessedClip:
+    def __init__(self, data: ClipData, file_path: str):
+        self.data = data
+        self.file_path = file_path
 
+
+def process_clip(
+    conversation: Conversation,
+    i: int,
+    target_data: ClipData,
+    transcript: Optional[ColumnarTranscript],
+    log,
+) -> Optional[ProcessedClip]:
+    """
+    trim -> cut -> upload -> enhance of one clip. runs on worker threads,
+    concurrency towards each external service is capped inside the services
+    """
+    cache = get_result_cache()
+    storage = get_storage()
     clip_generator_service = get_clip_generator_service()
-    log.info("▶️ Generating clips for conversation %s", conversation_id)
-    result = clip_generator_service.generate(
-        path,
-        import_mime_type,
+    clip_construct_service = get_clip_construct_service()
+    audio_enhancer_service = get_audio_enhancer_service()
+
+    cleaned_captions = None
+    if get_settings().clip_trim_mode == "dsp":
+        trim_service = get_clip_trim_service()
+        words = (
+            trim_service.words(transcript, target_data.source_ranges)
+            if transcript is not None
+            else []
+        )
+        if words:
+            cleaned_captions = trim_service.trim(target_data.pcm, words)
+        else:
+            log.info("▶️ No transcript words for clip %d, trimming with pretty", i)
+    if cleaned_captions is None:
+        cleaned_captions = cache.get_or_compute_model(
+            conversation.content_hash,
+            "clip_pretty",
+            # by the clip's own audio: indices shift between selections
+            f"{clip_generator_service.PROMPT_VERSION}:"
+            + hashlib.sha256(target_data.audio).hexdigest(),
+            ClipCaptions,
+            lambda: clip_generator_service.pretty(target_data.audio, "audio/wav"),
+        )
+    if not cleaned_captions.root:
+        return None
+
+    # pcm all the way from construct, the only encodes are the flac sieve
+    # fetches and the opus of the fallback, sieve's opus is passed through
+    clip, cleaned_captions = clip_construct_service.assemble(
+        target_data.pcm, cleaned_captions
     )
-    log.info("▶️ Generated clips for conversation %s", conversation_id)
+    target_data.captions = cleaned_captions
+    target_data.audio = target_data.pcm = None
 
-    storage = get_storage()
-    audio_file = storage.open_for_read(path)
+    path = storage.upload_bytes(
+        clip.export("flac"),
+        f"clips/{conversation.user_id}",
+        "flac",
+        "audio/flac",
+    )
+    signed_url = storage.generate_signed_url(path)
+    try:
+        bytes = audio_enhancer_service.enhance_audio(signed_url, "opus")
+    except Exception as e:
+        log.error("▶️ Enhancing audio failed: %s", e)
+        log.info("▶️ Enhancing audio failed, converting to opus instead")
+        bytes = audio_enhancer_service.convert_to_opus(clip)
+    enhanced_path = storage.upload_bytes(
+        bytes,
+        f"clips/{conversation.user_id}",
+        "opus",
+        "audio/opus",
+    )
+    return ProcessedClip(target_data, enhanced_path)
 
-    clip_construct_service = get_clip_construct_service()
-    result = clip_construct_service.construct(audio_file, result)
 
-    ret: list[ClipData] = []
+@task(task_run_name="create_clip")
+def create_clip_task(conversation_id: str) -> None:
+    log = get_run_logger()
+    with llm_call_labels(conversation_id=conversation_id):
+        log.info("▶️ Creating clips for conversation %s", conversation_id)
+        conversation = get_conversation(conversation_id)
 
-    log.info("▶️ Cleaning clips for conversation %s", conversation_id)
-    for target_data in result.root:
-        cleaned_captions = clip_generator_service.pretty(target_data.audio, "audio/wav")
-        if cleaned_captions.root.count == 0:
-            continue
-        audio_data, cleaned_captions = clip_construct_service.construct_with_captions(
-            BytesIO(target_data.audio), cleaned_captions
-        )
-        target_data.captions = cleaned_captions
-        target_data.audio = audio_data
-        ret.append(target_data)
-    log.info("▶️ Cleaned clips for conversation %s", conversation_id)
+        path, import_mime_type = conversation.audio()
 
-    with create_db_session() as session:
-        i = 0
-        log.info("▶️ Uploading clips for conversation %s", conversation_id)
-        for target_data in ret:
-            path = storage.upload_bytes(
-                target_data.audio,
-                f"clips/{conversation.user_id}",
-                "wav",
-                "audio/wav",
+        cache = get_result_cache()
+        clip_generator_service = get_clip_generator_service()
+        settings = get_settings()
+        transcript = get_columnar_transcript(conversation_id)
+        log.info("▶️ Generating clips for conversation %s", conversation_id)
+        if settings.clip_selection_mode == "transcript" and transcript:
+            result = cache.get_or_compute_model(
+                conversation.content_hash,
+                "clip_generate_transcript",
+                clip_generator_service.PROMPT_VERSION,
+                ClipDatas,
+                lambda: clip_generator_service.generate_from_transcript(transcript),
             )
-            # enhance audio
-            signed_url = storage.generate_signed_url(path)
-            audio_enhancer_service = get_audio_enhancer_service()
-            try:
-                bytes = audio_enhancer_service.enhance_audio(signed_url, "opus")
-                enhanced_path = storage.upload_bytes(
-                    bytes,
-                    f"clips/{conversation.user_id}",
-                    "opus",
-                    "audio/opus",
-                )
-            except Exception as e:
-                log.error("▶️ Enhancing audio failed: %s", e)
-                log.info("▶️ Enhancing audio failed, converting to opus instead")
-                bytes = audio_enhancer_service.convert_to_opus(target_data.audio)
-                enhanced_path = storage.upload_bytes(
-                    bytes,
-                    f"clips/{conversation.user_id}",
-                    "opus",
-                    "audio/opus",
-                )
-            text_to_speech_service = get_text_to_speech_service()
-            tts_bytes = text_to_speech_service.generate(target_data.comment, "opus")
-            tts_path = storage.upload_bytes(
-                tts_bytes,
-                f"clip_comments/{conversation.user_id}",
-                "opus",
-                "audio/opus",
+        else:
+            result = cache.get_or_compute_model(
+                conversation.content_hash,
+                "clip_generate",
+                clip_generator_service.PROMPT_VERSION,
+                ClipDatas,
+                lambda: clip_generator_service.generate(
+                    path,
+                    import_mime_type,
+                ),
             )
-            session.add(
-                Clip(
-                    user_id=conversation.user_id,
-                    conversation_id=conversation.id,
-                    file_name=f"clip_{i}.opus",
-                    file_path=enhanced_path,
-                    mime_type="audio/opus",
-                    comment_file_name=f"comment_{i}.opus",
-                    comment_file_path=tts_path,
-                    comment_mime_type="audio/opus",
-                    title=target_data.title,
-                    description=target_data.description,
-                    comment=target_data.comment,
-                    captions_dump=target_data.captions.model_dump_json(),
+        log.info("▶️ Generated clips for conversation %s", conversation_id)
+
+        # every comment at once while the clips are cut, each distinct one
+        # is only synthesized once and stays in storage for the next run
+        labels = current_labels()
+        with ThreadPoolExecutor(max_workers=1) as comments:
+
+            def synthesize() -> list[str]:
+                with llm_call_labels(**labels):
+                    return get_text_to_speech_service().synthesize_many(
+                        [clip_data.comment for clip_data in result.root], "opus"
+                    )
+
+            comment_paths = comments.submit(synthesize)
+
+            clip_construct_service = get_clip_construct_service()
+            with get_blob_cache().local_path(path) as audio_path:
+                result = clip_construct_service.construct(
+                    audio_path,
+                    result,
+                    transcript.timeline() if transcript is not None else None,
                 )
+            if transcript is None:
+                # usually stored by now, clip generation from the audio takes
+                # longer than transcription
+                transcript = get_columnar_transcript(conversation_id)
+
+            log.info(
+                "▶️ Processing %d clips for conversation %s",
+                len(result.root),
+                conversation_id,
             )
-        log.info("▶️ Uploaded clips for conversation %s", conversation_id)
-        session.commit()
-    log.info("✅ Created clips for conversation %s", conversation_id)
+            with ThreadPoolExecutor(max_workers=settings.clip_concurrency) as clips:
+
+                def process(i: int, target_data: ClipData) -> Optional[ProcessedClip]:
+                    with llm_call_labels(**labels):
+                        return process_clip(
+                            conversation, i, target_data, transcript, log
+                        )
+
+                processed = list(
+                    clips.map(process, range(len(result.root)), result.root)
+                )
+            comment_paths = comment_paths.result()
+        log.info("▶️ Processed clips for conversation %s", conversation_id)
+
+        with create_db_session() as session:
+            kept = [
+                (clip, comment_path)
+                for clip, comment_path in zip(processed, comment_paths)
+                if clip is not None
+            ]
+            for i, (clip, comment_path) in enumerate(kept):
+                session.add(
+                    Clip(
+                        user_id=conversation.user_id,
+                        conversation_id=conversation.id,
+                        file_name=f"clip_{i}.opus",
+                        file_path=clip.file_path,
+                        mime_type="audio/opus",
+                        comment_file_name=f"comment_{i}.opus",
+                        comment_file_path=comment_path,
+                        comment_mime_type="audio/opus",
+                        title=clip.data.title,
+                        description=clip.data.description,
+                        comment=clip.data.comment,
+                        captions_dump=clip.data.captions.model_dump_json(),
+                    )
+                )
+            session.commit()
+        log.info("✅ Created clips for conversation %s", conversation_id)
@@ -1,16 +1,36 @@
+from functools import cached_property
+from typing import Callable, Optional, TypeVar
+from pydantic import BaseModel
 from prefect import task, flow
 from oto.infra.database import create_db_session
 from oto.domain.conversation import Conversation, ProcessingStatus
 from oto.domain.transcript import Transcript
 from oto.domain.transcript import Captions
+from oto.domain.timeline import TimelineIndex
 from oto.services.conversation.summary import get_conversation_summary_service
 from oto.services.conversation.highlight import get_conversation_highlight_service
 from oto.services.conversation.insight import get_conversation_insight_service
 from oto.services.conversation.breakdown import get_conversation_breakdown_service
-from oto.domain.analysis import ConversationAnalysis
+from oto.services.conversation.combined import get_conversation_combined_service
+from oto.domain.analysis import (
+    ConversationAnalysis,
+    ConversationSummary,
+    ConversationHighlights,
+    ConversationInsight,
+    ConversationBreakdown,
+    ConversationAnalysisData,
+)
+from oto.environment import get_settings
+from oto.infra.cache import get_result_cache
+from oto.infra.vertexai import get_vertexai
+from oto.infra.ledger import llm_call_labels
+from vertexai.preview.caching import CachedContent
+from oto.services.transcript_compaction import get_transcript_compaction_service
 from oto.services.edit_profile import get_edit_profile_service
 from oto.domain.user import User
 
+T = TypeVar("T", bound=BaseModel)
+
 
 class Helper:
     def __init__(self, conversation_id: str, require_transcript: bool = True):
@@ -23,20 +43,60 @@ class Helper:
                 self.transcript = session.get(Transcript, conversation_id)
                 if not self.transcript:
                     raise ValueError(f"Transcript {conversation_id} not found")
-                self.captions = Captions.model_validate_json(
-                    self.transcript.captions_dump
-                )
             self.analysis = session.get(ConversationAnalysis, conversation_id)
             if not self.analysis:
                 self.analysis = ConversationAnalysis(
                     id=conversation_id, user_id=self.conversation.user_id
                 )
 
+    @cached_property
+    def captions(self) -> Captions:
+        return self.transcript.get_captions()
+
+    @cached_property
+    def timeline(self) -> TimelineIndex:
+        return self.transcript.get_columnar().timeline()
+
+    @property
+    def context(self) -> Optional[CachedContent]:
+        return get_vertexai().context_cache(self.conversation_id)
+
+    def analysis_cached(self) -> bool:
+        """every analysis section the flow generates is in the result cache"""
+        if get_settings().combined_analysis:
+            sections = {
+                "analysis_combined": get_conversation_combined_service().PROMPT_VERSION
+            }
+        else:
+            sections = {
+                "summary": get_conversation_summary_service().PROMPT_VERSION,
+                "highlights": get_conversation_highlight_service().PROMPT_VERSION,
+                "insights": get_conversation_insight_service().PROMPT_VERSION,
+                "breakdown": get_conversation_breakdown_service().PROMPT_VERSION,
+            }
+        return all(
+            get_result_cache().contains(self.conversation.content_hash, *section)
+            for section in sections.items()
+        )
+
+    def cached(
+        self,
+        service: str,
+        prompt_version: str,
+        model: type[T],
+        compute: Callable[[], T],
+    ) -> T:
+        return get_result_cache().get_or_compute_model(
+            self.conversation.content_hash, service, prompt_version, model, compute
+        )
+
     def __enter__(self):
+        self._labels = llm_call_labels(conversation_id=self.conversation_id)
+        self._labels.__enter__()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        pass
+        self._labels.__exit__(exc_type, exc_value, traceback)
 
     def set_inner_status(self, inner_status: str) -> None:
         with create_db_session() as session:
@@ -74,11 +134,37 @@ def generate_empty_analysis(conversation_id: str) -> None:
         helper.update_analysis()
 
 
+@task(task_run_name="create_transcript_context")
+def create_transcript_context(conversation_id: str, ttl_seconds: int) -> None:
+    """
+    skipped when every section is cached, the context would be paid for and
+    never read. the profile edit then sends the transcript inline
+    """
+    with Helper(conversation_id) as helper:
+        if helper.analysis_cached():
+            return
+        get_vertexai().create_context_cache(
+            conversation_id,
+            get_transcript_compaction_service().render(helper.captions),
+            ttl_seconds,
+        )
+
+
+@task(task_run_name="delete_transcript_context")
+def delete_transcript_context(conversation_id: str) -> None:
+    get_vertexai().delete_context_cache(conversation_id)
+
+
 @task(task_run_name="generate_summary")
 def generate_summary(conversation_id: str) -> None:
     with Helper(conversation_id) as helper:
         summary_service = get_conversation_summary_service()
-        summary = summary_service.get_summary(helper.captions)
+        summary = helper.cached(
+            "summary",
+            summary_service.PROMPT_VERSION,
+            ConversationSummary,
+            lambda: summary_service.get_summary(helper.captions, helper.context),
+        )
         helper.analysis.summary_dump = summary.model_dump_json()
         helper.update_analysis()
 
@@ -87,7 +173,13 @@ def generate_summary(conversation_id: str) -> None:
 def generate_highlights(conversation_id: str) -> None:
     with Helper(conversation_id) as helper:
         highlights_service = get_conversation_highlight_service()
-        highlights = highlights_service.get_highlights(helper.captions)
+        highlights = helper.cached(
+            "highlights",
+            highlights_service.PROMPT_VERSION,
+            ConversationHighlights,
+            lambda: highlights_service.get_highlights(helper.captions, helper.context),
+        )
+        highlights = highlights_service.snap(highlights, helper.timeline)
         helper.analysis.highlights_dump = highlights.model_dump_json()
         helper.update_analysis()
 
@@ -96,7 +188,12 @@ def generate_highlights(conversation_id: str) -> None:
 def generate_insights(conversation_id: str) -> None:
     with Helper(conversation_id) as helper:
         insights_service = get_conversation_insight_service()
-        insights = insights_service.get_insights(helper.captions)
+        insights = helper.cached(
+            "insights",
+            insights_service.PROMPT_VERSION,
+            ConversationInsight,
+            lambda: insights_service.get_insights(helper.captions, helper.context),
+        )
         helper.analysis.insights_dump = insights.model_dump_json()
         helper.update_analysis()
 
@@ -105,11 +202,36 @@ def generate_insights(conversation_id: str) -> None:
 def generate_breakdown(conversation_id: str) -> None:
     with Helper(conversation_id) as helper:
         breakdown_service = get_conversation_breakdown_service()
-        breakdown = breakdown_service.get_breakdown(helper.captions)
+        breakdown = helper.cached(
+            "breakdown",
+            breakdown_service.PROMPT_VERSION,
+            ConversationBreakdown,
+            lambda: breakdown_service.get_breakdown(helper.captions, helper.context),
+        )
         helper.analysis.breakdown_dump = breakdown.model_dump_json()
         helper.update_analysis()
 
 
+@task(task_run_name="generate_combined_analysis")
+def generate_combined_analysis(conversation_id: str) -> None:
+    with Helper(conversation_id) as helper:
+        combined_service = get_conversation_combined_service()
+        analysis = helper.cached(
+            "analysis_combined",
+            combined_service.PROMPT_VERSION,
+            ConversationAnalysisData,
+            lambda: combined_service.get_analysis(helper.captions, helper.context),
+        )
+        helper.analysis.summary_dump = analysis.summary.model_dump_json()
+        highlights = get_conversation_highlight_service().snap(
+            analysis.highlights, helper.timeline
+        )
+        helper.analysis.highlights_dump = highlights.model_dump_json()
+        helper.analysis.insights_dump = analysis.insights.model_dump_json()
+        helper.analysis.breakdown_dump = analysis.breakdown.model_dump_json()
+        helper.update_analysis()
+
+
 @task(task_run_name="complete_analysis")
 def complete_analysis(conversation_id: str) -> None:
     with Helper(conversation_id) as helper:
@@ -124,9 +246,10 @@ def edit_profile(conversation_id: str) -> None:
             if not user:
                 user = User(id=helper.conversation.user_id)
         edit_profile_service = get_edit_profile_service()
-        update_user = edit_profile_service.edit_profile(
-            helper.captions, user.to_update_user()
-        )
+        with llm_call_labels(service="edit_profile"):
+            update_user = edit_profile_service.edit_profile(
+                helper.captions, user.to_update_user(), helper.context
+            )
         with create_db_session() as session:
             user.name = update_user.name
             user.age = update_user.age
@@ -4,32 +4,45 @@ from prefect.task_runners import ConcurrentTaskRunner
 from oto.infra.database import create_db_session
 from oto.domain.conversation import Conversation
 from oto.domain.transcript import Transcript
-from oto.domain.transcript import Captions
-from oto.domain.analysis import Topic
+from oto.domain.analysis import Topic, TopicDataList
+from oto.infra.cache import get_result_cache
+from oto.infra.ledger import llm_call_labels
+from oto.infra.vertexai import get_vertexai
 from oto.services.extract_topic import get_extract_topic_service
 from oto.domain.conversation import ProcessingStatus
 
 
 @task(task_run_name="extract_topic")
 def extract_topic(conversation_id: str) -> None:
-    with create_db_session() as session:
-        conversation = session.get(Conversation, conversation_id)
-        if not conversation:
-            raise ValueError(f"Conversation {conversation_id} not found")
-        transcript = session.get(Transcript, conversation.id)
-        if not transcript:
-            raise ValueError(f"Transcript {conversation.id} not found")
-        topic = session.exec(select(Topic).where(Topic.id == conversation_id)).first()
-        if topic:
-            return
-        captions = Captions.model_validate_json(transcript.captions_dump)
-        extract_topic_service = get_extract_topic_service()
-        topics = extract_topic_service.extract_topics(captions)
-        topic = Topic.from_topic_datas(topics)
-        topic.id = conversation_id
-        topic.user_id = conversation.user_id
-        session.add(topic)
-        session.commit()
+    with llm_call_labels(conversation_id=conversation_id):
+        with create_db_session() as session:
+            conversation = session.get(Conversation, conversation_id)
+            if not conversation:
+                raise ValueError(f"Conversation {conversation_id} not found")
+            transcript = session.get(Transcript, conversation.id)
+            if not transcript:
+                raise ValueError(f"Transcript {conversation.id} not found")
+            topic = session.exec(
+                select(Topic).where(Topic.id == conversation_id)
+            ).first()
+            if topic:
+                return
+            extract_topic_service = get_extract_topic_service()
+            topics = get_result_cache().get_or_compute_model(
+                conversation.content_hash,
+                "extract_topic",
+                extract_topic_service.PROMPT_VERSION,
+                TopicDataList,
+                lambda: extract_topic_service.extract_topics(
+                    transcript.get_captions(),
+                    get_vertexai().context_cache(conversation_id),
+                ),
+            )
+            topic = Topic.from_topic_datas(topics)
+            topic.id = conversation_id
+            topic.user_id = conversation.user_id
+            session.add(topic)
+            session.commit()
 
 
 @flow(name="extract_topic", task_runner=ConcurrentTaskRunner())
@@ -0,0 +1,80 @@
+import os
+from prefect import task, get_run_logger
+from oto.infra.cache import hash_stream
+from oto.infra.database import create_db_session
+from oto.infra.blob_cache import get_blob_cache
+from oto.domain.conversation import Conversation
+from oto.domain.timeline import format_timecodes
+from oto.environment import get_settings
+from oto.services.content import media
+
+
+@task(task_run_name="hash_conversation")
+def hash_conversation(conversation_id: str) -> None:
+    """
+    content hash of files uploaded straight to the bucket, which the api never
+    reads. the result cache is keyed by it
+    """
+    with create_db_session() as session:
+        conversation = session.get(Conversation, conversation_id)
+        if not conversation:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if conversation.content_hash:
+            return
+
+        with get_blob_cache().open(conversation.file_path) as f:
+            conversation.content_hash = hash_stream(f)
+        session.add(conversation)
+        session.commit()
+        get_run_logger().info(
+            "#️⃣ Hashed conversation %s: %s", conversation_id, conversation.content_hash
+        )
+
+
+@task(task_run_name="normalize_conversation")
+def normalize_conversation(conversation_id: str) -> None:
+    """
+    transcodes the upload once into a small mono opus file next to it, which
+    transcription, clip selection and clip cutting read instead of the
+    original. records the duration on the way
+    """
+    log = get_run_logger()
+    settings = get_settings()
+    with create_db_session() as session:
+        conversation = session.get(Conversation, conversation_id)
+        if not conversation:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if conversation.canonical_file_path or settings.canonical_bitrate_kbps <= 0:
+            return
+
+        blob_cache = get_blob_cache()
+        try:
+            with blob_cache.local_path(
+                conversation.file_path, conversation.content_hash
+            ) as path:
+                audio, duration, codec = media.to_canonical(
+                    path,
+                    settings.canonical_sample_rate,
+                    settings.canonical_bitrate_kbps,
+                )
+        except Exception as e:
+            # the original still works everywhere, only slower
+            log.warning("⚠️ Normalizing conversation %s failed: %s", conversation_id, e)
+            return
+
+        canonical_path = f"{os.path.splitext(conversation.file_path)[0]}.canonical.opus"
+        blob_cache.upload(canonical_path, audio, media.CANONICAL_MIME_TYPE)
+        conversation.canonical_file_path = canonical_path
+        conversation.canonical_mime_type = media.CANONICAL_MIME_TYPE
+        conversation.available_duration = format_timecodes(
+            [duration], milliseconds=False
+        )[0]
+        session.add(conversation)
+        session.commit()
+        log.info(
+            "🎚️ Normalized conversation %s: %s, %s -> %d KB opus",
+            conversation_id,
+            codec,
+            conversation.available_duration,
+            len(audio) // 1024,
+        )
@@ -6,21 +6,29 @@ from .analysis import (
     generate_highlights,
     generate_insights,
     generate_breakdown,
+    generate_combined_analysis,
+    create_transcript_context,
+    delete_transcript_context,
     complete_analysis,
     mark_as_failed,
     edit_profile,
 )
 from oto.tasks.content.create_clip_task import create_clip_task
 from .transcribe import transcribe_conversation
+from .ingest import hash_conversation, normalize_conversation
 from .point import give_points_to_user
 from .extract import extract_topic
 from oto.services.safety import check_conversation_limit_exceeded
+from oto.environment import get_settings
+from oto.infra.blob_cache import get_blob_cache
+
+TIMEOUT_SECONDS = 60 * 20  # 20 minutes
 
 
 @flow(
     name="process_conversation",
     task_runner=ConcurrentTaskRunner(),
-    timeout_seconds=60 * 20,  # 20 minutes
+    timeout_seconds=TIMEOUT_SECONDS,
 )
 def process_conversation_flow(conversation_id: str):
     log = get_run_logger()
@@ -29,38 +37,62 @@ def process_conversation_flow(conversation_id: str):
 
         check_conversation_limit_exceeded()
 
-        # start create clip
-        clip_task = create_clip_task.submit(conversation_id)
+        # direct uploads are hashed here, before anything looks up the cache
+        hash_conversation.submit(conversation_id).result()
+        # every stage below reads the compact rendition made here
+        normalize_conversation.submit(conversation_id).result()
+
+        # start create clip, from the audio it does not need the transcript
+        select_from_transcript = get_settings().clip_selection_mode == "transcript"
+        if not select_from_transcript:
+            clip_task = create_clip_task.submit(conversation_id)
 
         # 1. Transcribe conversation
         transcribe_conversation.submit(conversation_id).result()
 
+        if select_from_transcript:
+            clip_task = create_clip_task.submit(conversation_id)
+
         log.info("📝 Transcription complete — starting analysis")
 
         generate_empty_analysis.submit(conversation_id).result()
 
-        log.info("🔍 Analysis complete — starting summary")
+        # share the transcript with every analysis request below
+        create_transcript_context.submit(conversation_id, TIMEOUT_SECONDS).result()
 
-        # 2. Generate analysis
-        futures = [
-            generate_summary.submit(conversation_id),
-            generate_highlights.submit(conversation_id),
-            generate_insights.submit(conversation_id),
-        ]
-
-        # 3. Wait for all analysis tasks to complete
-        for f in futures:
-            f.result()
-
-        # 4. Generate analysis (2)
-        futures = [
-            generate_breakdown.submit(conversation_id),
-            edit_profile.submit(conversation_id),
-        ]
+        log.info("🔍 Analysis complete — starting summary")
 
-        # 5. Wait for all analysis tasks to complete
-        for f in futures:
-            f.result()
+        combined = False
+        if get_settings().combined_analysis:
+            # 2'. Generate all sections in one request, per-section as fallback
+            profile_future = edit_profile.submit(conversation_id)
+            try:
+                generate_combined_analysis.submit(conversation_id).result()
+                combined = True
+            except Exception as e:
+                log.warning("⚠️ Combined analysis failed, falling back: %s", e)
+            profile_future.result()
+
+        if not combined:
+            # 2. Generate analysis
+            futures = [
+                generate_summary.submit(conversation_id),
+                generate_highlights.submit(conversation_id),
+                generate_insights.submit(conversation_id),
+            ]
+
+            # 3. Wait for all analysis tasks to complete
+            for f in futures:
+                f.result()
+
+            # 4. Generate analysis (2)
+            futures = [generate_breakdown.submit(conversation_id)]
+            if not get_settings().combined_analysis:
+                futures.append(edit_profile.submit(conversation_id))
+
+            # 5. Wait for all analysis tasks to complete
+            for f in futures:
+                f.result()
 
         # 6. Give points to user
         give_points_to_user.submit(conversation_id).result()
@@ -82,3 +114,6 @@ def process_conversation_flow(conversation_id: str):
         log.exception("❌ Error processing conversation")
         mark_as_failed.submit(conversation_id)
         raise
+    finally:
+        delete_transcript_context(conversation_id)
+        log.info("💾 Source audio cache: %s", get_blob_cache().stats())
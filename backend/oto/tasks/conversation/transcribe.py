@@ -1,40 +1,71 @@
-from prefect import task
+import struct
+from prefect import task, get_run_logger
 from sqlmodel import select, func
 from oto.infra.database import create_db_session
 from oto.domain.conversation import Conversation, ProcessingStatus
-from oto.domain.transcript import Transcript
+from oto.domain.transcript import Transcript, ColumnarTranscript
+from oto.infra.cache import get_result_cache
+from oto.infra.ledger import llm_call_labels
 from oto.services.transcription_whisper import get_transcription_service
+from oto.services.transcript_compaction import get_transcript_compaction_service
 from oto.domain.point import Point, PointTransaction
 
 
+def pack_transcription(transcript: ColumnarTranscript, total_active_seconds: float):
+    return struct.pack("<d", total_active_seconds) + transcript.to_bytes()
+
+
+def unpack_transcription(data: bytes) -> tuple[ColumnarTranscript, float]:
+    (total_active_seconds,) = struct.unpack_from("<d", data)
+    return ColumnarTranscript.from_bytes(data[8:]), total_active_seconds
+
+
 @task(task_run_name="transcribe_conversation")
 def transcribe_conversation(conversation_id: str) -> None:
-    with create_db_session() as session:
-        conversation = session.get(Conversation, conversation_id)
-        if not conversation:
-            raise ValueError(f"Conversation {conversation_id} not found")
-
-        conversation.status = ProcessingStatus.PROCESSING
-        conversation.inner_status = "Transcribing conversation"
-        session.add(conversation)
-        session.commit()
-
-        transcription_service = get_transcription_service()
-        result, total_active_seconds = transcription_service.transcribe(
-            conversation.file_path, conversation.mime_type
-        )
-
-        acquired_points = round(total_active_seconds / 60 / 60 * 200, 1)
-
-        transcript = Transcript(
-            id=conversation_id,
-            user_id=conversation.user_id,
-            captions_dump=result.model_dump_json(),
-        )
-        session.add(transcript)
-
-        conversation.status = ProcessingStatus.PROCESSING
-        conversation.inner_status = "Transcription completed"
-        conversation.points = acquired_points
-        session.add(conversation)
-        session.commit()
+    log = get_run_logger()
+    with llm_call_labels(conversation_id=conversation_id):
+        with create_db_session() as session:
+            conversation = session.get(Conversation, conversation_id)
+            if not conversation:
+                raise ValueError(f"Conversation {conversation_id} not found")
+
+            conversation.status = ProcessingStatus.PROCESSING
+            conversation.inner_status = "Transcribing conversation"
+            session.add(conversation)
+            session.commit()
+
+            transcription_service = get_transcription_service()
+            cached = get_result_cache().get_or_compute(
+                conversation.content_hash,
+                "transcription",
+                transcription_service.PROMPT_VERSION,
+                lambda: pack_transcription(
+                    *transcription_service.transcribe(*conversation.audio())
+                ),
+            )
+            result, total_active_seconds = unpack_transcription(cached)
+
+            report = get_transcript_compaction_service().report(result)
+            log.info(
+                "📝 Prompt transcript: %d captions -> %d utterances, ~%d -> ~%d tokens (%.0f%% saved)",
+                report.captions,
+                report.utterances,
+                report.original_tokens,
+                report.compact_tokens,
+                report.saved_ratio * 100,
+            )
+
+            acquired_points = round(total_active_seconds / 60 / 60 * 200, 1)
+
+            transcript = Transcript(
+                id=conversation_id,
+                user_id=conversation.user_id,
+            )
+            transcript.set_columnar(result)
+            session.add(transcript)
+
+            conversation.status = ProcessingStatus.PROCESSING
+            conversation.inner_status = "Transcription completed"
+            conversation.points = acquired_points
+            session.add(conversation)
+            session.commit()